@@ -0,0 +1,157 @@
+import queue
+import threading
+import time
+
+from metrics import ALERT_ATTEMPTS, ALERT_FAILURES
+
+DISCORD_MAX_LENGTH = 2000  # Taille maximale d'un message Discord
+_STOP = object()
+
+
+class AlertDispatcher:
+    """Envoi des alertes Discord en arrière-plan.
+
+    ``send()`` ne bloque jamais la boucle du healthcheck : l'alerte est placée
+    dans une file bornée et un thread dédié la publie via une ``requests.Session``
+    (connexion réutilisée, délai d'attente borné). Les alertes arrivées en rafale
+    pendant ``coalesce_delay`` sont regroupées en un seul message, les alertes
+    identiques sont ignorées pendant ``dedup_ttl`` secondes, et un code 429 de
+    Discord déclenche une nouvelle tentative avec attente exponentielle.
+
+    ``requests`` n'est importé qu'à la première alerte, sur le thread d'envoi :
+    un pair sans alerte ne paie jamais son import au démarrage.
+    """
+
+    def __init__(self, webhook, username="MQTT Healthchecker", timeout=5, max_queue=100,
+                 coalesce_delay=1.0, dedup_ttl=300, max_retries=5, max_backoff=30):
+        self.webhook = webhook
+        self.username = username
+        self.timeout = timeout
+        self.coalesce_delay = coalesce_delay
+        self.dedup_ttl = dedup_ttl
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._recent = {}  # clé de déduplication -> instant du dernier envoi accepté
+        self._lock = threading.Lock()
+        self._session = None  # requests.Session, créée par le thread d'envoi
+        self._thread = None
+        self._attempts = ALERT_ATTEMPTS.labels(username)
+        self._failures = ALERT_FAILURES.labels(username)
+
+    def send(self, message, key=None):
+        """Met une alerte en file. Retourne False si elle est ignorée (doublon, file pleine)."""
+        if not self.webhook:
+            print("⚠️ Erreur : Webhook Discord non défini dans le fichier .env")
+            return False
+
+        key = message if key is None else key
+        now = time.monotonic()
+        with self._lock:
+            last = self._recent.get(key)
+            if last is not None and now - last < self.dedup_ttl:
+                return False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            try:
+                self._queue.put_nowait(message)
+            except queue.Full:
+                self.dropped += 1
+                print("⚠️ File d'alertes pleine, alerte ignorée.")
+                return False
+            # Clé retenue seulement une fois l'alerte en file : une alerte écartée pourra être renvoyée
+            self._recent[key] = now
+            if len(self._recent) > 1000:
+                self._recent = {k: t for k, t in self._recent.items() if now - t < self.dedup_ttl}
+        return True
+
+    def close(self, timeout=10):
+        """Envoie les alertes en attente puis arrête le thread d'envoi."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._session is not None:
+            self._session.close()
+
+    def _run(self):
+        import requests
+        self._session = requests.Session()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            # Regrouper les alertes qui arrivent dans la même rafale
+            deadline = time.monotonic() + self.coalesce_delay
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            for content in self._chunks(batch):
+                self._post(content)
+
+    @staticmethod
+    def _chunks(batch):
+        """Assemble les alertes en messages qui respectent la limite de taille de Discord."""
+        content = ""
+        for message in batch:
+            message = message[:DISCORD_MAX_LENGTH]
+            if content and len(content) + 2 + len(message) > DISCORD_MAX_LENGTH:
+                yield content
+                content = ""
+            content = f"{content}\n\n{message}" if content else message
+        if content:
+            yield content
+
+    def _post(self, content):
+        import requests
+        data = {"content": content, "username": self.username}
+        for attempt in range(self.max_retries):
+            backoff = min(2 ** attempt, self.max_backoff)
+            self._attempts.inc()
+            try:
+                response = self._session.post(self.webhook, json=data, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"⚠️ Erreur lors de l'envoi sur Discord : {e}")
+                time.sleep(backoff)
+                continue
+
+            if response.status_code == 429:
+                # Discord indique l'attente dans le corps JSON, sinon dans l'en-tête Retry-After
+                try:
+                    retry_after = float(response.json().get("retry_after") or response.headers.get("Retry-After") or 0)
+                except (ValueError, AttributeError):
+                    retry_after = 0
+                time.sleep(min(max(retry_after, backoff), self.max_backoff))
+                continue
+            if response.status_code >= 500:
+                time.sleep(backoff)
+                continue
+
+            if response.status_code in (200, 204):
+                self.sent += 1
+                print("✅ Alerte envoyée sur Discord avec succès !")
+                return True
+            print(f"⚠️ Erreur lors de l'envoi sur Discord : {response.status_code} - {response.text}")
+            self.failed += 1
+            self._failures.inc()
+            return False
+
+        print("⚠️ Abandon de l'envoi sur Discord après plusieurs tentatives.")
+        self.failed += 1
+        self._failures.inc()
+        return False
@@ -0,0 +1,546 @@
+import argparse
+import heapq
+import json
+import os
+import selectors
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import paho.mqtt.client as mqtt
+
+import frame
+
+# Banc d'essai local : simule des clients de chat (comme bidirectionnal.py) et des
+# pairs de healthcheck (comme automatic.py) contre un broker local, puis mesure le
+# débit, la latence publication -> réception, le CPU et la mémoire par client.
+# Tous les clients tournent sur un seul thread (boucle paho externe + selectors).
+#
+# Avec ``--compare-transports``, la même charge (une paire IoT/VM du moteur de
+# healthcheck, même cadence, même durée) passe successivement par chaque
+# transport et les RTT, pertes et CPU sont comparés.
+#
+# Avec ``--supervisor-workers N``, les battements sont traités par le vrai
+# superviseur (``cli.py supervisor --workers N``) : en faisant varier N on mesure
+# le passage à l'échelle du superviseur réparti (sharding.py).
+#
+# Avec ``--startup``, on mesure le démarrage de l'IoT : temps d'import des
+# modules chargés avant le premier battement (processus neuf à chaque essai, en
+# vérifiant que requests, aiocoap, asyncio et http.server n'en font pas partie)
+# et délai entre le lancement de ``cli.py healthcheck --role iot`` et l'arrivée
+# de son premier battement au broker. ``--max-import-ms`` et
+# ``--max-first-heartbeat-ms`` font échouer le banc en cas de régression.
+
+CHAT_TOPIC = "bench/chat"
+HEALTHCHECK_TOPIC = "bench/healthcheck"
+SUPERVISOR_TOPIC = "iot/healthcheck"  # Topic suivi par supervisor.py / sharding.py
+CHAT_HEADER = struct.Struct("!IQ")  # index de l'expéditeur, horodatage d'envoi (ns)
+STARTUP_TOPIC = "bench/startup"
+# Modules importés par chaque chemin de démarrage de l'IoT, avant le premier battement
+STARTUP_IMPORTS = {
+    "mqtt": "cli, healthcheck, alerts, logsink",
+    "mqtt+coap": "cli, healthcheck, alerts, logsink, coap_healthcheck",
+    "coap": "cli, coap_healthcheck, alerts, logsink",
+}
+LAZY_MODULES = ("requests", "aiocoap", "asyncio", "http.server")  # Chargés seulement quand ils servent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_broker(port):
+    """Lance minibroker.py dans un processus séparé (il ne partage pas le GIL du banc)."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "minibroker.py")
+    process = subprocess.Popen([sys.executable, script, "--port", str(port)], stdout=subprocess.PIPE, text=True)
+    process.stdout.readline()  # Attendre la ligne "en écoute"
+    return process
+
+
+def start_supervisor(host, port, workers, log_dir):
+    """Lance ``cli.py supervisor`` (``workers`` processus) et attend que chaque worker soit connecté."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+    process = subprocess.Popen(
+        [sys.executable, "-u", script, "supervisor", "--broker", host, "--port", str(port), "--workers", str(workers),
+         "--log-file", os.path.join(log_dir, "supervisor.log")],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    connected = 0
+    while connected < workers:
+        line = process.stdout.readline()
+        if not line:
+            raise RuntimeError("Le superviseur s'est arrêté au démarrage.")
+        connected += "connecté" in line
+    return process
+
+
+def process_cpu_seconds(pid):
+    """Temps CPU (utilisateur + système) d'un autre processus, sous Linux uniquement."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class ClientPool:
+    """Pilote de nombreux clients paho sur un seul thread via ``selectors``."""
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.clients = []
+        self.ready = 0  # Clients connectés et abonnés
+
+    def add(self, client_id, on_message, subscription):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        client.on_socket_open = lambda c, userdata, sock: self.selector.register(sock, selectors.EVENT_READ, c)
+        client.on_socket_close = lambda c, userdata, sock: self.selector.unregister(sock)
+        client.on_socket_register_write = lambda c, userdata, sock: self.selector.modify(
+            sock, selectors.EVENT_READ | selectors.EVENT_WRITE, c)
+        client.on_socket_unregister_write = lambda c, userdata, sock: self.selector.modify(
+            sock, selectors.EVENT_READ, c)
+        client.on_connect = lambda c, userdata, flags, rc, properties=None: c.subscribe(subscription)
+        client.on_subscribe = self._on_subscribe
+        client.on_message = on_message
+        self.clients.append(client)
+        return client
+
+    def _on_subscribe(self, client, userdata, mid, reason_codes, properties=None):
+        self.ready += 1
+
+    def connect_all(self, host, port):
+        for client in self.clients:
+            client.connect(host, port, 60)
+
+    def poll(self, timeout):
+        for key, mask in self.selector.select(timeout):
+            client = key.data
+            if mask & selectors.EVENT_READ:
+                client.loop_read(max_packets=1000)
+            if mask & selectors.EVENT_WRITE:
+                client.loop_write()
+
+    def misc(self):
+        for client in self.clients:
+            client.loop_misc()
+
+
+class Benchmark:
+    def __init__(self, chat_clients, healthcheck_peers, rate, payload_size, qos, external_vm=False):
+        self.rate = rate
+        self.qos = qos
+        self.payload_size = payload_size
+        self.pool = ClientPool()
+        self.senders = []  # (client, fonction qui construit la charge, topic)
+        self.received = 0
+        self.chat_latencies = []
+        self.rtt_latencies = []
+        self.measuring = False
+
+        padding = b"x" * max(payload_size - CHAT_HEADER.size, 0)
+        for index in range(chat_clients):
+            client = self.pool.add(f"bench-chat-{index}", self._chat_message(index), CHAT_TOPIC)
+            self.senders.append((client, lambda i=index: CHAT_HEADER.pack(i, time.perf_counter_ns()) + padding, CHAT_TOPIC))
+
+        root = SUPERVISOR_TOPIC if external_vm else HEALTHCHECK_TOPIC
+        if healthcheck_peers and not external_vm:
+            # Une VM unique répond à tous les appareils, comme supervisor.py
+            self.pool.add("bench-vm", self._vm_message, f"{HEALTHCHECK_TOPIC}/+")
+        for index in range(healthcheck_peers):
+            topic = f"{root}/bench-dev{index}" if external_vm else f"{root}/dev{index}"
+            client = self.pool.add(f"bench-iot-{index}", self._iot_message, topic)
+            self.senders.append((client, self._heartbeat_factory(), topic))
+
+    @staticmethod
+    def _heartbeat_factory():
+        sequence = iter(range(1, 2 ** 63))
+        return lambda: frame.encode("iot", next(sequence), time.perf_counter_ns())
+
+    def _chat_message(self, index):
+        def on_message(client, userdata, msg):
+            sender, sent_ns = CHAT_HEADER.unpack_from(msg.payload)
+            if sender == index or not self.measuring:
+                return  # Comme bidirectionnal.py, on ignore ses propres messages
+            self.received += 1
+            self.chat_latencies.append(time.perf_counter_ns() - sent_ns)
+        return on_message
+
+    def _vm_message(self, client, userdata, msg):
+        heartbeat = frame.decode(msg.payload)
+        if heartbeat is None or heartbeat.sender != "iot":
+            return
+        if self.measuring:
+            self.received += 1
+        client.publish(msg.topic, frame.encode("vm", heartbeat.seq, echo_ns=heartbeat.timestamp_ns), self.qos)
+
+    def _iot_message(self, client, userdata, msg):
+        heartbeat = frame.decode(msg.payload)
+        if heartbeat is None or heartbeat.sender != "vm" or not self.measuring:
+            return
+        self.received += 1
+        self.rtt_latencies.append(time.perf_counter_ns() - heartbeat.echo_ns)
+
+    def run(self, host, port, duration, broker_pid=None):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        self.pool.connect_all(host, port)
+        deadline = time.monotonic() + 30
+        while self.pool.ready < len(self.pool.clients):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Les clients n'ont pas pu se connecter au broker.")
+            self.pool.poll(0.05)
+        memory = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        # Publications étalées : chaque émetteur a sa propre échéance dans un tas
+        interval = 1 / self.rate
+        start = time.monotonic()
+        queue = [(start + interval * index / max(len(self.senders), 1), index) for index in range(len(self.senders))]
+        heapq.heapify(queue)
+        cpu_start = time.process_time()
+        broker_cpu_start = process_cpu_seconds(broker_pid) if broker_pid else None
+        published = 0
+        self.measuring = True
+        end = start + duration
+        next_misc = start + 1
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                break
+            while queue and queue[0][0] <= now:
+                due, index = heapq.heappop(queue)
+                client, build, topic = self.senders[index]
+                client.publish(topic, build(), self.qos)
+                published += 1
+                heapq.heappush(queue, (due + interval, index))
+            if now >= next_misc:
+                self.pool.misc()
+                next_misc = now + 1
+            timeout = min(queue[0][0] - now, 0.01) if queue else 0.01
+            self.pool.poll(max(timeout, 0))
+        self.measuring = False
+        elapsed = time.monotonic() - start
+        cpu = time.process_time() - cpu_start
+        broker_cpu = None
+        if broker_cpu_start is not None:
+            broker_cpu = process_cpu_seconds(broker_pid) - broker_cpu_start
+
+        for client in self.pool.clients:
+            client.disconnect()
+        self.pool.poll(0.1)
+        return self.report(published, elapsed, cpu, broker_cpu, memory)
+
+    def report(self, published, elapsed, cpu, broker_cpu, memory):
+        def summary(samples):
+            samples.sort()
+            return {
+                "samples": len(samples),
+                "p50_ms": percentile(samples, 0.50) / 1e6 if samples else None,
+                "p99_ms": percentile(samples, 0.99) / 1e6 if samples else None,
+                "p999_ms": percentile(samples, 0.999) / 1e6 if samples else None,
+            }
+
+        return {
+            "clients": len(self.pool.clients),
+            "duration_s": elapsed,
+            "published": published,
+            "received": self.received,
+            "published_per_s": published / elapsed,
+            "received_per_s": self.received / elapsed,
+            "chat_latency": summary(self.chat_latencies),
+            "healthcheck_rtt": summary(self.rtt_latencies),
+            "client_cpu_percent": 100 * cpu / elapsed,
+            "broker_cpu_percent": 100 * broker_cpu / elapsed if broker_cpu is not None else None,
+            "memory_per_client_kib": memory / len(self.pool.clients) / 1024 if self.pool.clients else 0,
+        }
+
+
+def transport_pair(name, host, port, run):
+    """Extrémités (IoT, VM) d'un transport du moteur, vers le broker ou le port local donné."""
+    if name == "loopback":
+        from engine import LoopbackTransport
+        return LoopbackTransport.pair()
+    if name == "mqtt":
+        from healthcheck import MqttTransport
+        topic = f"{HEALTHCHECK_TOPIC}/transport-{run}"
+        return (MqttTransport(host, port, topic, client_id=f"bench-iot-{run}", verbose=False),
+                MqttTransport(host, port, topic, client_id=f"bench-vm-{run}", verbose=False))
+    if name == "coap":
+        from coap_healthcheck import CoapTransport
+        coap_port = free_port()
+        return (CoapTransport(f"coap://127.0.0.1:{coap_port}"),
+                CoapTransport(bind=("127.0.0.1", coap_port)))
+    raise ValueError(f"Transport inconnu : {name}")
+
+
+def compare_transports(names, host, port, interval, duration):
+    """Fait tourner une paire IoT/VM sur chaque transport et retourne un résultat par transport."""
+    from engine import HealthcheckEngine
+
+    class MeasuringEngine(HealthcheckEngine):
+        """Moteur IoT qui garde chaque RTT mesuré."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.samples = []
+
+        def handle_message(self, link, heartbeat, received_time):
+            if heartbeat is not None and heartbeat.echo_ns:
+                self.samples.append(int(received_time * 1e9) - heartbeat.echo_ns)
+            super().handle_message(link, heartbeat, received_time)
+
+    results = {}
+    for run, name in enumerate(names):
+        iot_transport, vm_transport = transport_pair(name, host, port, run)
+        vm = HealthcheckEngine("vm", [vm_transport], interval=interval, verbose=False)
+        iot = MeasuringEngine("iot", [iot_transport], interval=interval, verbose=False)
+        threads = [threading.Thread(target=engine.run, daemon=True) for engine in (vm, iot)]
+        cpu_start = time.process_time()
+        threads[0].start()
+        time.sleep(0.5)  # Serveur de la VM prêt avant le premier battement
+        threads[1].start()
+        time.sleep(duration)
+        for engine in (iot, vm):
+            engine.scheduler.call_soon_threadsafe(engine.stop)
+        for thread in threads:
+            thread.join(5)
+        cpu = time.process_time() - cpu_start
+
+        samples = sorted(iot.samples)
+        results[name] = {
+            "sent": iot.sequence,
+            "received": len(samples),
+            "lost": iot.sequence - len(samples),
+            "peer_down": iot.peer_down,  # Alerte en cours à la fin de la mesure
+            "p50_ms": percentile(samples, 0.50) / 1e6 if samples else None,
+            "p99_ms": percentile(samples, 0.99) / 1e6 if samples else None,
+            "max_ms": samples[-1] / 1e6 if samples else None,
+            "cpu_percent": 100 * cpu / (duration + 0.5),
+        }
+    return results
+
+
+def measure_imports(runs):
+    """Temps d'import médian de chaque chemin de démarrage, dans un processus neuf à chaque essai.
+
+    Retourne {chemin: {"median_ms", "max_ms", "modules", "eager"}} ; ``eager`` liste
+    les modules de ``LAZY_MODULES`` importés alors qu'ils ne devraient pas l'être.
+    """
+    package = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, modules in STARTUP_IMPORTS.items():
+        code = (f"import sys, time\nstart = time.perf_counter()\nimport {modules}\n"
+                f"print(time.perf_counter() - start)\nprint(' '.join(sys.modules))")
+        timings = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, "-c", code], cwd=package, capture_output=True, text=True,
+                                    check=True).stdout.splitlines()
+            timings.append(float(output[0]) * 1e3)
+            loaded = set(output[1].split())
+        timings.sort()
+        results[name] = {"median_ms": timings[len(timings) // 2], "max_ms": timings[-1], "modules": len(loaded),
+                         "eager": [module for module in LAZY_MODULES if module in loaded]}
+    return results
+
+
+def measure_first_heartbeat(host, port, runs):
+    """Délai entre le lancement de l'IoT (``cli.py healthcheck``) et son premier battement au broker.
+
+    Interpréteur, imports, connexion et premier envoi compris ; avec ``mqtt+coap``
+    le lien CoAP redondant pointe vers un port sans serveur et ne doit pas retarder le lien MQTT.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+    arrivals = {}
+    arrived = threading.Condition()
+
+    def on_message(client, userdata, msg):
+        heartbeat = frame.decode(msg.payload)
+        if heartbeat is not None and heartbeat.sender == "iot":
+            with arrived:
+                arrivals.setdefault(msg.topic, time.monotonic())
+                arrived.notify_all()
+
+    observer = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="bench-startup")
+    observer.on_message = on_message
+    observer.connect(host, port)
+    observer.subscribe(f"{STARTUP_TOPIC}/+")
+    observer.loop_start()
+    time.sleep(0.2)  # Abonnement en place avant le premier lancement
+    log_dir = tempfile.mkdtemp(prefix="bench-startup-")
+    results = {}
+    try:
+        for name in ("mqtt", "mqtt+coap"):
+            options = ["--redundant-coap", "--coap-server", f"coap://127.0.0.1:{free_port()}"] if name == "mqtt+coap" else []
+            timings = []
+            for run in range(runs):
+                device_id = f"{name.replace('+', '-')}-{run}"
+                topic = f"{STARTUP_TOPIC}/{device_id}"
+                start = time.monotonic()
+                process = subprocess.Popen(
+                    [sys.executable, script, "healthcheck", "--role", "iot", "--broker", host, "--port", str(port),
+                     "--topic", STARTUP_TOPIC, "--device-id", device_id, "--interval", "60", "--webhook", "",
+                     "--log-file", os.path.join(log_dir, f"{device_id}.log"), *options],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                )
+                with arrived:
+                    arrived.wait_for(lambda: topic in arrivals, timeout=10)
+                process.terminate()
+                process.wait()
+                if topic in arrivals:
+                    timings.append((arrivals[topic] - start) * 1e3)
+            timings.sort()
+            results[name] = {"runs": runs, "received": len(timings),
+                             "median_ms": timings[len(timings) // 2] if timings else None,
+                             "max_ms": timings[-1] if timings else None}
+    finally:
+        observer.loop_stop()
+        observer.disconnect()
+        shutil.rmtree(log_dir, ignore_errors=True)
+    return results
+
+
+def print_startup(result):
+    for name, stats in result["imports"].items():
+        eager = f"  ⚠️ chargés trop tôt : {', '.join(stats['eager'])}" if stats["eager"] else ""
+        print(f"📦 Imports {name:<10} médiane {stats['median_ms']:.1f} ms, max {stats['max_ms']:.1f} ms "
+              f"({stats['modules']} modules){eager}")
+    for name, stats in result["first_heartbeat"].items():
+        if stats["received"]:
+            print(f"💓 Premier battement {name:<10} médiane {stats['median_ms']:.0f} ms, max {stats['max_ms']:.0f} ms "
+                  f"({stats['received']}/{stats['runs']} lancements)")
+        else:
+            print(f"💓 Premier battement {name:<10} jamais reçu")
+
+
+def startup_regressions(result, max_import_ms=None, max_first_heartbeat_ms=None):
+    """Écarts aux seuils de démarrage, un message par écart (liste vide : pas de régression)."""
+    problems = []
+    for name, stats in result["imports"].items():
+        if stats["eager"]:
+            problems.append(f"imports {name} : {', '.join(stats['eager'])} chargés avant le premier battement")
+        if max_import_ms is not None and stats["median_ms"] > max_import_ms:
+            problems.append(f"imports {name} : {stats['median_ms']:.1f} ms > {max_import_ms:g} ms")
+    for name, stats in result["first_heartbeat"].items():
+        if stats["received"] < stats["runs"]:
+            problems.append(f"premier battement {name} : {stats['runs'] - stats['received']} lancement(s) sans battement")
+        elif max_first_heartbeat_ms is not None and stats["median_ms"] > max_first_heartbeat_ms:
+            problems.append(f"premier battement {name} : {stats['median_ms']:.0f} ms > {max_first_heartbeat_ms:g} ms")
+    return problems
+
+
+def print_transports(results):
+    for name, result in results.items():
+        latency = (f"p50 {result['p50_ms']:.3f} ms, p99 {result['p99_ms']:.3f} ms, max {result['max_ms']:.3f} ms"
+                   if result["received"] else "aucune réponse")
+        print(f"🔌 {name:<8} 📤 {result['sent']} 📩 {result['received']} (perdus : {result['lost']})  "
+              f"📊 RTT {latency}  🧮 CPU {result['cpu_percent']:.1f} %")
+
+
+def print_report(result):
+    print(f"👥 Clients : {result['clients']}  ⏱️ Durée : {result['duration_s']:.1f} s")
+    print(f"📤 Publiés : {result['published']} ({result['published_per_s']:.0f}/s)")
+    print(f"📩 Reçus : {result['received']} ({result['received_per_s']:.0f}/s)")
+    for name, label in (("chat_latency", "Latence chat"), ("healthcheck_rtt", "RTT healthcheck")):
+        stats = result[name]
+        if stats["samples"]:
+            print(f"📊 {label} : p50 {stats['p50_ms']:.3f} ms, p99 {stats['p99_ms']:.3f} ms, "
+                  f"p999 {stats['p999_ms']:.3f} ms ({stats['samples']} mesures)")
+    print(f"🧮 CPU clients : {result['client_cpu_percent']:.1f} %", end="")
+    if result["broker_cpu_percent"] is not None:
+        print(f", CPU broker : {result['broker_cpu_percent']:.1f} %", end="")
+    print()
+    print(f"💾 Mémoire par client : {result['memory_per_client_kib']:.1f} Kio")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai débit/latence du chat et du healthcheck MQTT.")
+    parser.add_argument("--broker", help="host:port d'un broker existant (ex. mosquitto local) ; "
+                                         "par défaut un minibroker.py est lancé")
+    parser.add_argument("--chat-clients", type=int, default=10)
+    parser.add_argument("--healthcheck-peers", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=10, help="messages/s par client émetteur")
+    parser.add_argument("--payload-size", type=int, default=64, help="taille des messages de chat (octets)")
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=0)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--json", help="écrit les résultats dans ce fichier (comparaison avant/après)")
+    parser.add_argument("--compare-transports", metavar="LISTE",
+                        help="compare les transports du moteur (ex. loopback,mqtt,coap) sur la même paire IoT/VM")
+    parser.add_argument("--interval", type=float, default=0.1, help="cadence des battements avec --compare-transports")
+    parser.add_argument("--supervisor-workers", type=int, default=0,
+                        help="les battements sont traités par cli.py supervisor --workers N au lieu du client VM du banc")
+    parser.add_argument("--startup", action="store_true", help="temps d'import et délai jusqu'au premier battement de l'IoT")
+    parser.add_argument("--startup-runs", type=int, default=10, help="lancements par mesure avec --startup")
+    parser.add_argument("--max-import-ms", type=float, help="avec --startup : échec si l'import médian dépasse ce seuil")
+    parser.add_argument("--max-first-heartbeat-ms", type=float,
+                        help="avec --startup : échec si le premier battement médian arrive après ce seuil")
+    args = parser.parse_args(argv)
+
+    broker_process = None
+    if args.broker:
+        host, _, port = args.broker.partition(":")
+        port = int(port or 1883)
+    else:
+        host, port = "127.0.0.1", free_port()
+        broker_process = start_local_broker(port)
+
+    supervisor_process = None
+    log_dir = tempfile.mkdtemp(prefix="bench-supervisor-") if args.supervisor_workers else None
+    try:
+        if args.supervisor_workers:
+            supervisor_process = start_supervisor(host, port, args.supervisor_workers, log_dir)
+        if args.startup:
+            result = {"imports": measure_imports(args.startup_runs),
+                      "first_heartbeat": measure_first_heartbeat(host, port, args.startup_runs)}
+        elif args.compare_transports:
+            names = [name.strip() for name in args.compare_transports.split(",") if name.strip()]
+            result = {"transports": compare_transports(names, host, port, args.interval, args.duration)}
+        else:
+            benchmark = Benchmark(args.chat_clients, args.healthcheck_peers, args.rate, args.payload_size, args.qos,
+                                  external_vm=bool(args.supervisor_workers))
+            result = benchmark.run(host, port, args.duration, broker_process.pid if broker_process else None)
+    finally:
+        if supervisor_process:
+            supervisor_process.terminate()
+            supervisor_process.wait()
+            shutil.rmtree(log_dir, ignore_errors=True)
+        if broker_process:
+            broker_process.terminate()
+            broker_process.wait()
+
+    result["config"] = vars(args)
+    if args.startup:
+        print_startup(result)
+    elif args.compare_transports:
+        print_transports(result["transports"])
+    else:
+        print_report(result)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(result, output, indent=2)
+    if args.startup:
+        problems = startup_regressions(result, args.max_import_ms, args.max_first_heartbeat_ms)
+        for problem in problems:
+            print(f"❌ Régression : {problem}")
+        if problems:
+            raise SystemExit(1)
+    return result
+
+
+if __name__ == "__main__":
+    main()
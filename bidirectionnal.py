@@ -1,42 +1,9 @@
-import paho.mqtt.client as mqtt
-import threading
+import sys
 
-# Configuration
-BROKER = "20.107.241.46"  # IP de la VM Azure
-TOPIC_SEND = "iot/chat"  # Topic unique pour tout le monde
-TOPIC_RECEIVE = "iot/chat"  # On écoute et envoie sur le même topic
+import cli
 
-# Demander un pseudo pour identifier les messages
-username = input("Entrez votre pseudo : ")
+# Chat MQTT en ligne de commande (logique dans chat.ChatClient).
+# Les options de cli.py s'appliquent : python bidirectionnal.py --username alice
 
-def on_connect(client, userdata, flags, rc, properties=None):
-    """Gère la connexion au broker MQTT."""
-    if rc == 0:
-        print("✅ Connecté au broker MQTT !")
-        client.subscribe(TOPIC_RECEIVE)  # S'abonner au topic général
-    else:
-        print(f"⚠️ Erreur de connexion, code {rc}")
-
-def on_message(client, userdata, msg):
-    """Affiche les messages reçus, sauf ceux envoyés par soi-même."""
-    decoded_msg = msg.payload.decode()
-    if not decoded_msg.startswith(f"[{username}]"):  # Éviter de réafficher ses propres messages
-        print(f"\n📩 {decoded_msg}\n> ", end="")
-
-# Configuration du client MQTT
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)  # Correction de l’alerte de version
-client.on_connect = on_connect
-client.on_message = on_message
-
-# Connexion au broker
-client.connect(BROKER, 1883, 60)
-
-# Lancer la réception des messages en parallèle
-threading.Thread(target=client.loop_forever, daemon=True).start()
-
-# Boucle principale pour envoyer des messages
-while True:
-    message = input("> ")
-    if message.strip():  # Éviter d'envoyer des messages vides
-        full_message = f"[{username}] {message}"
-        client.publish(TOPIC_SEND, full_message)
+if __name__ == "__main__":
+    cli.main(["chat"] + sys.argv[1:])
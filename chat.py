@@ -0,0 +1,177 @@
+import json
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from chathistory import HISTORY_TOPIC
+from connection import MqttConnection, default_client_id
+
+# Configuration par défaut
+BROKER = "20.107.241.46"  # IP de la VM Azure
+PORT = 1883
+TOPIC = "iot/chat"  # Racine des salons : un salon = un topic iot/chat/<salon>
+ROOM = "general"
+
+
+class ChatClient:
+    """Client du chat MQTT, organisé en salons (``<topic>/<salon>``).
+
+    En MQTT 5, le pseudo voyage dans une propriété utilisateur et l'abonnement
+    ``no_local`` demande au broker de ne pas renvoyer ses propres messages : ni
+    bande passante gaspillée, ni filtrage côté client. En MQTT 3.1.1 on retombe
+    sur l'ancien format (``[pseudo] message`` dans la charge, filtré à la
+    réception).
+
+    ``on_chat(message)`` est appelé pour chaque message reçu d'un autre
+    utilisateur ; par défaut il est affiché dans le terminal. Sans ``rooms``, le
+    client écoute tous les salons (``<topic>/#``, qui couvre aussi l'ancien topic
+    unique). Comme pour ``HealthcheckPeer``, rien n'est connecté avant ``start()``.
+
+    Avec ``replay=N`` (MQTT 5), les N derniers messages sont demandés à
+    l'archiveur (``chathistory.ChatArchiver``) à la première connexion.
+    """
+
+    def __init__(self, username, broker=BROKER, port=PORT, topic=TOPIC, on_chat=None,
+                 login=None, password=None, tls=False, ca_certs=None, tls13_only=False, protocol="5", qos=1,
+                 room=ROOM, rooms=None, replay=0):
+        if not username:
+            raise ValueError("Pseudo vide.")
+        if qos not in (0, 1, 2):
+            raise ValueError("QoS invalide : 0, 1 ou 2.")
+        self.username = username
+        self.broker = broker
+        self.port = port
+        self.topic = topic.rstrip("/")
+        self.on_chat = on_chat or self._print_message
+        self.login = login
+        self.password = password
+        self.tls = tls
+        self.ca_certs = ca_certs
+        self.tls13_only = tls13_only
+        self.protocol = protocol
+        self.qos = qos  # QoS 1 : le broker garde les messages pendant une coupure (session persistante)
+        self.room_topic(room)
+        self.room = room  # Salon où partent les messages envoyés
+        self.rooms = rooms  # Salons écoutés, tous si None
+        self.replay = replay if protocol == "5" else 0  # Requête/réponse MQTT 5 uniquement
+        self.connection = None
+        self._reply_topic = None
+        self._properties = None
+        if protocol == "5":
+            # Construites une fois : chaque envoi réutilise les mêmes propriétés
+            self._properties = Properties(PacketTypes.PUBLISH)
+            self._properties.UserProperty = ("username", username)
+            self._properties.ContentType = "text/plain; charset=utf-8"
+
+    @staticmethod
+    def _print_message(message):
+        print(f"\n📩 {message}\n> ", end="")
+
+    def room_topic(self, room):
+        if not room or any(char in room for char in "+#/"):
+            raise ValueError(f"Nom de salon invalide : {room!r}")
+        return f"{self.topic}/{room}"
+
+    def start(self):
+        self.connection = MqttConnection(
+            default_client_id(f"chat-{self.username}"), self.broker, self.port, username=self.login,
+            password=self.password, tls=self.tls, ca_certs=self.ca_certs, tls13_only=self.tls13_only,
+            protocol=self.protocol,
+            on_connect=self.on_connect, on_message=self.on_message,
+        )
+        filters = [self.room_topic(room) for room in self.rooms] if self.rooms else [f"{self.topic}/#"]
+        for topic_filter in filters:
+            self.connection.subscribe(topic_filter, self.qos, no_local=True)
+        if self.replay:
+            # Abonné avant la requête : le broker traite SUBSCRIBE avant le PUBLISH qui suit
+            self._reply_topic = f"{HISTORY_TOPIC}/reply/{self.connection.client_id}"
+            self.connection.subscribe(self._reply_topic, 1)
+        self.connection.start()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    def on_connect(self, connection, session_present, reconnect):
+        """Gère la connexion (et les reconnexions) au broker MQTT."""
+        print("🔁 Reconnecté au broker MQTT !" if reconnect else "✅ Connecté au broker MQTT !")
+        if self.replay and not reconnect:
+            self.request_history(self.replay)
+
+    def request_history(self, last, room=None):
+        """Demande à l'archiveur les ``last`` derniers messages (d'un salon ou de tous)."""
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.ResponseTopic = self._reply_topic
+        request = {"last": last} if room is None else {"last": last, "room": room}
+        if self.rooms and room is None and len(self.rooms) == 1:
+            request["room"] = self.rooms[0]
+        self.connection.publish(f"{HISTORY_TOPIC}/request", json.dumps(request), 1, properties=properties)
+
+    def on_message(self, client, userdata, msg):
+        """Transmet les messages reçus des autres utilisateurs, préfixés par leur salon."""
+        if msg.topic == self._reply_topic:
+            self.on_history(msg)
+            return
+        text = msg.payload.decode("utf-8", "replace")
+        sender = None
+        properties = getattr(msg, "properties", None)
+        for name, value in getattr(properties, "UserProperty", ()):
+            if name == "username":
+                sender = value
+        if sender is None:
+            # Ancien format (client 3.1.1) : pseudo dans la charge
+            if text.startswith(f"[{self.username}]"):  # Pas de no_local en 3.1.1
+                return
+            message = text
+        elif sender == self.username:
+            return  # Même pseudo depuis une autre session
+        else:
+            message = f"[{sender}] {text}"
+        room = msg.topic[len(self.topic) + 1:]
+        self.on_chat(f"#{room} {message}" if room else message)
+
+    def on_history(self, msg):
+        """Message rejoué par l'archiveur ; un message vide marque la fin du rejeu."""
+        properties = dict(getattr(msg.properties, "UserProperty", None) or ())
+        if not msg.payload:
+            error = properties.get("error")
+            self.on_chat(f"⚠️ Historique refusé : {error}" if error else "🕘 Fin de l'historique.")
+            return
+        room, sender = properties.get("room", ""), properties.get("username")
+        text = msg.payload.decode("utf-8", "replace")
+        self.on_chat(f"🕘 #{room} [{sender}] {text}" if sender else f"🕘 #{room} {text}")
+
+    def send(self, message, room=None):
+        """Publie un message (mis en file pendant une coupure) ; les messages vides sont ignorés."""
+        if not message.strip():
+            return None
+        topic = self.room_topic(room or self.room)
+        if self._properties is None:
+            return self.connection.publish(topic, f"[{self.username}] {message}", self.qos)
+        return self.connection.publish(topic, message, self.qos, properties=self._properties)
+
+    def run_interactive(self):
+        """Boucle principale : lit les messages à envoyer sur l'entrée standard.
+
+        ``/salon <nom>`` change le salon où partent les messages suivants.
+        """
+        self.start()
+        print(f"💬 Salon #{self.room} (/salon <nom> pour changer)")
+        try:
+            while True:
+                line = input("> ")
+                if line.startswith("/salon "):
+                    room = line.split(None, 1)[1].strip()
+                    try:
+                        self.room_topic(room)
+                    except ValueError as e:
+                        print(f"⚠️ {e}")
+                        continue
+                    self.room = room
+                    print(f"💬 Salon #{self.room}")
+                    continue
+                self.send(line)
+        except (EOFError, KeyboardInterrupt):
+            pass
+        finally:
+            self.close()
@@ -0,0 +1,213 @@
+import json
+import sqlite3
+import threading
+import time
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+# Historique du chat : base SQLite en mode WAL, en ajout seul. Un archiveur
+# (``ChatArchiver``) écoute tous les salons et enregistre chaque message ; un
+# client qui rejoint le chat demande les N derniers messages (ou ceux depuis T)
+# par une requête MQTT 5 (ResponseTopic + CorrelationData) et les reçoit un par
+# un, sans que l'archiveur charge l'historique entier en mémoire.
+#
+# Les écritures sont regroupées en transactions (``batch_size`` messages ou
+# ``flush_interval`` secondes) : une validation par message limiterait le débit
+# à quelques centaines de messages/s, bien en dessous du banc d'essai.
+
+HISTORY_TOPIC = "iot/chat-history"  # Requêtes sur <HISTORY_TOPIC>/request
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    room TEXT NOT NULL,
+    sender TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_room_ts ON messages (room, ts);
+CREATE INDEX IF NOT EXISTS messages_sender_ts ON messages (sender, ts);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts);
+"""
+
+
+class ChatHistory:
+    """Stockage des messages du chat ; ``append()`` depuis un seul thread écrivain."""
+
+    def __init__(self, path, batch_size=500, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._db = self._open()
+        self._db.executescript(SCHEMA)
+        self._pending = []
+        self._oldest = None  # Instant du plus ancien message en attente d'écriture
+        self._lock = threading.Lock()
+
+    def _open(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")  # Lecteurs et écrivain ne se bloquent pas
+        db.execute("PRAGMA synchronous=NORMAL")  # Pas de fsync par transaction en WAL
+        return db
+
+    def append(self, room, sender, body, ts=None):
+        """Ajoute un message ; il est écrit au plus tard ``flush_interval`` s après."""
+        now = time.time()
+        with self._lock:
+            self._pending.append((now if ts is None else ts, room, sender, body))
+            if self._oldest is None:
+                self._oldest = now
+            if len(self._pending) >= self.batch_size or now - self._oldest >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        """Écrit les messages en attente (à appeler régulièrement et avant de fermer)."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        with self._db:  # Une transaction pour tout le lot
+            self._db.executemany("INSERT INTO messages (ts, room, sender, body) VALUES (?, ?, ?, ?)", self._pending)
+        self._pending.clear()
+        self._oldest = None
+
+    def replay(self, room=None, sender=None, since=None, last=None, chunk=256):
+        """Itère sur les messages (ts, room, sender, body), du plus ancien au plus récent.
+
+        ``last`` : seulement les N derniers (après les autres filtres). La lecture
+        se fait par paquets de ``chunk`` lignes, sur une connexion à part : un
+        long rejeu ne bloque pas les écritures.
+        """
+        self.flush()
+        clauses, params = [], []
+        for column, value in (("room", room), ("sender", sender)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = f"SELECT id, ts, room, sender, body FROM messages {where}"
+        if last is not None:
+            query = f"SELECT * FROM ({query} ORDER BY ts DESC, id DESC LIMIT ?)"
+            params.append(last)
+        query += " ORDER BY ts, id"
+
+        db = self._open()
+        try:
+            cursor = db.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk)
+                if not rows:
+                    return
+                for _, ts, row_room, row_sender, body in rows:
+                    yield ts, row_room, row_sender, body
+        finally:
+            db.close()
+
+    def count(self):
+        self.flush()
+        return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+
+def parse_message(topic, payload, properties, root):
+    """Retourne (salon, pseudo, texte) d'un message de chat, ancien format compris."""
+    text = payload.decode("utf-8", "replace")
+    sender = None
+    for name, value in getattr(properties, "UserProperty", None) or ():
+        if name == "username":
+            sender = value
+    if sender is None and text.startswith("[") and "] " in text:
+        sender, text = text[1:].split("] ", 1)
+    return topic[len(root) + 1:], sender, text
+
+
+class ChatArchiver:
+    """Enregistre tous les salons de ``topic`` et répond aux demandes de rejeu.
+
+    Requête : JSON ``{"room": ..., "sender": ..., "since": T, "last": N}`` publié
+    sur ``<HISTORY_TOPIC>/request`` avec une propriété ResponseTopic. Chaque
+    message est renvoyé sur ce topic (pseudo et instant en propriétés
+    utilisateur, même CorrelationData que la requête), puis un message vide
+    marque la fin du rejeu. ``last`` est ramené entre 0 et ``max_replay`` ; une
+    requête invalide reçoit seulement ce message de fin, avec une propriété
+    utilisateur ``error``.
+    """
+
+    def __init__(self, connection, history, topic="iot/chat", max_replay=1000):
+        self.connection = connection
+        self.history = history
+        self.topic = topic.rstrip("/")
+        self.max_replay = max_replay
+        connection.on_message = self.on_message
+        connection.subscribe(f"{self.topic}/#", 1)
+        connection.subscribe(f"{HISTORY_TOPIC}/request", 1)
+
+    def on_message(self, client, userdata, msg):
+        if msg.topic == f"{HISTORY_TOPIC}/request":
+            self.answer(msg)
+            return
+        self.history.append(*parse_message(msg.topic, msg.payload, getattr(msg, "properties", None), self.topic))
+
+    def parse_request(self, payload):
+        """Arguments de ``ChatHistory.replay`` d'une requête ; ValueError si elle est invalide."""
+        try:
+            request = json.loads(payload or b"{}")
+        except ValueError:
+            raise ValueError("JSON invalide") from None
+        if not isinstance(request, dict):
+            raise ValueError("objet JSON attendu")
+        last = request.get("last", self.max_replay)
+        if not isinstance(last, int) or isinstance(last, bool):
+            raise ValueError(f"'last' doit être un entier : {last!r}")
+        since = request.get("since")
+        if since is not None and (not isinstance(since, (int, float)) or isinstance(since, bool)):
+            raise ValueError(f"'since' doit être un instant en secondes : {since!r}")
+        for name in ("room", "sender"):
+            if request.get(name) is not None and not isinstance(request[name], str):
+                raise ValueError(f"'{name}' doit être une chaîne : {request[name]!r}")
+        # Borné des deux côtés : LIMIT -1 signifierait « tout l'historique » pour SQLite
+        return {"room": request.get("room"), "sender": request.get("sender"), "since": since,
+                "last": max(0, min(last, self.max_replay))}
+
+    def answer(self, msg):
+        request_properties = getattr(msg, "properties", None)
+        response_topic = getattr(request_properties, "ResponseTopic", None)
+        if not response_topic:
+            return  # Pas de ResponseTopic : requête d'un client MQTT 3.1.1, ignorée
+        correlation = getattr(request_properties, "CorrelationData", None)
+        end = Properties(PacketTypes.PUBLISH)
+        if correlation is not None:
+            end.CorrelationData = correlation
+        try:
+            query = self.parse_request(msg.payload)
+        except ValueError as e:
+            print(f"⚠️ Requête d'historique invalide : {e}")
+            end.UserProperty = [("error", str(e))]
+            self.connection.publish(response_topic, b"", 1, properties=end)
+            return
+        for ts, room, sender, body in self.history.replay(**query):
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.UserProperty = [("room", room), ("username", sender or ""), ("ts", repr(ts))]
+            if correlation is not None:
+                properties.CorrelationData = correlation
+            self.connection.publish(response_topic, body, 1, properties=properties)
+        self.connection.publish(response_topic, b"", 1, properties=end)
+
+    def run(self, tick=0.5):
+        """Boucle de l'archiveur : réseau et écriture périodique des messages en attente."""
+        self.connection.connect()
+        try:
+            while True:
+                self.connection.loop(tick)
+                self.history.flush()
+        finally:
+            self.history.close()
+            self.connection.close()
@@ -0,0 +1,421 @@
+import argparse
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+# Point d'entrée unique : chaque option peut aussi venir de l'environnement (ou du
+# fichier .env), ce qui permet de lancer les scripts sans interaction. Sans rôle ni
+# pseudo, on retombe sur l'ancienne question posée dans le terminal.
+#
+#   python cli.py healthcheck --role iot --broker 127.0.0.1 --interval 5
+#   python cli.py healthcheck --role vm --tls --port 8883 --ca-certs ca.pem
+#   python cli.py healthcheck --role iot --redundant-coap --coap-server coap://20.107.241.46:5683
+#   python cli.py chat --username alice --replay 50
+#   python cli.py chat-archive --db chat_history.db
+#   python cli.py coap --role vm
+#   python cli.py coap-watch --device capteur-1
+#   python cli.py coap-batch --devices 500 --interval 60
+#   python cli.py supervisor --interval 60
+#   python cli.py supervisor --interval 60 --workers 8
+#   python cli.py supervisor --interval 60 --segment-separator - --correlation-window 10
+#   python cli.py probe --broker localhost --port 8883 --tls --ca-certs test_ca.pem --count 10
+
+BROKER = "20.107.241.46"  # IP de la VM Azure
+
+
+def env(name, default=None, cast=str):
+    value = os.getenv(name)
+    return default if value in (None, "") else cast(value)
+
+
+def env_flag(name):
+    return os.getenv(name, "0").lower() in ("1", "true", "yes")
+
+
+def ask_role(args):
+    role = (args.role or input("Entrez votre rôle (iot/vm) : ")).strip().lower()
+    if role not in ("iot", "vm"):
+        print("Rôle invalide. Utilisez 'iot' ou 'vm'.")
+        raise SystemExit(1)
+    return role
+
+
+def make_log_writer(args):
+    from logsink import LogWriter
+    return LogWriter(args.log_file, fmt=args.log_format, max_bytes=args.log_max_bytes, compress=args.log_compress)
+
+
+def make_alerts(args, username):
+    from alerts import AlertDispatcher
+    return AlertDispatcher(args.webhook, username=username)  # Envoi non bloquant des alertes
+
+
+def start_metrics(args):
+    if args.metrics_port is not None:
+        from metrics import start_http_server
+        start_http_server(args.metrics_port, args.metrics_addr)
+
+
+def add_broker_arguments(parser):
+    parser.add_argument("--broker", default=env("BROKER", BROKER), help="adresse du broker MQTT (BROKER)")
+    parser.add_argument("--port", type=int, default=env("PORT", None, int), help="port du broker (PORT), 1883 ou 8883 avec --tls")
+    parser.add_argument("--tls", action="store_true", default=env_flag("MQTT_TLS"), help="connexion chiffrée (MQTT_TLS=1)")
+    parser.add_argument("--ca-certs", default=env("CERT_PATH"), help="certificat de l'autorité (CERT_PATH)")
+    parser.add_argument("--tls13-only", action="store_true", default=env_flag("TLS13_ONLY"), help="refuse TLS 1.2 (TLS13_ONLY=1)")
+    parser.add_argument("--mqtt-username", default=env("USERNAME"), help="identifiant du broker (USERNAME), avec ou sans --tls")
+    parser.add_argument("--mqtt-password", default=env("PASSWORD"), help="mot de passe du broker (PASSWORD), avec ou sans --tls")
+    parser.add_argument("--mqtt-version", choices=("3.1.1", "5"), default=env("MQTT_VERSION", "3.1.1"))
+    parser.add_argument("--client-id", default=env("CLIENT_ID"), help="identifiant stable de la session persistante (CLIENT_ID)")
+    parser.add_argument("--session-expiry", type=int, default=env("SESSION_EXPIRY", 3600, int),
+                        help="durée de conservation de la session par le broker en MQTT 5, en secondes")
+    parser.add_argument("--max-queue", type=int, default=env("MAX_QUEUE", 1000, int),
+                        help="publications gardées en mémoire pendant une coupure")
+
+
+def add_monitoring_arguments(parser, log_file):
+    parser.add_argument("--interval", type=float, default=env("HEARTBEAT_INTERVAL", 60, float),
+                        help="cadence des battements en secondes (HEARTBEAT_INTERVAL)")
+    parser.add_argument("--webhook", default=env("WEBHOOK"), help="webhook Discord des alertes (WEBHOOK)")
+    parser.add_argument("--log-file", default=log_file)
+    parser.add_argument("--log-format", choices=("text", "json"), default=env("LOG_FORMAT", "text"))
+    parser.add_argument("--log-max-bytes", type=int, default=env("LOG_MAX_BYTES", 10 * 1024 * 1024, int))
+    parser.add_argument("--log-compress", action="store_true", default=env_flag("LOG_COMPRESS"))
+    parser.add_argument("--metrics-port", type=int, default=env("METRICS_PORT", None, int),
+                        help="expose les métriques Prometheus sur http://<adresse>:<port>/metrics (METRICS_PORT)")
+    parser.add_argument("--metrics-addr", default=env("METRICS_ADDR", "127.0.0.1"))
+
+
+def add_peer_arguments(parser):
+    parser.add_argument("--role", choices=("iot", "vm"), default=env("ROLE"), help="rôle de ce pair (ROLE)")
+    parser.add_argument("--detector", choices=("timeout", "phi"), default=env("DETECTOR", "timeout"))
+    parser.add_argument("--phi-threshold", type=float, default=env("PHI_THRESHOLD", 8, float))
+    parser.add_argument("--payload-format", choices=("binary", "text"), default=env("PAYLOAD_FORMAT", "binary"))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Healthcheck et chat MQTT/CoAP entre l'IoT et la VM Azure.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    healthcheck = commands.add_parser("healthcheck", help="healthcheck MQTT entre l'IoT et la VM")
+    add_broker_arguments(healthcheck)
+    add_peer_arguments(healthcheck)
+    add_monitoring_arguments(healthcheck, "mqtt_healthcheck.log")
+    healthcheck.add_argument("--topic", default=env("TOPIC", "iot/healthcheck"))
+    healthcheck.add_argument("--device-id", default=env("DEVICE_ID"), help="topic dédié suivi par le superviseur (DEVICE_ID)")
+    healthcheck.add_argument("--qos", type=int, choices=(0, 1, 2), default=env("QOS", 0, int))
+    healthcheck.add_argument("--redundant-coap", action="store_true", default=env_flag("REDUNDANT_COAP"),
+                             help="doublé d'un lien CoAP : alerte seulement si les deux liens sont muets (REDUNDANT_COAP=1)")
+    healthcheck.add_argument("--coap-server", default=env("COAP_SERVER", "coap://20.107.241.46:5683"), help="serveur CoAP de la VM (COAP_SERVER)")
+    healthcheck.add_argument("--coap-bind-port", type=int, default=env("COAP_PORT", 5683, int), help="port d'écoute du serveur CoAP de la VM")
+
+    chat = commands.add_parser("chat", help="chat MQTT en ligne de commande")
+    add_broker_arguments(chat)
+    chat.add_argument("--username", default=env("CHAT_USERNAME"), help="pseudo affiché (CHAT_USERNAME)")
+    chat.add_argument("--topic", default=env("CHAT_TOPIC", "iot/chat"), help="racine des salons (CHAT_TOPIC)")
+    chat.add_argument("--room", default=env("CHAT_ROOM", "general"), help="salon où partent les messages (CHAT_ROOM)")
+    chat.add_argument("--rooms", default=env("CHAT_ROOMS"), help="salons écoutés, séparés par des virgules ; tous par défaut (CHAT_ROOMS)")
+    chat.add_argument("--qos", type=int, choices=(0, 1, 2), default=env("CHAT_QOS", 1, int))
+    chat.add_argument("--replay", type=int, default=env("CHAT_REPLAY", 0, int),
+                      help="nombre de messages de l'historique rejoués à l'arrivée, MQTT 5 (CHAT_REPLAY)")
+    # MQTT 5 par défaut pour le chat : pseudo en propriété utilisateur et abonnement no_local
+    chat.set_defaults(mqtt_version=env("MQTT_VERSION", "5"))
+
+    chat_archive = commands.add_parser("chat-archive", help="enregistre le chat et rejoue l'historique aux arrivants")
+    add_broker_arguments(chat_archive)
+    chat_archive.add_argument("--topic", default=env("CHAT_TOPIC", "iot/chat"), help="racine des salons (CHAT_TOPIC)")
+    chat_archive.add_argument("--db", default=env("CHAT_DB", "chat_history.db"), help="base SQLite de l'historique (CHAT_DB)")
+    chat_archive.set_defaults(mqtt_version=env("MQTT_VERSION", "5"))
+
+    coap = commands.add_parser("coap", help="healthcheck CoAP entre l'IoT et la VM")
+    add_peer_arguments(coap)
+    add_monitoring_arguments(coap, "coap_healthcheck.log")
+    coap.add_argument("--server", default=env("COAP_SERVER", "coap://20.107.241.46:5683"), help="serveur CoAP de la VM (COAP_SERVER)")
+    coap.add_argument("--bind-port", type=int, default=env("COAP_PORT", 5683, int), help="port d'écoute du serveur CoAP de la VM")
+    coap.add_argument("--device-id", default=env("DEVICE_ID"),
+                      help="ressource /healthcheck/<device_id> de l'IoT ; côté VM, seul appareil surveillé, "
+                           "par défaut l'IoT sans identifiant (DEVICE_ID)")
+    coap.add_argument("--history", type=int, default=env("COAP_HISTORY", 100, int), help="battements gardés par appareil")
+
+    coap_watch = commands.add_parser("coap-watch", help="observe (RFC 7641) les battements d'appareils CoAP")
+    coap_watch.add_argument("--server", default=env("COAP_SERVER", "coap://20.107.241.46:5683"), help="serveur CoAP de la VM (COAP_SERVER)")
+    coap_watch.add_argument("--device", action="append", default=[],
+                            help="appareil à observer (répétable) ; sans option, l'ancienne ressource /healthcheck")
+
+    coap_batch = commands.add_parser("coap-batch", help="passerelle : envoie les battements de plusieurs appareils en un lot CoAP")
+    coap_batch.add_argument("--server", default=env("COAP_SERVER", "coap://20.107.241.46:5683"), help="serveur CoAP de la VM (COAP_SERVER)")
+    coap_batch.add_argument("--device", action="append", default=[], help="appareil relayé (répétable)")
+    coap_batch.add_argument("--devices", type=int, default=10,
+                            help="sans --device : nombre d'appareils simulés passerelle-1 à passerelle-N")
+    coap_batch.add_argument("--interval", type=float, default=0, help="secondes entre deux lots, 0 pour un seul lot")
+
+    supervisor = commands.add_parser("supervisor", help="VM qui suit de nombreux appareils IoT")
+    add_broker_arguments(supervisor)
+    add_monitoring_arguments(supervisor, "mqtt_healthcheck.log")
+    supervisor.add_argument("--timeout", type=float, default=env("DEVICE_TIMEOUT", None, float),
+                            help="délai avant alerte par appareil (DEVICE_TIMEOUT), 2.5 battements par défaut")
+    supervisor.add_argument("--liveness", choices=("wheel", "table"), default=env("LIVENESS", "wheel"),
+                            help="échéances en roue de temporisation, ou table NumPy balayée d'un bloc (LIVENESS)")
+    supervisor.add_argument("--workers", type=int, default=env("SUPERVISOR_WORKERS", 1, int),
+                            help="processus workers, appareils répartis par hachage cohérent (SUPERVISOR_WORKERS)")
+    supervisor.add_argument("--share-group", default=env("SHARE_GROUP", "healthcheck"), help="groupe de l'abonnement partagé $share")
+    supervisor.add_argument("--coap-port", type=int, default=env("SUPERVISOR_COAP_PORT", None, int),
+                            help="avec --workers : le worker i sert aussi CoAP sur ce port + i (SUPERVISOR_COAP_PORT)")
+    supervisor.add_argument("--correlation-window", type=float, default=env("CORRELATION_WINDOW", None, float),
+                            help="secondes pendant lesquelles les pannes sont regroupées par cause, un battement par défaut "
+                                 "(les échéances d'un même groupe s'étalent sur un intervalle), 0 pour désactiver (CORRELATION_WINDOW)")
+    supervisor.add_argument("--correlation-threshold", type=float, default=env("CORRELATION_THRESHOLD", 0.5, float),
+                            help="part des appareils d'une cause en panne pour une alerte groupée (CORRELATION_THRESHOLD)")
+    supervisor.add_argument("--correlation-min-devices", type=int, default=env("CORRELATION_MIN_DEVICES", 3, int),
+                            help="appareils en panne au minimum pour une alerte groupée (CORRELATION_MIN_DEVICES)")
+    supervisor.add_argument("--segment-separator", default=env("SEGMENT_SEPARATOR"),
+                            help="segment réseau = préfixe de l'identifiant avant ce séparateur, ex. '-' (SEGMENT_SEPARATOR)")
+
+    probe = commands.add_parser("probe", help="mesure le temps de connexion au broker (DNS, TCP, TLS, CONNACK)")
+    add_broker_arguments(probe)
+    probe.add_argument("--count", type=int, default=5, help="nombre de connexions successives")
+    return parser
+
+
+def broker_port(args):
+    return args.port or (8883 if args.tls else 1883)
+
+
+def run_healthcheck(args):
+    from healthcheck import HealthcheckPeer
+
+    role = ask_role(args)
+    start_metrics(args)
+    alerts = make_alerts(args, "MQTT Healthchecker")
+    log_writer = make_log_writer(args)
+    extra_transports = []
+    if args.redundant_coap:
+        from coap_healthcheck import CoapTransport
+        extra_transports.append(CoapTransport(args.coap_server, bind=("::", args.coap_bind_port), device_id=args.device_id))
+    peer = HealthcheckPeer(
+        role, broker=args.broker, port=broker_port(args), topic=args.topic, device_id=args.device_id,
+        interval=args.interval, detector=args.detector, phi_threshold=args.phi_threshold,
+        payload_format=args.payload_format, username=args.mqtt_username, password=args.mqtt_password,
+        tls=args.tls, ca_certs=args.ca_certs, tls13_only=args.tls13_only, protocol=args.mqtt_version, qos=args.qos,
+        client_id=args.client_id, session_expiry=args.session_expiry, max_queue=args.max_queue,
+        extra_transports=extra_transports, alerts=alerts, log_writer=log_writer,
+    )
+    try:
+        # Boucle principale : dort jusqu'au prochain battement ou jusqu'à un message reçu
+        peer.run()
+    finally:
+        alerts.close()  # Laisser partir les alertes en attente avant de quitter
+        log_writer.close()
+
+
+def run_chat(args):
+    from chat import ChatClient
+
+    # Demander un pseudo pour identifier les messages
+    username = args.username or input("Entrez votre pseudo : ")
+    rooms = [room.strip() for room in args.rooms.split(",") if room.strip()] if args.rooms else None
+    ChatClient(
+        username, broker=args.broker, port=broker_port(args), topic=args.topic,
+        login=args.mqtt_username, password=args.mqtt_password, tls=args.tls, ca_certs=args.ca_certs,
+        tls13_only=args.tls13_only, protocol=args.mqtt_version, qos=args.qos, room=args.room, rooms=rooms,
+        replay=args.replay,
+    ).run_interactive()
+
+
+def run_chat_archive(args):
+    from chathistory import ChatArchiver, ChatHistory
+    from connection import MqttConnection, default_client_id
+
+    connection = MqttConnection(
+        args.client_id or default_client_id("chat-archive"), args.broker, broker_port(args),
+        username=args.mqtt_username, password=args.mqtt_password, tls=args.tls, ca_certs=args.ca_certs,
+        tls13_only=args.tls13_only, protocol=args.mqtt_version, session_expiry=args.session_expiry,
+    )
+    history = ChatHistory(args.db)
+    print(f"🗄️ Archivage du chat dans {args.db} ({history.count()} messages déjà enregistrés)...")
+    ChatArchiver(connection, history, topic=args.topic).run()
+
+
+def run_coap(args):
+    from coap_healthcheck import CoapHealthcheck
+
+    logging.basicConfig(level=logging.INFO)
+    role = ask_role(args)
+    start_metrics(args)
+    alerts = make_alerts(args, "CoAP Healthchecker")
+    log_writer = make_log_writer(args)
+    peer = CoapHealthcheck(
+        role, server=args.server, bind=("::", args.bind_port), device_id=args.device_id, history=args.history,
+        interval=args.interval,
+        detector=args.detector, phi_threshold=args.phi_threshold, payload_format=args.payload_format,
+        alerts=alerts, log_writer=log_writer,
+    )
+    try:
+        # Boucle principale : dort jusqu'au prochain battement ou jusqu'à un POST reçu
+        peer.run()
+    finally:
+        alerts.close()
+        log_writer.close()
+
+
+def run_coap_watch(args):
+    import frame
+    from coap_client import CoapClient
+    from coap_healthcheck import RESOURCE
+
+    client = CoapClient(args.server)
+    paths = [f"{RESOURCE}/{device}" for device in args.device] or [RESOURCE]
+
+    def printer(path):
+        def show(response):
+            heartbeat = frame.decode(response.payload)
+            text = frame.describe(heartbeat) if heartbeat else response.payload.decode("utf-8", "replace")
+            print(f"👀 [{path}] {response.code} {text}")
+        return show
+
+    # Les notifications sont poussées par le serveur : aucune requête n'est répétée
+    observations = [client.observe(path, printer(path)) for path in paths]
+    print(f"👀 Observation de {len(paths)} ressource(s) sur {args.server}...")
+    try:
+        for observation in observations:
+            try:
+                observation.result()
+            except Exception as e:
+                print(f"⚠️ Observation interrompue : {e}")
+    finally:
+        client.close()
+
+
+def run_coap_batch(args):
+    import frame
+    from coap_client import CoapClient
+    from coap_healthcheck import BATCH_RESOURCE
+
+    devices = args.device or [f"passerelle-{n}" for n in range(1, args.devices + 1)]
+    client = CoapClient(args.server)
+    seq = 0
+    try:
+        while True:
+            seq += 1
+            timestamp_ns = time.monotonic_ns()
+            records = [(device, frame.encode("iot", seq, timestamp_ns)) for device in devices]
+            try:
+                response = client.post_batch(BATCH_RESOURCE, records)
+                print(f"📦 Lot #{seq} : {len(records)} battements, {response.code} "
+                      f"{response.payload.decode('utf-8', 'replace')}")
+            except Exception as e:
+                print(f"⚠️ Exception POST : {e}")
+            if not args.interval:
+                return
+            time.sleep(args.interval)
+    finally:
+        client.close()
+
+
+def run_supervisor(args):
+    from connection import MqttConnection, default_client_id
+    from supervisor import Supervisor
+
+    interval = max(args.interval, 0.1)
+    timeout = args.timeout or 2.5 * interval  # Deux battements manqués + marge
+    start_metrics(args)
+    alerts = make_alerts(args, "MQTT Healthchecker")
+    log_writer = make_log_writer(args)
+    connection_options = dict(
+        client_id=args.client_id or default_client_id("supervisor"), broker=args.broker, port=broker_port(args),
+        username=args.mqtt_username, password=args.mqtt_password, tls=args.tls, ca_certs=args.ca_certs,
+        tls13_only=args.tls13_only, protocol=args.mqtt_version, session_expiry=args.session_expiry, max_queue=args.max_queue,
+    )
+    correlator = None
+    window = interval if args.correlation_window is None else args.correlation_window
+    if window > 0:
+        from correlation import AlertCorrelator
+        correlator = AlertCorrelator(alerts, window=window, threshold=args.correlation_threshold,
+                                     min_devices=args.correlation_min_devices, segment_separator=args.segment_separator,
+                                     log_writer=log_writer)
+    if args.workers > 1:
+        from sharding import ShardedSupervisor
+
+        supervisor = ShardedSupervisor(
+            args.workers, connection_options, timeout=timeout, tick=min(1.0, interval / 2), share_group=args.share_group,
+            coap_port=args.coap_port, liveness=args.liveness, alerts=alerts, log_writer=log_writer,
+            worker_log_file=args.log_file, worker_log_format=args.log_format, correlator=correlator,
+        )
+    else:
+        table = None
+        if args.liveness == "table":
+            from devicetable import DeviceTable
+            table = DeviceTable(interval=interval, grace=timeout / interval, tick=min(1.0, interval / 2))
+        connection = MqttConnection(**connection_options)
+        supervisor = Supervisor(connection, timeout=timeout, tick=min(1.0, interval / 2), alerts=alerts, log_writer=log_writer,
+                                table=table, correlator=correlator)
+        connection.connect()
+
+    print(f"🚀 [VM] Démarrage du superviseur (délai {timeout:g} s par appareil)...")
+    try:
+        supervisor.run()
+    finally:
+        alerts.close()
+        log_writer.close()
+
+
+def run_probe(args):
+    from connection import MqttConnection, PHASES, default_client_id, describe_timing
+
+    connection = MqttConnection(
+        args.client_id or default_client_id("probe"), args.broker, broker_port(args),
+        username=args.mqtt_username, password=args.mqtt_password, tls=args.tls, ca_certs=args.ca_certs,
+        tls13_only=args.tls13_only, protocol=args.mqtt_version,
+    )
+    samples = []
+    for attempt in range(args.count):
+        # La première connexion fait une poignée de main complète, les suivantes reprennent la session
+        if attempt == 0:
+            connection.connect()
+        else:
+            connection.client.reconnect()
+        deadline = time.monotonic() + 10
+        while not connection.connected:
+            if time.monotonic() > deadline:
+                print("⚠️ Pas de CONNACK du broker.")
+                return
+            connection.client.loop(timeout=0.1)
+        samples.append((connection.timing, connection.client.resumed))
+        connection.client.disconnect()
+        connection.client.loop(timeout=0.1)
+
+    groups = (("poignée de main complète", lambda resumed: resumed is False), ("session reprise", lambda resumed: resumed))
+    if not args.tls:
+        groups = (("sans TLS", lambda resumed: True),)
+    for name, keep in groups:
+        timings = [timing for timing, resumed in samples if keep(resumed)]
+        if timings:
+            means = {phase: sum(t.get(phase, 0) for t in timings) / len(timings) for phase in PHASES + ("total",)}
+            means = {phase: value for phase, value in means.items() if any(phase in t for t in timings)}
+            print(f"📊 Moyenne sur {len(timings)} connexion(s) ({name}) : {describe_timing(means)}")
+
+
+COMMANDS = {
+    "healthcheck": run_healthcheck,
+    "chat": run_chat,
+    "chat-archive": run_chat_archive,
+    "coap": run_coap,
+    "coap-watch": run_coap_watch,
+    "coap-batch": run_coap_batch,
+    "supervisor": run_supervisor,
+    "probe": run_probe,
+}
+
+
+def main(argv=None):
+    load_dotenv()  # Avant la construction du parseur : les valeurs par défaut viennent de l'environnement
+    args = build_parser().parse_args(argv)
+    try:
+        COMMANDS[args.command](args)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import threading
+
+
+class CoapClient:
+    """Client CoAP persistant partagé par les rôles IoT et VM.
+
+    Un seul ``aiocoap.Context`` est créé et réutilisé pour toutes les requêtes,
+    au lieu de lancer un processus ``coap-client`` (fork/exec + nouveau socket UDP)
+    à chaque GET/POST. Le Context tourne dans une boucle asyncio dédiée, sur un
+    thread en arrière-plan, ce qui permet de l'utiliser depuis du code synchrone.
+
+    ``asyncio`` et ``aiocoap`` sont importés par ce thread : ``start()`` prépare
+    le client sans bloquer l'appelant (démarrage rapide de l'IoT), la première
+    requête n'attend que ce qui reste à faire. Les codes de requête se passent
+    par leur nom (``"GET"``, ``"POST"``).
+    """
+
+    def __init__(self, server, timeout=5):
+        self.server = server.rstrip("/")
+        self.timeout = timeout
+        self._loop = None
+        self._context = None
+        self._thread = None
+        self._error = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def _uri(self, path):
+        return f"{self.server}/{path.lstrip('/')}"
+
+    def start(self):
+        """Démarre le thread du client (imports, boucle asyncio, Context) sans l'attendre."""
+        with self._lock:
+            if self._thread is not None and self._error is None:
+                return  # Déjà démarré (un échec de création du Context est retenté)
+            self._ready.clear()
+            self._error = None
+            self._thread = threading.Thread(target=self._run_loop, daemon=True)
+            self._thread.start()
+
+    def _run_loop(self):
+        import asyncio
+        from aiocoap import Context
+
+        loop = asyncio.new_event_loop()
+        try:
+            self._context = loop.run_until_complete(Context.create_client_context())
+        except Exception as e:  # Relevée par la première requête
+            self._error = e
+            loop.close()
+            self._ready.set()
+            return
+        self._loop = loop
+        self._ready.set()
+        loop.run_forever()
+        loop.close()
+
+    def _ensure_started(self):
+        """Démarre le client au besoin et attend que son Context soit prêt."""
+        self.start()
+        if not self._ready.wait(self.timeout):
+            raise TimeoutError("Client CoAP non prêt")
+        if self._error is not None:
+            raise self._error
+
+    async def request(self, code, path, payload=b""):
+        """Envoie une requête depuis la boucle du client et retourne la réponse aiocoap."""
+        import asyncio
+        from aiocoap import Code, Message
+
+        if isinstance(code, str):
+            code = Code[code]
+        message = Message(code=code, uri=self._uri(path), payload=payload)
+        return await asyncio.wait_for(self._context.request(message).response, self.timeout)
+
+    def _run(self, code, path, payload=b""):
+        return self.submit(code, path, payload).result()
+
+    def submit(self, code, path, payload=b""):
+        """Envoie une requête sans attendre la réponse.
+
+        Retourne un ``concurrent.futures.Future`` : l'appelant peut y attacher un
+        callback (``add_done_callback``) plutôt que de bloquer son propre thread.
+        """
+        self._ensure_started()
+        import asyncio  # Déjà chargé par le thread du client
+        return asyncio.run_coroutine_threadsafe(self.request(code, path, payload), self._loop)
+
+    def get(self, path):
+        """GET synchrone, retourne la réponse aiocoap (lève une exception en cas d'échec réseau)."""
+        return self._run("GET", path)
+
+    def post(self, path, payload):
+        """POST synchrone, ``payload`` peut être une chaîne ou des octets."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        return self._run("POST", path, payload)
+
+    def post_batch(self, path, records):
+        """POST synchrone d'un lot de couples (device_id, trame ``frame.encode()``).
+
+        Un lot plus grand qu'un datagramme part en plusieurs blocs (RFC 7959),
+        découpés par aiocoap.
+        """
+        import frame
+        return self._run("POST", path, frame.encode_batch(records))
+
+    async def _observe(self, path, callback):
+        import asyncio
+        from aiocoap import GET, Message
+
+        request = self._context.request(Message(code=GET, uri=self._uri(path), observe=0))
+        try:
+            response = await asyncio.wait_for(request.response, self.timeout)
+            callback(response)
+            if not response.code.is_successful() or request.observation is None:
+                return
+            async for notification in request.observation:
+                callback(notification)
+        finally:
+            if request.observation is not None and not request.observation.cancelled:
+                request.observation.cancel()
+
+    def observe(self, path, callback):
+        """Observe ``path`` (RFC 7641) : ``callback(réponse)`` est appelé sur le thread
+        du client pour la réponse initiale puis à chaque notification du serveur.
+
+        Retourne un ``concurrent.futures.Future`` ; ``cancel()`` arrête l'observation.
+        Il se termine si le serveur refuse ou interrompt l'observation.
+        """
+        self._ensure_started()
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(self._observe(path, callback), self._loop)
+
+    def close(self):
+        """Ferme le Context et arrête la boucle du client."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._ready.wait(self.timeout)
+            if self._loop is not None:
+                import asyncio
+                future = asyncio.run_coroutine_threadsafe(self._context.shutdown(), self._loop)
+                try:
+                    future.result(self.timeout)
+                finally:
+                    self._loop.call_soon_threadsafe(self._loop.stop)
+                    self._thread.join(self.timeout)
+            self._context = None
+            self._loop = None
+            self._thread = None
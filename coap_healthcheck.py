@@ -1,192 +1,145 @@
-import subprocess
+import sys
 import threading
 import time
-import os
-import requests
-import asyncio
-from datetime import datetime, timezone, timedelta
-from dotenv import load_dotenv
-from aiocoap import Context, resource, Message
-import logging
-
-# Configurer les variables globales
-global error
-error = 0
-
-# Configurer les logs
-logging.basicConfig(level=logging.INFO)
-
-# Charger les variables d'environnement
-load_dotenv()
-DiscordWebhook = os.getenv("WEBHOOK")
-
-# Configuration
+from coap_client import CoapClient
+from engine import HealthcheckEngine, Transport
+import frame
+
+# Configuration par défaut
 COAP_SERVER = "coap://20.107.241.46:5683"  # Adresse du serveur CoAP
+COAP_PORT = 5683
 RESOURCE = "healthcheck"
-received_messages = []
-last_received_time = None
-last_received_message = None
-last_sent_minute = None  # Éviter les envois multiples
-error = 0
-
-# Déterminer si on est IoT ou VM
-role = input("Entrez votre rôle (iot/vm) : ").strip().lower()
-if role not in ["iot", "vm"]:
-    print("Rôle invalide. Utilisez 'iot' ou 'vm'.")
-    exit()
-
-class HealthCheckResource(resource.Resource):
-    """Ressource CoAP pour gérer les requêtes GET et POST sur /healthcheck"""
-    
-    def __init__(self):
-        super().__init__()
-        self.latest_message = "Aucun message reçu"
-
-    async def render_get(self, request):
-        """Gérer les requêtes GET"""
-        print(f"📥 [GET] Reçu - Dernier message stocké : {self.latest_message}")
-        return Message(payload=self.latest_message.encode('utf-8'))
-
-    async def render_post(self, request):
-        """Gérer les requêtes POST"""
-        self.latest_message = "vm : " + request.payload.decode('utf-8')
-        print(f"📩 [POST] Nouveau message reçu et enregistré : {self.latest_message}")
-        return Message(payload=b"Message enregistre")
-
-async def run_coap_server():
-    """Lancer le serveur CoAP"""
-    root = resource.Site()
-    root.add_resource([RESOURCE], HealthCheckResource())
-    await Context.create_server_context(root, bind=('::', 5683))
-    print("✅ Serveur CoAP en écoute sur le port 5683...")
-    await asyncio.get_running_loop().create_future()
-
-def start_coap_server():
-    """Démarrer le serveur CoAP en arrière-plan si le rôle est 'vm'"""
-    if role == "vm":
-        print("🟢 [VM] Démarrage du serveur CoAP...")
-        threading.Thread(target=lambda: asyncio.run(run_coap_server()), daemon=True).start()
-
-if role == "vm":
-    start_coap_server()
-
-def send_discord_alert(message):
-    """Envoie une alerte sur un canal Discord via un webhook."""
-    if not DiscordWebhook:
-        print("⚠️ Webhook Discord non défini dans le fichier .env")
-        return
-    
-
-    data = {"content": message, "username": "CoAP Healthchecker"}
-    response = requests.post(DiscordWebhook, json=data)
-    
-    if response.status_code == 204:
-        print("✅ Alerte envoyée sur Discord avec succès !")
-    else:
-        print(f"⚠️ Erreur lors de l'envoi sur Discord : {response.status_code} - {response.text}")
-
-def coap_get():
-    """Effectue une requête GET sur le serveur CoAP."""
-    global error
-    try:
-        cmd = ["coap-client", "-m", "get", f"{COAP_SERVER}/{RESOURCE}"]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            response = result.stdout.strip()
-            print(f"🔹 [DEBUG] Réponse GET reçue : {response}")  # <-- Ajout pour voir la réponse
-            return response
+BATCH_RESOURCE = "batch"  # POST d'un lot de battements (``frame.encode_batch``) par une passerelle
+
+
+class CoapTransport(Transport):
+    """Battements en POST CoAP : l'IoT poste sur ``/healthcheck[/<device_id>]``,
+    la VM répond dans la réponse au POST (``replies_inline``).
+
+    Côté VM, le serveur (``coap_server.build_site``) tourne dans sa propre boucle
+    asyncio sur un thread en arrière-plan et un seul appareil est surveillé :
+    ``device_id``, ou sans lui l'IoT qui poste sur ``/healthcheck`` sans
+    identifiant (un moteur n'a qu'une fenêtre de séquence ; pour une flotte,
+    voir ``supervisor --coap-port``). Côté IoT, le client est préparé en
+    arrière-plan dès ``start()`` (voir ``CoapClient.start``).
+    """
+
+    name = "coap"
+    replies_inline = True
+
+    def __init__(self, server=COAP_SERVER, resource_path=RESOURCE, bind=("::", COAP_PORT), device_id=None, history=100):
+        self.server = server
+        self.resource_path = resource_path
+        self.bind = bind
+        self.device_id = device_id  # IoT : POST sur /healthcheck/<device_id> ; VM : seul appareil surveillé
+        self.history = history
+        self.engine = None
+        self.coap_client = None  # Client CoAP persistant, créé au démarrage de l'IoT
+        self._warned = False  # Battement d'un autre appareil déjà signalé
+
+    def start(self, engine):
+        self.engine = engine
+        if engine.role == "iot":
+            self.coap_client = CoapClient(self.server)
+            self.coap_client.start()  # Context créé pendant que le premier battement part sur les autres liens
         else:
-            print(f"⚠️ Erreur GET : {result.stderr}")
-            return None
-    except Exception as e:
-        print(f"⚠️ Exception GET : {e}")
-        if error > 10:
-            print("🚨 Trop d'erreurs GET, arrêt du script.")
-            send_discord_alert("🚨 **Trop d'erreurs GET, arrêt du script.**")
-            if role == "vm":
-                print("🔴 [VM] Arrêt du serveur CoAP...")
-                subprocess.run(["pkill", "coap-server"])
-            exit()
-        error += 1
-        return None
-
-def coap_post(payload):
-    """Envoie une requête POST sur le serveur CoAP."""
-    try:
-        cmd = ["coap-client", "-m", "post", "-e", payload, f"{COAP_SERVER}/{RESOURCE}"]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            return result.stdout.strip()
-        else:
-            print(f"⚠️ Erreur POST : {result.stderr}")
-            return None
-    except Exception as e:
-        print(f"⚠️ Exception POST : {e}")
-        return None
-
-# Lancement du script
-print(f"🚀 [{role.upper()}] Démarrage du script...")
-
-if role == "iot":
-    print("🔵 IoT envoie aux minutes impaires.")
-else:
-    print("🔴 VM envoie aux minutes paires.")
-
-# Vérification du timing initial
-if role == "iot" and datetime.now().minute % 2 == 0:
-    print("⚠️ [IoT] Minute actuelle paire, attente prochaine minute impaire.")
-    while datetime.now().minute % 2 == 0:
-        time.sleep(1)
-elif role == "iot" and datetime.now().minute % 2 == 1:
-    print("⚠️ [IoT] Minute actuelle impaire, attente prochaine minute impaire.")
-    time.sleep(60)
-    while datetime.now().minute % 2 == 0:
-        time.sleep(1)
-elif role == "vm":
-    # Attendre le premier message de l'IoT
-    while not last_received_message:
-        time.sleep(1)
-
-boucle = 0
-
-# Boucle principale
-while True:
-    now = datetime.now(timezone.utc)
-    minute = now.minute
-
-    # Si la vm reçoit un message de l'IoT, elle doit répondre
-    if role == "vm":
-        last_received_message = coap_get()
-        if last_received_message and "iot" in last_received_message:
-            now = datetime.now(timezone.utc)
-            msg = f"[from: vm] [{now.strftime('%d/%m/%Y %H:%M')}]"
-            coap_post(msg)
-            print(f"📤 [VM] Réponse envoyée : {msg}")
-
-    # Vérifier si on a déjà envoyé un message cette minute
-    if last_sent_minute == minute:
-        time.sleep(1)
-        continue
-    
-    if role == "iot" and minute % 2 == 1:
-        msg = f"[from: iot] [{now.strftime('%d/%m/%Y %H:%M')}]"
-        coap_post(msg)
-        time.sleep(1)
-    
-    last_received_message = coap_get()
-    expected_sender = "iot" if role == "vm" else "vm"
-    print(f"🔹 [DEBUG] Message attendu contenant : '{expected_sender}', Message reçu : '{last_received_message}'")
-    if last_received_message and expected_sender not in last_received_message:
-        print(f"\n🚨 [{role.upper()}] Problème détecté : Dernier message reçu non conforme.")
-        send_discord_alert(f"🚨 **[{role.upper()}] Problème détecté !**\n📅 {now.strftime('%d/%m/%Y %H:%M:%S UTC')}\n❌ Message non reçu.")
-        break
-    
-    if (role == "iot" and minute % 2 == 1) or (role == "vm" and minute % 2 == 0):
-        prev_minute = (now - timedelta(minutes=1)).strftime('%d/%m/%Y %H:%M')
-        msg = f"[from: {role}] [{prev_minute}] : OK / [{now.strftime('%d/%m/%Y %H:%M')}]"
-        coap_post(msg)
-        print(f"📤 {msg}")
-        error = 0
-        last_sent_minute = minute
-    
-    time.sleep(1)
+            self.start_coap_server()
+
+    async def run_coap_server(self):
+        """Lancer le serveur CoAP"""
+        import asyncio
+        from aiocoap import Context
+        from coap_server import build_site
+
+        root = build_site(self._on_heartbeat, self.resource_path, self.history, on_batch=self._on_batch)
+        await Context.create_server_context(root, bind=self.bind)
+        print(f"✅ Serveur CoAP en écoute sur le port {self.bind[1]}...")
+        await asyncio.get_running_loop().create_future()
+
+    def start_coap_server(self):
+        """Démarrer le serveur CoAP en arrière-plan"""
+        print("🟢 [VM] Démarrage du serveur CoAP...")
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        import asyncio  # Chargé sur le thread du serveur, comme aiocoap
+        asyncio.run(self.run_coap_server())
+
+    def _watched(self, device_id):
+        """Vrai pour l'appareil surveillé ; signale une fois les battements d'un autre."""
+        if device_id == (self.device_id or ""):
+            return True
+        if not self._warned:
+            self._warned = True
+            watched = self.device_id or "l'appareil sans identifiant"
+            print(f"⚠️ [VM] Battements de {device_id or '(sans identifiant)'} ignorés : seul {watched} est "
+                  f"surveillé (--device-id, ou supervisor --coap-port pour plusieurs appareils).")
+        return False
+
+    def _on_heartbeat(self, device_id, heartbeat, received_time):
+        """Thread du serveur CoAP : ne garde que l'appareil surveillé."""
+        if self._watched(device_id):
+            # Réveiller immédiatement la boucle principale au lieu d'attendre un GET
+            self.engine.receive(self, heartbeat, received_time)
+
+    def _on_batch(self, records, received_time):
+        """Thread du serveur CoAP : un lot entier est remis au moteur en un seul réveil."""
+        heartbeats = [hb for device_id, hb in records if self._watched(device_id)]
+        if heartbeats:
+            self.engine.receive_batch(self, heartbeats, received_time)
+
+    def send(self, payload):
+        """[IoT] Poste un battement sans attendre la réponse, traitée à son arrivée."""
+        sent_ns = int(self.engine.scheduler.clock() * 1e9)
+        path = f"{self.resource_path}/{self.device_id}" if self.device_id else self.resource_path
+        try:
+            future = self.coap_client.submit("POST", path, payload)
+        except Exception as e:  # Client pas prêt (délai dépassé, Context impossible à créer) : battement perdu
+            print(f"⚠️ Exception POST : {e}")
+            return True
+        future.add_done_callback(lambda f: self._on_reply(f, sent_ns))
+        return True
+
+    def _on_reply(self, future, sent_ns):
+        """Réponse de la VM (thread du client CoAP) : c'est son battement."""
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"⚠️ Exception POST : {e}")
+            return
+        if not result.code.is_successful():
+            print(f"⚠️ Erreur POST : {result.code}")
+            return
+        heartbeat = frame.decode(result.payload)
+        if heartbeat is not None and heartbeat.echo_ns is None:
+            # Réponse texte, sans écho : l'échange lui-même donne l'instant d'envoi
+            heartbeat = heartbeat._replace(echo_ns=sent_ns)
+        self.engine.receive(self, heartbeat, time.monotonic())
+
+    def close(self):
+        if self.coap_client is not None:
+            self.coap_client.close()
+
+
+class CoapHealthcheck(HealthcheckEngine):
+    """Pair de healthcheck CoAP : le moteur commun sur un ``CoapTransport``.
+
+    Comme ``HealthcheckPeer``, le constructeur ne crée ni thread ni socket.
+    """
+
+    def __init__(self, role, server=COAP_SERVER, resource_path=RESOURCE, bind=("::", COAP_PORT), device_id=None,
+                 history=100, interval=60, detector="timeout", phi_threshold=8.0, payload_format="binary",
+                 scheduler=None, alerts=None, log_writer=None):
+        self.coap = CoapTransport(server, resource_path, bind, device_id, history)
+        super().__init__(role, [self.coap], device_id=device_id, interval=interval, detector=detector,
+                         phi_threshold=phi_threshold, payload_format=payload_format, scheduler=scheduler,
+                         alerts=alerts, log_writer=log_writer)
+
+    @property
+    def coap_client(self):
+        return self.coap.coap_client
+
+
+if __name__ == "__main__":
+    import cli
+    cli.main(["coap"] + sys.argv[1:])
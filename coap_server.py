@@ -0,0 +1,166 @@
+import time
+from datetime import datetime, timezone
+
+from aiocoap import resource, error, Message, POST, CHANGED
+
+import frame
+from coap_healthcheck import BATCH_RESOURCE, RESOURCE
+from peerstate import PeerState
+
+# Ressources du serveur CoAP (rôle VM, sharding.py) : un appareil par ressource
+# observable, les lots des passerelles sur ``/batch``. Module séparé de
+# coap_healthcheck.py pour que l'IoT, simple client, ne charge jamais la
+# partie serveur d'aiocoap.
+
+
+class DeviceResource(resource.ObservableResource):
+    """Ressource CoAP d'un appareil (``/healthcheck/<device_id>``).
+
+    POST enregistre un battement et y répond ; GET retourne le dernier battement
+    reçu (``?history`` : l'historique borné, une ligne par battement). La
+    ressource est observable (RFC 7641) : chaque POST est poussé aux
+    observateurs au lieu d'être relu par des GET répétés. Un appareil a sa
+    propre ressource, deux appareils ne s'écrasent donc plus mutuellement.
+    """
+
+    def __init__(self, device_id, on_heartbeat=None, history=100):
+        super().__init__()
+        self.device_id = device_id
+        self.on_heartbeat = on_heartbeat  # on_heartbeat(device_id, heartbeat, instant de réception)
+        self.state = PeerState(history)  # Battements horodatés en UTC, lisibles depuis tout thread
+        # Écrits et lus uniquement sur la boucle du serveur CoAP
+        self.latest_payload = None  # Charge du dernier battement, renvoyée telle quelle aux observateurs
+        self.latest_message = "Aucun message reçu"
+
+    async def render_get(self, request):
+        """Gérer les requêtes GET (et les notifications aux observateurs)"""
+        if "history" in request.opt.uri_query:
+            lines = (f"{datetime.fromtimestamp(at, timezone.utc).strftime('%d/%m/%Y %H:%M:%S')} - {frame.describe(hb)}"
+                     for at, hb in self.state.snapshot().history)
+            return Message(payload="\n".join(lines).encode("utf-8"))
+        if self.latest_payload is None:
+            return Message(payload=self.latest_message.encode("utf-8"))
+        return Message(payload=self.latest_payload)
+
+    def record(self, heartbeat, payload, at):
+        """Enregistre un battement et le pousse aux observateurs."""
+        self.state.record(heartbeat, at)
+        self.publish(heartbeat, payload)
+
+    def publish(self, heartbeat, payload):
+        """Fait de ``heartbeat`` le dernier battement et notifie les observateurs."""
+        self.latest_payload = payload
+        self.latest_message = "vm : " + frame.describe(heartbeat)
+        self.updated_state()  # Notification immédiate des observateurs
+
+    async def render_post(self, request):
+        """Gérer les requêtes POST : la réponse sert d'accusé de réception au battement."""
+        heartbeat = frame.decode(request.payload)
+        if heartbeat is None:
+            self.latest_message = "vm : " + request.payload.decode('utf-8', 'replace')
+            return Message(payload=b"Message enregistre")
+
+        received_time = time.monotonic()
+        self.record(heartbeat, bytes(request.payload), time.time())
+        if self.on_heartbeat is not None:
+            self.on_heartbeat(self.device_id, heartbeat, received_time)
+        if heartbeat.timestamp_ns is None:
+            return Message(payload=frame.encode_text("vm", heartbeat.seq))
+        return Message(payload=frame.encode("vm", heartbeat.seq, echo_ns=heartbeat.timestamp_ns))
+
+
+class DeviceDirectory(resource.Site):
+    """Sous-site ``/healthcheck/`` : une ``DeviceResource`` par appareil, créée
+    au premier POST (ou à la première observation) sur ``/healthcheck/<device_id>``.
+    Les appareils apparaissent dans ``/.well-known/core``. Au-delà de
+    ``max_devices`` les nouveaux appareils sont refusés (5.03) plutôt que de
+    laisser la mémoire grandir sans limite.
+    """
+
+    def __init__(self, on_heartbeat=None, history=100, max_devices=10000):
+        super().__init__()
+        self.on_heartbeat = on_heartbeat
+        self.history = history
+        self.max_devices = max_devices
+
+    def device(self, device_id):
+        """Ressource de ``device_id``, créée au besoin (None si la limite est atteinte)."""
+        path = (device_id,)
+        found = self._resources.get(path)
+        if found is None:
+            if len(self._resources) >= self.max_devices:
+                return None
+            found = DeviceResource(device_id, self.on_heartbeat, self.history)
+            self.add_resource(path, found)
+        return found
+
+    def ingest(self, records):
+        """Enregistre un lot de couples (device_id, battement) ; retourne ceux acceptés.
+
+        Le lot est d'abord regroupé par appareil, puis l'état de chaque appareil
+        est mis à jour en une seule écriture (``PeerState.record_many``). Chaque
+        ressource n'est notifiée qu'une fois par lot, avec son dernier battement,
+        même si la passerelle en relaie plusieurs pour le même appareil.
+        """
+        at = time.time()
+        accepted = []
+        by_device = {}
+        for device_id, heartbeat in records:
+            device = self.device(device_id) if device_id else None
+            if device is None:
+                continue
+            by_device.setdefault(device, []).append(heartbeat)
+            accepted.append((device_id, heartbeat))
+        for device, heartbeats in by_device.items():
+            device.state.record_many(heartbeats, at)
+            heartbeat = heartbeats[-1]
+            device.publish(heartbeat, frame.encode(heartbeat.sender, heartbeat.seq, heartbeat.timestamp_ns or 0,
+                                                   heartbeat.echo_ns or 0, heartbeat.status))
+        return accepted
+
+    def _find_child_and_pathstripped_message(self, request):
+        path = request.opt.uri_path
+        # POST d'un nouvel appareil, ou observateur arrivé avant son premier battement
+        creates = request.code == POST or request.opt.observe == 0
+        if creates and len(path) == 1 and path[0] and self.device(path[0]) is None:
+            raise error.ServiceUnavailable("Trop d'appareils enregistrés")
+        return super()._find_child_and_pathstripped_message(request)
+
+
+class BatchResource(resource.Resource):
+    """``POST /batch`` : lot de battements relayé par une passerelle (``frame.encode_batch``).
+
+    Des centaines d'appareils tiennent en un seul échange : aiocoap réassemble
+    les lots plus grands qu'un datagramme (transfert par blocs, RFC 7959) avant
+    ``render_post``. Le lot est décodé d'un bloc puis transmis en un seul appel
+    à ``on_batch(records, instant de réception)``.
+    """
+
+    def __init__(self, directory, on_batch=None):
+        super().__init__()
+        self.directory = directory
+        self.on_batch = on_batch
+
+    async def render_post(self, request):
+        try:
+            records = frame.decode_batch(request.payload)
+        except ValueError as e:
+            raise error.BadRequest(str(e))
+        received_time = time.monotonic()
+        accepted = self.directory.ingest(records)
+        print(f"📦 [POST] Lot reçu : {len(accepted)}/{len(records)} battements enregistrés")
+        if accepted and self.on_batch is not None:
+            self.on_batch(accepted, received_time)
+        return Message(code=CHANGED, payload=f"{len(accepted)} enregistres".encode())
+
+
+def build_site(on_heartbeat=None, resource_path=RESOURCE, history=100, max_devices=10000, on_batch=None):
+    """Arborescence du serveur : ``/<resource_path>`` (ancien chemin unique, appareil
+    ``""``), ``/<resource_path>/<device_id>``, ``/batch`` et ``/.well-known/core``."""
+    root = resource.Site()
+    devices = DeviceDirectory(on_heartbeat, history, max_devices)
+    root.add_resource([resource_path], DeviceResource("", on_heartbeat, history))
+    root.add_resource([resource_path], devices)
+    root.add_resource([BATCH_RESOURCE], BatchResource(devices, on_batch))
+    root.add_resource([".well-known", "core"], resource.WKCResource(root.get_resources_as_linkheader))
+    return root
@@ -0,0 +1,369 @@
+import random
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from paho.mqtt.subscribeoptions import SubscribeOptions
+
+from metrics import CONNECT_PHASE, TLS_HANDSHAKES
+
+PROTOCOLS = {"3.1.1": mqtt.MQTTv311, "5": mqtt.MQTTv5}
+PHASES = ("dns", "tcp", "tls", "connack")
+
+
+def default_client_id(prefix, name=None):
+    """Identifiant stable d'une machine à l'autre redémarrage : nécessaire pour
+    retrouver sa session persistante sur le broker."""
+    return f"{prefix}-{name or socket.gethostname()}"[:64]
+
+
+class ResumingContext(ssl.SSLContext):
+    """Contexte TLS client qui reprend la dernière session de chaque serveur.
+
+    Une reprise (ticket de session TLS 1.3, ou identifiant de session TLS 1.2)
+    évite l'échange de certificats et la vérification de la chaîne : c'est ce
+    qui coûte le plus cher sur une petite carte IoT à chaque reconnexion.
+    """
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        super().__init__()
+        self.sessions = {}  # nom du serveur -> dernière ssl.SSLSession
+        self._lock = threading.Lock()
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        if session is None:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+
+    def remember(self, ssl_sock):
+        """À appeler une fois des données applicatives reçues : en TLS 1.3 le
+        ticket n'arrive qu'après la poignée de main."""
+        if ssl_sock.session is not None:
+            with self._lock:
+                self.sessions[ssl_sock.server_hostname] = ssl_sock.session
+
+
+@lru_cache(maxsize=None)
+def tls_context(ca_certs=None, tls13_only=False):
+    """Contexte TLS unique par processus (et par CA) : les certificats ne sont
+    chargés qu'une fois et toutes les connexions partagent le cache de sessions."""
+    context = ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+    if ca_certs:
+        context.load_verify_locations(ca_certs)
+    else:
+        context.load_default_certs()
+    if tls13_only:
+        context.minimum_version = ssl.TLSVersion.TLSv1_3
+    return context
+
+
+class TimedClient(mqtt.Client):
+    """Client paho qui mesure chaque étape de la connexion : résolution DNS,
+    connexion TCP, poignée de main TLS et attente du CONNACK.
+
+    Les méthodes surchargées sont internes à paho (version fixée dans
+    requirements.txt) ; sans proxy ni websocket elles reproduisent son comportement.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timing = {}  # étape -> durée en secondes de la dernière connexion
+        self.resumed = None  # La dernière session TLS a-t-elle été reprise ?
+        self._started = None
+        self._socket_ready = None
+
+    def reconnect(self):
+        self.timing = {}
+        self.resumed = None
+        self._started = time.perf_counter()
+        return super().reconnect()
+
+    def _create_socket_connection(self):
+        if self._get_proxy() or self._transport != "tcp":
+            return super()._create_socket_connection()
+        start = time.perf_counter()
+        infos = socket.getaddrinfo(self._host, self._port, type=socket.SOCK_STREAM)
+        resolved = time.perf_counter()
+        self.timing["dns"] = resolved - start
+        error = None
+        for family, kind, proto, _, address in infos:
+            sock = socket.socket(family, kind, proto)
+            sock.settimeout(self._connect_timeout)
+            try:
+                if self._bind_address:
+                    sock.bind((self._bind_address, self._bind_port))
+                sock.connect(address)
+            except OSError as e:
+                sock.close()
+                error = e
+                continue
+            self.timing["tcp"] = time.perf_counter() - resolved
+            self._socket_ready = time.perf_counter()
+            return sock
+        raise error or OSError(f"Aucune adresse pour {self._host}")
+
+    def _ssl_wrap_socket(self, tcp_sock):
+        start = time.perf_counter()
+        ssl_sock = super()._ssl_wrap_socket(tcp_sock)
+        self._socket_ready = time.perf_counter()
+        self.timing["tls"] = self._socket_ready - start
+        self.resumed = ssl_sock.session_reused
+        return ssl_sock
+
+    def connack_received(self):
+        """Clôt la mesure à la réception du CONNACK ; retourne le détail des étapes."""
+        now = time.perf_counter()
+        if self._socket_ready is not None:
+            self.timing["connack"] = now - self._socket_ready
+        if self._started is not None:
+            self.timing["total"] = now - self._started
+        if self.resumed is not None and isinstance(self._ssl_context, ResumingContext):
+            self._ssl_context.remember(self.socket())
+        return self.timing
+
+
+def describe_timing(timing, resumed=None):
+    parts = []
+    for phase in PHASES:
+        if phase in timing:
+            part = f"{phase.upper()} {timing[phase] * 1000:.1f} ms"
+            if phase == "tls" and resumed is not None:
+                part += " (session reprise)" if resumed else " (poignée de main complète)"
+            parts.append(part)
+    total = f", total {timing['total'] * 1000:.1f} ms" if "total" in timing else ""
+    return ", ".join(parts) + total
+
+
+class MqttConnection:
+    """Connexion MQTT qui survit aux coupures du broker.
+
+    - reconnexion automatique avec attente exponentielle (``min_backoff`` à
+      ``max_backoff`` secondes), y compris si le broker est absent au démarrage ;
+    - session persistante : ``clean_session=False`` en MQTT 3.1.1, ou
+      ``clean_start=False`` et ``session_expiry`` secondes en MQTT 5 ;
+    - abonnements mémorisés et renouvelés à chaque reconnexion (le broker a pu
+      perdre la session, par exemple après un redémarrage) ;
+    - publications faites hors connexion gardées dans une file bornée
+      (``max_queue``, les plus anciennes sont abandonnées) et envoyées d'un bloc
+      dès la reconnexion, avant toute nouvelle publication ;
+    - TLS avec un contexte partagé par tout le processus (``tls_context``) et
+      reprise de session à la reconnexion, TLS 1.3 seul si ``tls13_only`` ;
+    - durée de chaque étape de la connexion dans ``timing`` (et les métriques).
+
+    ``start()`` fait tourner la boucle paho sur son propre thread ; sans thread,
+    l'appelant appelle ``loop()`` régulièrement (voir supervisor.py).
+    """
+
+    def __init__(self, client_id, broker, port=1883, username=None, password=None, tls=False,
+                 ca_certs=None, tls13_only=False, protocol="3.1.1", session_expiry=3600, keepalive=60,
+                 min_backoff=1, max_backoff=60, max_queue=1000, on_connect=None, on_message=None, verbose=True):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Version MQTT inconnue : {protocol}")
+        self.client_id = client_id
+        self.broker = broker
+        self.port = port
+        self.username = username
+        self.password = password
+        self.tls = tls
+        self.ca_certs = ca_certs
+        self.tls13_only = tls13_only
+        self.protocol = protocol
+        self.session_expiry = session_expiry
+        self.keepalive = keepalive
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.on_connect = on_connect  # on_connect(connection, session_present, reconnect)
+        self.on_message = on_message  # on_message(client, userdata, msg), comme paho
+        self.verbose = verbose
+        self.connected = False
+        self.connects = 0
+        self.queued = 0
+        self.dropped = 0
+        self.subscriptions = {}  # filtre -> QoS ou SubscribeOptions (MQTT 5), renouvelés à chaque connexion
+        self.disconnected_at = None
+        self.last_outage = 0.0  # Durée de la dernière coupure, en secondes
+        self.client = None
+        self.timing = {}  # Durée des étapes de la dernière connexion, en secondes
+        self._queue = deque(maxlen=max_queue)
+        self._lock = threading.RLock()
+        self._threaded = False
+        self._next_attempt = 0.0
+        self._backoff = min_backoff
+
+    def _print(self, message):
+        if self.verbose:
+            print(message)
+
+    def create_client(self):
+        if self.protocol == "5":
+            client = TimedClient(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id, protocol=mqtt.MQTTv5)
+        else:
+            client = TimedClient(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id,
+                                 clean_session=False, protocol=mqtt.MQTTv311)
+        if self.username:
+            client.username_pw_set(self.username, self.password)
+        if self.tls:
+            client.tls_set_context(tls_context(self.ca_certs, self.tls13_only))
+        client.reconnect_delay_set(self.min_backoff, self.max_backoff)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_connect_fail = self._on_connect_fail
+        client.on_message = self._on_message
+        return client
+
+    def _connect_kwargs(self):
+        if self.protocol != "5":
+            return {}
+        properties = Properties(PacketTypes.CONNECT)
+        properties.SessionExpiryInterval = self.session_expiry
+        return {"clean_start": False, "properties": properties}
+
+    def start(self):
+        """Connexion en arrière-plan : un broker absent au démarrage est réessayé."""
+        self.client = self.create_client()
+        self._threaded = True
+        self.client.connect_async(self.broker, self.port, self.keepalive, **self._connect_kwargs())
+        self.client.loop_start()
+
+    def connect(self):
+        """Première connexion pour un usage sans thread (``loop()``)."""
+        self.client = self.create_client()
+        try:
+            self.client.connect(self.broker, self.port, self.keepalive, **self._connect_kwargs())
+        except OSError as e:
+            self._print(f"⚠️ Broker injoignable ({e}), nouvelle tentative dans {self._backoff:g} s")
+            self._schedule_retry()
+
+    def loop(self, timeout=1.0):
+        """Un tour de boucle réseau, avec reconnexion si la connexion est perdue."""
+        if self.client.socket() is not None:
+            if self.client.loop(timeout=timeout) == mqtt.MQTT_ERR_SUCCESS:
+                return
+            if self._next_attempt <= time.monotonic():
+                self._schedule_retry()
+            return
+        now = time.monotonic()
+        if now < self._next_attempt:
+            time.sleep(min(timeout, self._next_attempt - now))
+            return
+        try:
+            self.client.reconnect()
+        except OSError as e:
+            self._print(f"⚠️ Broker injoignable ({e}), nouvelle tentative dans {self._backoff:g} s")
+            self._schedule_retry()
+
+    def _schedule_retry(self):
+        # Attente exponentielle avec un peu d'aléa, pour ne pas reconnecter tous les clients en même temps
+        self._next_attempt = time.monotonic() + self._backoff * random.uniform(0.5, 1.0)
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def reconnect_grace(self):
+        """Délai à laisser aux pairs pour se reconnecter après une coupure : leur
+        attente exponentielle peut atteindre le double de la durée de la coupure."""
+        return min(2 * self.last_outage, self.max_backoff) + self.min_backoff
+
+    def close(self):
+        if self.client is not None:
+            self.client.disconnect()
+            if self._threaded:
+                self.client.loop_stop()
+
+    def subscribe(self, topic, qos=0, no_local=False):
+        """S'abonne maintenant si possible, et à chaque reconnexion.
+
+        ``no_local`` (MQTT 5 seulement, ignoré en 3.1.1) : le broker ne renvoie pas
+        à ce client ses propres publications.
+        """
+        options = SubscribeOptions(qos=qos, noLocal=no_local) if self.protocol == "5" else qos
+        with self._lock:
+            self.subscriptions[topic] = options
+            if self.connected:
+                self._subscribe(self.client, topic, options)
+
+    @staticmethod
+    def _subscribe(client, topic, options):
+        if isinstance(options, SubscribeOptions):
+            client.subscribe(topic, options=options)
+        else:
+            client.subscribe(topic, options)
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        """Publie, ou met en file si la connexion est coupée. Retourne False si mis en file.
+
+        ``properties`` (``Properties(PacketTypes.PUBLISH)``) n'est envoyé qu'en MQTT 5.
+        """
+        if self.protocol != "5":
+            properties = None
+        with self._lock:
+            if self.connected and not self._queue:
+                info = self.client.publish(topic, payload, qos, retain, properties)
+                if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                    return True
+                self.connected = False  # Coupure détectée avant le callback de déconnexion
+                if self.disconnected_at is None:
+                    self.disconnected_at = time.monotonic()
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append((topic, payload, qos, retain, properties))
+            self.queued += 1
+            return False
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            self._print(f"⚠️ Erreur de connexion au broker, code {rc}")
+            return
+        self._record_timing(client)
+        with self._lock:
+            self.connected = True
+            self._backoff = self.min_backoff
+            reconnect = self.connects > 0
+            self.connects += 1
+            if self.disconnected_at is not None:
+                self.last_outage = time.monotonic() - self.disconnected_at
+                self.disconnected_at = None
+            # Le broker a pu oublier la session : on renouvelle toujours les abonnements
+            for topic, options in self.subscriptions.items():
+                self._subscribe(client, topic, options)
+            if self._queue and reconnect:
+                self._print(f"📦 Envoi de {len(self._queue)} message(s) mis en file pendant la coupure.")
+            while self._queue:
+                if client.publish(*self._queue[0]).rc != mqtt.MQTT_ERR_SUCCESS:
+                    self.connected = False
+                    break
+                self._queue.popleft()
+        if self.on_connect:
+            self.on_connect(self, flags.session_present, reconnect)
+
+    def _record_timing(self, client):
+        self.timing = client.connack_received()
+        for phase in PHASES:
+            if phase in self.timing:
+                CONNECT_PHASE.labels(phase).observe(self.timing[phase])
+        if client.resumed is not None:
+            TLS_HANDSHAKES.labels("true" if client.resumed else "false").inc()
+        self._print(f"⏱️ Connexion : {describe_timing(self.timing, client.resumed)}")
+
+    def _on_disconnect(self, client, userdata, flags, rc, properties=None):
+        with self._lock:
+            was_connected = self.connected
+            self.connected = False
+            if self.disconnected_at is None:
+                self.disconnected_at = time.monotonic()
+        if was_connected and rc != 0:  # rc 0 : déconnexion demandée par nous
+            self._print(f"🔌 Connexion au broker perdue ({rc}), reconnexion automatique...")
+        if not self._threaded:
+            self._schedule_retry()
+
+    def _on_connect_fail(self, client, userdata):
+        """Tentative de connexion échouée (mode thread), y compris la toute première."""
+        self._print(f"⚠️ Broker {self.broker}:{self.port} injoignable, nouvelle tentative...")
+
+    def _on_message(self, client, userdata, msg):
+        if self.on_message:
+            self.on_message(client, userdata, msg)
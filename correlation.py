@@ -0,0 +1,229 @@
+import time
+
+# Corrélation des alertes : quand le broker (ou un segment réseau, ou tout un
+# transport) tombe, des centaines d'appareils deviennent muets en même temps.
+# Plutôt qu'une alerte par appareil, les pannes arrivées dans la même fenêtre
+# sont regroupées par cause commune et une seule alerte « cause racine » part
+# pour le groupe ; les autres pannes restent signalées une à une. Quand les
+# battements reprennent, un avis de rétablissement est envoyé (un par incident,
+# ou un pour les appareils isolés revenus dans la fenêtre).
+#
+# Chaque cause (dimension, valeur) tient ses compteurs d'appareils suivis et
+# en panne, mis à jour à chaque changement d'état : ``flush()`` ne parcourt que
+# les appareils changés depuis la fenêtre précédente, jamais toute la flotte.
+#
+# Une panne est rattachée à la cause qui l'explique le mieux : celle dont la
+# proportion d'appareils en panne est la plus forte (un segment entièrement
+# muet plutôt que son broker à moitié muet). Un broker auquel le superviseur
+# est connecté n'est jamais tenu pour responsable.
+
+DIMENSIONS = ("broker", "transport", "segment")  # De la cause la plus large à la plus étroite
+DIMENSION_NAMES = {"broker": "broker", "transport": "transport", "segment": "segment réseau"}
+MAX_LISTED = 10  # Appareils nommés dans un message, les autres sont comptés
+
+
+def _listing(devices):
+    devices = sorted(devices)
+    listed = ", ".join(devices[:MAX_LISTED])
+    return f"{listed} (+{len(devices) - MAX_LISTED})" if len(devices) > MAX_LISTED else listed
+
+
+class Incident:
+    """Panne groupée ouverte pour une cause commune."""
+
+    __slots__ = ("cause", "devices", "opened_at", "peak")
+
+    def __init__(self, cause, opened_at):
+        self.cause = cause
+        self.devices = set()  # Appareils encore en panne rattachés à l'incident
+        self.opened_at = opened_at
+        self.peak = 0
+
+
+class AlertCorrelator:
+    """Regroupe les pannes simultanées par cause avant de les envoyer à ``alerts``.
+
+    Une cause devient un incident quand au moins ``min_devices`` appareils et
+    une proportion ``threshold`` de ses appareils sont en panne. ``segment_separator`` :
+    le segment réseau d'un appareil est le préfixe de son identifiant avant ce
+    séparateur (``atelier1-capteur3`` -> ``atelier1``) ; sans séparateur, pas de
+    dimension segment.
+
+    Un seul thread écrivain (celui de la boucle du superviseur).
+    """
+
+    def __init__(self, alerts=None, window=5.0, threshold=0.5, min_devices=3, segment_separator=None,
+                 clock=time.monotonic, log_writer=None, verbose=True):
+        self.alerts = alerts
+        self.window = window
+        self.threshold = threshold
+        self.min_devices = min_devices
+        self.segment_separator = segment_separator
+        self.clock = clock
+        self.log_writer = log_writer
+        self.verbose = verbose
+        self._causes = {}  # appareil -> ((dimension, valeur), ...) dans l'ordre de DIMENSIONS
+        self._groups = {}  # (dimension, valeur) -> [appareils suivis, appareils en panne]
+        self._down = set()
+        self._incidents = {}  # (dimension, valeur) -> Incident ouvert
+        self._incident_of = {}  # appareil -> Incident qui le couvre
+        self._pending_down = {}  # appareil -> alerte individuelle, en attente de corrélation
+        self._pending_up = set()
+        self._pending_since = None
+        self._reachable = set()  # Brokers auxquels le superviseur est connecté
+
+    def _emit(self, message, key=None, event=None, **fields):
+        if self.verbose:
+            print(message)
+        if self.log_writer and event:
+            self.log_writer.write(message.splitlines()[0], event=event, **fields)
+        if self.alerts:
+            self.alerts.send(message, key=key)
+
+    def register(self, device_id, broker=None, transport=None):
+        """Déclare un appareil suivi et ses causes de panne possibles."""
+        if device_id in self._causes:
+            return
+        values = {"broker": broker, "transport": transport}
+        if self.segment_separator and self.segment_separator in device_id:
+            values["segment"] = device_id.split(self.segment_separator, 1)[0]
+        causes = tuple((dimension, values[dimension]) for dimension in DIMENSIONS if values.get(dimension))
+        self._causes[device_id] = causes
+        for cause in causes:
+            self._groups.setdefault(cause, [0, 0])[0] += 1
+
+    def broker_connected(self, broker, connected):
+        """Le superviseur est (``connected``) ou n'est plus connecté à ``broker``."""
+        if connected:
+            self._reachable.add(broker)
+        else:
+            self._reachable.discard(broker)
+
+    def forget(self, device_id):
+        """Oublie ``device_id`` (son worker a redémarré sans état) ; il sera de nouveau
+        déclaré par ``register()`` à son prochain battement."""
+        causes = self._causes.pop(device_id, None)
+        if causes is None:
+            return
+        down = device_id in self._down
+        for cause in causes:
+            group = self._groups[cause]
+            group[0] -= 1
+            group[1] -= down
+            if not group[0]:
+                del self._groups[cause]
+        self._down.discard(device_id)
+        self._pending_down.pop(device_id, None)
+        self._pending_up.discard(device_id)
+        incident = self._incident_of.pop(device_id, None)
+        if incident is not None:
+            incident.devices.discard(device_id)
+            if not incident.devices:
+                del self._incidents[incident.cause]  # État inconnu : ni panne ni rétablissement à annoncer
+
+    def _mark(self, device_id, delta):
+        for cause in self._causes.get(device_id, ()):
+            self._groups[cause][1] += delta
+
+    def _touch(self, now):
+        if self._pending_since is None:
+            self._pending_since = now
+
+    def failed(self, device_id, message, now=None):
+        """Panne de ``device_id`` ; ``message`` est son alerte si elle n'est pas regroupée."""
+        if device_id in self._down:
+            return
+        now = self.clock() if now is None else now
+        self._down.add(device_id)
+        self._mark(device_id, 1)
+        if device_id in self._pending_up:
+            self._pending_up.discard(device_id)  # Revenu puis reparti dans la même fenêtre
+        self._pending_down[device_id] = message
+        self._touch(now)
+
+    def recovered(self, device_id, now=None):
+        """Battements revenus pour ``device_id``."""
+        if device_id not in self._down:
+            return
+        now = self.clock() if now is None else now
+        self._down.discard(device_id)
+        self._mark(device_id, -1)
+        if self._pending_down.pop(device_id, None) is not None:
+            return  # Panne jamais signalée : rien à rétablir
+        self._pending_up.add(device_id)
+        self._touch(now)
+
+    def _qualifies(self, cause):
+        total, down = self._groups[cause]
+        return down >= self.min_devices and down >= self.threshold * total
+
+    def _cause_of(self, device_id):
+        """Cause d'un incident ouvert ou éligible qui explique le mieux la panne, ou None.
+
+        La plus forte proportion d'appareils en panne l'emporte ; à égalité, la
+        cause la plus large (tout le broker plutôt que chacun de ses segments).
+        """
+        best, best_ratio = None, 0.0
+        for cause in self._causes.get(device_id, ()):
+            if cause[0] == "broker" and cause[1] in self._reachable:
+                continue
+            if cause not in self._incidents and not self._qualifies(cause):
+                continue
+            total, down = self._groups[cause]
+            if down / total > best_ratio:
+                best, best_ratio = cause, down / total
+        return best
+
+    def flush(self, now=None):
+        """Envoie les alertes de la fenêtre écoulée ; à appeler à chaque tour de boucle."""
+        now = self.clock() if now is None else now
+        if self._pending_since is None or now - self._pending_since < self.window:
+            return
+        pending_down, self._pending_down = self._pending_down, {}
+        pending_up, self._pending_up = self._pending_up, set()
+        self._pending_since = None
+
+        opened = []
+        isolated = []
+        for device_id, message in pending_down.items():
+            cause = self._cause_of(device_id)
+            if cause is None:
+                isolated.append((device_id, message))
+                continue
+            incident = self._incidents.get(cause)
+            if incident is None:
+                incident = self._incidents[cause] = Incident(cause, now)
+                opened.append(incident)
+            incident.devices.add(device_id)
+            incident.peak = max(incident.peak, len(incident.devices))
+            self._incident_of[device_id] = incident
+
+        for incident in opened:
+            dimension, value = incident.cause
+            total, down = self._groups[incident.cause]
+            self._emit(f"🚨 **[VM] Panne groupée : {DIMENSION_NAMES[dimension]} {value}**\n"
+                       f"❌ {down}/{total} appareils muets : {_listing(incident.devices)}",
+                       key=f"incident:{dimension}:{value}:{incident.opened_at}", event="incident", cause=f"{dimension}:{value}", devices=down)
+        for device_id, message in isolated:
+            self._emit(message, key=f"down:{device_id}:{now}")  # Déjà journalisée par le superviseur
+
+        back = []
+        for device_id in pending_up:
+            incident = self._incident_of.pop(device_id, None)
+            if incident is None:
+                back.append(device_id)
+                continue
+            incident.devices.discard(device_id)
+            if not incident.devices:
+                del self._incidents[incident.cause]
+                dimension, value = incident.cause
+                self._emit(f"✅ **[VM] Rétablissement : {DIMENSION_NAMES[dimension]} {value}**\n"
+                           f"📈 {incident.peak} appareils de nouveau joignables après {now - incident.opened_at:.0f} s",
+                           key=f"resolved:{dimension}:{value}:{incident.opened_at}", event="resolved",
+                           cause=f"{dimension}:{value}")
+        if back:
+            self._emit(f"✅ [VM] De nouveau joignable(s) : {_listing(back)}", key=f"up:{now}", event="recovered",
+                       devices=len(back))
+
+    def summary(self):
+        return f"{len(self._down)} appareils en panne, {len(self._incidents)} incident(s) ouvert(s)"
@@ -0,0 +1,149 @@
+import math
+from collections import deque
+
+
+class RttEstimator:
+    """Estimation lissée du temps aller-retour, même calcul que TCP (RFC 6298)."""
+
+    __slots__ = ("srtt", "rttvar", "alpha", "beta", "last")
+
+    def __init__(self, alpha=1 / 8, beta=1 / 4):
+        self.srtt = None
+        self.rttvar = None
+        self.alpha = alpha
+        self.beta = beta
+        self.last = None
+
+    def add(self, rtt):
+        """Ajoute une mesure de RTT (en secondes)."""
+        self.last = rtt
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+
+    def timeout(self, default):
+        """Délai de réponse toléré : srtt + 4 * rttvar, ou ``default`` sans mesure."""
+        if self.srtt is None:
+            return default
+        return self.srtt + 4 * self.rttvar
+
+
+class ClockOffsetEstimator:
+    """Décalage entre l'horloge du pair et la nôtre, à la manière de NTP.
+
+    Chaque battement répondu fournit t1 (notre envoi), t2/t3 (réception et
+    réponse du pair, sur son horloge ; t2 = t3 quand il ne donne qu'un
+    horodatage) et t4 (notre réception). Comme le filtre d'horloge de NTP, on
+    garde le décalage de l'échantillon au plus petit délai parmi les ``window``
+    derniers : c'est celui que la file d'attente a le moins faussé. Le décalage
+    connu, chaque échange se décompose en délais aller et retour estimés.
+
+    Les horodatages sont monotones : le décalage n'a pas de sens absolu (les
+    deux horloges ne partent pas du même instant) mais il est stable, ce qui
+    suffit aux délais aller/retour ; sa dérive lente est suivie par la fenêtre.
+    """
+
+    __slots__ = ("samples", "offset", "delay", "outbound", "inbound")
+
+    def __init__(self, window=8):
+        self.samples = deque(maxlen=window)  # (délai aller-retour hors traitement, décalage)
+        self.offset = None  # Horloge du pair - notre horloge, en secondes
+        self.delay = None
+        self.outbound = None  # Dernier délai aller estimé (vers le pair)
+        self.inbound = None  # Dernier délai retour estimé
+
+    def add(self, t1, t3, t4, t2=None):
+        """Ajoute un échange (en secondes) ; retourne les délais (aller, retour) estimés."""
+        if t2 is None:
+            t2 = t3
+        delay = (t4 - t1) - (t3 - t2)
+        if delay < 0:
+            return None  # Horodatages incohérents (horloge du pair réinitialisée)
+        self.samples.append((delay, ((t2 - t1) + (t3 - t4)) / 2))
+        self.delay, self.offset = min(self.samples)
+        self.outbound = t2 - self.offset - t1
+        self.inbound = t4 - (t3 - self.offset)
+        return self.outbound, self.inbound
+
+
+class TimeoutDetector:
+    """Détecteur à délai fixe : le pair est suspecté s'il n'a rien envoyé
+    pendant ``interval`` + le délai de réponse estimé à partir des RTT mesurés."""
+
+    def __init__(self, interval, rtt=None, grace=None, min_timeout=1.0):
+        self.interval = interval
+        self.rtt = rtt or RttEstimator()
+        self.grace = interval if grace is None else grace
+        # Plancher du délai toléré (1 s comme le RTO de la RFC 6298, au plus un
+        # intervalle) : sur un lien rapide, srtt + 4 * rttvar ne fait que quelques
+        # ms, moins que la gigue d'ordonnancement des threads.
+        self.min_timeout = min(min_timeout, interval)
+        self.last = None
+
+    def heartbeat(self, now):
+        self.last = now
+
+    def deadline(self):
+        """Instant à partir duquel le pair est considéré comme injoignable."""
+        return self.last + self.interval + max(self.rtt.timeout(self.grace), self.min_timeout)
+
+    def is_available(self, now):
+        return self.last is None or now < self.deadline()
+
+
+class PhiAccrualDetector:
+    """Détecteur phi-accrual (Hayashibara et al., 2004).
+
+    Les intervalles entre deux battements sont modélisés par une loi normale
+    estimée sur une fenêtre glissante ; ``phi`` mesure à quel point le silence
+    actuel est improbable (phi = 8 : une chance sur 10^8 d'être un faux positif).
+    """
+
+    def __init__(self, interval, threshold=8.0, window=100, min_std=None):
+        self.threshold = threshold
+        self.min_std = interval / 10 if min_std is None else min_std
+        self.intervals = deque(maxlen=window)
+        self.intervals.append(interval)  # Amorce tant qu'aucun intervalle n'est mesuré
+        self.last = None
+
+    def heartbeat(self, now):
+        if self.last is not None:
+            self.intervals.append(now - self.last)
+        self.last = now
+
+    def _distribution(self):
+        from statistics import NormalDist  # Seul le détecteur phi en a besoin
+
+        n = len(self.intervals)
+        mean = sum(self.intervals) / n
+        variance = sum((x - mean) ** 2 for x in self.intervals) / n
+        return NormalDist(mean, max(math.sqrt(variance), self.min_std))
+
+    def phi(self, now):
+        if self.last is None:
+            return 0.0
+        p_later = 1 - self._distribution().cdf(now - self.last)
+        return -math.log10(max(p_later, 1e-300))
+
+    def deadline(self):
+        """Instant où phi atteint le seuil."""
+        elapsed = self._distribution().inv_cdf(min(1 - 10 ** -self.threshold, 1 - 1e-15))
+        return self.last + elapsed
+
+    def is_available(self, now):
+        # Même frontière que ``deadline()`` : comparer phi au seuil laisserait, à
+        # l'arrondi près, le pair disponible à l'échéance et la vérification se
+        # replanifierait au même instant indéfiniment
+        return self.last is None or now < self.deadline()
+
+
+def make_detector(kind, interval, rtt=None, threshold=8.0):
+    """Construit le détecteur choisi par configuration ("timeout" ou "phi")."""
+    if kind == "phi":
+        return PhiAccrualDetector(interval, threshold=threshold)
+    if kind == "timeout":
+        return TimeoutDetector(interval, rtt=rtt)
+    raise ValueError(f"Détecteur inconnu : {kind}")
@@ -0,0 +1,133 @@
+import argparse
+import time
+
+import numpy as np
+
+from supervisor import TICK
+
+# Table des appareils en colonnes NumPy : une ligne par appareil, un tableau
+# par champ (dernier battement, intervalle attendu, numéro de séquence, état,
+# échéance). La recherche des appareils en panne est une seule comparaison
+# vectorisée sur la colonne des échéances, quel que soit le nombre d'appareils ;
+# seules les lignes expirées sont ensuite touchées en Python (alertes). Un
+# appareil en panne a une échéance infinie : il n'est signalé qu'une fois.
+#
+# La table respecte aussi le contrat de ``supervisor.TimerWheel`` (``schedule``,
+# ``cancel``, ``advance``, ``tick``) et peut donc la remplacer dans le
+# superviseur (``cli.py supervisor --liveness table``).
+
+UNKNOWN, ALIVE, DOWN = 0, 1, 2  # Valeurs de la colonne ``status``
+
+
+class DeviceTable:
+    """Appareils en colonnes ; ``grace`` intervalles sans battement font une panne."""
+
+    def __init__(self, interval=60, grace=2.5, tick=TICK, capacity=1024):
+        self.interval = interval  # Intervalle attendu des nouveaux appareils
+        self.grace = grace
+        self.tick = tick
+        self.size = 0
+        self.ids = []  # ligne -> identifiant d'appareil
+        self.rows = {}  # identifiant d'appareil -> ligne
+        self.last_seen = np.full(capacity, np.nan)  # Instant monotone du dernier battement
+        self.intervals = np.full(capacity, float(interval))
+        self.seq = np.zeros(capacity, dtype=np.int64)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self.deadline = np.full(capacity, np.inf)
+
+    def __len__(self):
+        """Nombre d'échéances armées, comme ``TimerWheel``."""
+        return int(np.count_nonzero(self.deadline[:self.size] != np.inf))
+
+    def _grow(self):
+        capacity = 2 * len(self.deadline)
+        for name, fill in (("last_seen", np.nan), ("intervals", float(self.interval)), ("seq", 0), ("status", UNKNOWN),
+                           ("deadline", np.inf)):
+            column = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def row(self, device_id, interval=None):
+        """Ligne de ``device_id``, ajoutée au besoin."""
+        row = self.rows.get(device_id)
+        if row is None:
+            if self.size == len(self.deadline):
+                self._grow()
+            row = self.rows[device_id] = self.size
+            self.ids.append(device_id)
+            self.size += 1
+        if interval is not None:
+            self.intervals[row] = interval
+        return row
+
+    def heartbeat(self, device_id, seq, now):
+        """Battement ``seq`` de ``device_id`` reçu à ``now`` : réarme son échéance."""
+        row = self.row(device_id)
+        self.last_seen[row] = now
+        if seq is not None:
+            self.seq[row] = seq
+        self.status[row] = ALIVE
+        self.deadline[row] = now + self.grace * self.intervals[row]
+        return row
+
+    def sweep(self, now):
+        """Lignes des appareils dont l'échéance est passée, marqués en panne."""
+        expired = np.flatnonzero(self.deadline[:self.size] <= now)
+        if expired.size:
+            self.deadline[expired] = np.inf
+            self.status[expired] = DOWN
+        return expired
+
+    # Contrat de TimerWheel
+    def schedule(self, key, deadline):
+        row = self.row(key)
+        self.deadline[row] = deadline
+        self.status[row] = ALIVE
+
+    def cancel(self, key):
+        row = self.rows.get(key)
+        if row is not None:
+            self.deadline[row] = np.inf
+
+    def advance(self, now):
+        return [self.ids[row] for row in self.sweep(now)]
+
+
+def benchmark(devices=1_000_000, expired=0.001, sweeps=50):
+    """Coût d'un balayage de ``devices`` appareils dont la fraction ``expired`` est en panne.
+
+    Retourne (médiane, pire cas) en millisecondes, alertes comprises (lecture
+    des identifiants et des numéros de séquence des seules lignes expirées).
+    """
+    table = DeviceTable(interval=60, capacity=devices)
+    rng = np.random.default_rng(0)
+    table.ids = [f"dev{row}" for row in range(devices)]
+    table.rows = {device_id: row for row, device_id in enumerate(table.ids)}
+    table.size = devices
+    table.status[:] = ALIVE
+    table.last_seen[:] = rng.uniform(0, 60, devices)
+    table.deadline[:] = table.last_seen + table.grace * table.intervals
+    late = rng.choice(devices, int(devices * expired), replace=False)
+
+    timings = []
+    for _ in range(sweeps):
+        table.deadline[late] = 0.0  # Les mêmes appareils redeviennent en retard
+        start = time.perf_counter()
+        rows = table.sweep(100.0)  # Avant toutes les autres échéances (au moins 150 s)
+        alerts = [(table.ids[row], int(table.seq[row])) for row in rows]
+        timings.append(time.perf_counter() - start)
+        assert len(alerts) == len(late)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e3, timings[-1] * 1e3
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coût du balayage vectorisé de la table des appareils")
+    parser.add_argument("--devices", type=int, default=1_000_000)
+    parser.add_argument("--expired", type=float, default=0.001, help="fraction d'appareils en panne à chaque balayage")
+    parser.add_argument("--sweeps", type=int, default=50)
+    args = parser.parse_args()
+    median, worst = benchmark(args.devices, args.expired, args.sweeps)
+    print(f"✅ Balayage de {args.devices} appareils ({int(args.devices * args.expired)} en panne) : "
+          f"médiane {median:.2f} ms, pire {worst:.2f} ms")
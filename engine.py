@@ -0,0 +1,420 @@
+import random
+import time
+from datetime import datetime, timezone
+
+import frame
+from detector import ClockOffsetEstimator, RttEstimator, make_detector
+from metrics import PeerMetrics
+from peerstate import PeerState
+from scheduler import Scheduler
+from sequence import SequenceWindow, DUPLICATE, REORDERED, RESTARTED
+
+ROLES = ("iot", "vm")
+MIN_INTERVAL = 0.1  # Cadence minimale des battements : 100 ms
+
+
+class Transport:
+    """Interface d'un transport de battements (MQTT, CoAP, boucle locale...).
+
+    Le moteur appelle ``start(engine)`` puis ``send(payload)`` ; le transport
+    remet chaque battement reçu du pair par ``engine.receive(self, heartbeat,
+    received_time)`` (instant ``time.monotonic()``, depuis n'importe quel
+    thread) et signale une reconnexion par ``engine.reconnected(self, grace)``.
+
+    ``replies_inline`` : la réponse de la VM fait partie de l'échange (réponse
+    CoAP au POST), le moteur n'a donc pas à l'envoyer lui-même.
+    """
+
+    name = "transport"
+    replies_inline = False
+
+    def start(self, engine):
+        self.engine = engine
+
+    def send(self, payload):
+        """Envoie un battement ; retourne False s'il est mis en file (pas de RTT exact)."""
+        raise NotImplementedError
+
+    def available(self):
+        """Faux pendant une coupure connue : le silence du pair n'est alors pas une panne."""
+        return True
+
+    def reconnect_grace(self):
+        """Temps que peut prendre la reconnexion après une coupure (attente exponentielle)."""
+        return 0.0
+
+    def close(self):
+        pass
+
+
+class LoopbackTransport(Transport):
+    """Transport en mémoire entre deux moteurs du même processus (tests, bancs d'essai).
+
+    ``pair()`` retourne les deux extrémités ; un battement envoyé par l'une est
+    remis à l'autre après ``delay`` secondes sur le planificateur du destinataire,
+    ou perdu avec la probabilité ``loss``.
+    """
+
+    name = "loopback"
+
+    def __init__(self, delay=0.0, loss=0.0, rng=None):
+        self.delay = delay
+        self.loss = loss
+        self.rng = rng or random.Random()
+        self.peer = None
+        self.engine = None
+
+    @classmethod
+    def pair(cls, delay=0.0, loss=0.0, rng=None):
+        a, b = cls(delay, loss, rng), cls(delay, loss, rng)
+        a.peer, b.peer = b, a
+        return a, b
+
+    def send(self, payload):
+        peer = self.peer
+        if peer.engine is None or (self.loss and self.rng.random() < self.loss):
+            return True
+        scheduler = peer.engine.scheduler
+        scheduler.call_at(scheduler.clock() + self.delay, peer._deliver, bytes(payload))
+        return True
+
+    def _deliver(self, payload):
+        heartbeat = frame.decode(payload)
+        if heartbeat is not None and heartbeat.sender == self.engine.role:
+            return
+        self.engine.receive(self, heartbeat, self.engine.scheduler.clock())
+
+
+class Link:
+    """Surveillance du pair sur un transport : chaque lien a son détecteur,
+    son RTT, sa fenêtre de séquence et ses métriques."""
+
+    __slots__ = ("transport", "rtt", "clock", "detector", "window", "state", "metrics",
+                 "peer_check", "grace_until", "queued_seq", "alive", "unavailable_since")
+
+    def __init__(self, transport, role, device_id, interval, detector, phi_threshold, clock):
+        self.transport = transport
+        self.rtt = RttEstimator()
+        self.clock = ClockOffsetEstimator()  # Délais aller/retour à partir des horodatages du pair
+        self.detector = make_detector(detector, interval, self.rtt, phi_threshold)
+        self.window = SequenceWindow()  # Pertes, doublons et désordre des battements du pair
+        self.state = PeerState(history=100)  # Dernier battement reçu du pair, lisible depuis tout thread
+        self.metrics = PeerMetrics(transport.name, role, device_id)
+        self.metrics.track(self.window, lambda: self.state.last_time, clock)
+        self.peer_check = None
+        self.grace_until = 0.0  # Pas d'alerte avant cet instant (reconnexion récente)
+        self.queued_seq = 0  # Dernier battement mis en file pendant une coupure
+        self.alive = True
+        self.unavailable_since = None  # Début de la coupure du transport constatée par check_peer
+
+
+class HealthcheckEngine:
+    """Moteur de healthcheck commun à tous les transports, rôle "iot" ou "vm".
+
+    L'IoT envoie un battement numéroté toutes les ``interval`` secondes sur
+    chacun de ses transports, la VM y répond immédiatement sur le transport
+    d'arrivée ; chaque côté surveille l'autre avec un détecteur (``"timeout"``
+    ou ``"phi"``) par transport. Avec plusieurs transports les liens sont
+    redondants : un lien muet est signalé, l'alerte n'est levée que lorsque
+    plus aucun lien ne reçoit de battement. La surveillance continue après
+    l'alerte : un avis de rétablissement part quand les battements reprennent.
+    Un transport coupé (broker injoignable) suspend les alertes, mais pas
+    au-delà du délai du détecteur : passé ce délai, l'alerte désigne le
+    transport injoignable comme cause.
+
+    Le constructeur ne crée ni thread ni socket : tout est créé par ``start()``,
+    ce qui permet d'instancier des milliers de moteurs et de leur faire partager
+    un même ``Scheduler``.
+    """
+
+    def __init__(self, role, transports, device_id=None, interval=60, detector="timeout", phi_threshold=8.0,
+                 payload_format="binary", scheduler=None, alerts=None, log_writer=None, verbose=True):
+        if role not in ROLES:
+            raise ValueError("Rôle invalide. Utilisez 'iot' ou 'vm'.")
+        if not transports:
+            raise ValueError("Aucun transport.")
+        self.role = role
+        self.expected_sender = "iot" if role == "vm" else "vm"
+        self.device_id = device_id
+        self.interval = max(interval, MIN_INTERVAL)
+        self.detector_kind = detector
+        self.payload_format = payload_format
+        self.alerts = alerts
+        self.log_writer = log_writer
+        self.verbose = verbose
+
+        self._owns_scheduler = scheduler is None
+        self.scheduler = scheduler or Scheduler(clock=time.monotonic)
+        self.links = [Link(transport, role, device_id, self.interval, detector, phi_threshold, self.scheduler.clock)
+                      for transport in transports]
+        self._by_transport = {id(link.transport): link for link in self.links}
+        self.sequence = 0  # Numéro du dernier battement envoyé
+        self.stopped = False
+        self.peer_down = False  # Alerte envoyée, pas encore de rétablissement
+        self.outages = 0  # Alertes envoyées : distingue les clés de déduplication d'une panne à l'autre
+        self._next_send_at = None
+        self._next_send = None
+
+    # Raccourcis vers le premier lien, le seul dans le cas courant
+    @property
+    def transport(self):
+        return self.links[0].transport
+
+    @property
+    def window(self):
+        return self.links[0].window
+
+    @property
+    def state(self):
+        return self.links[0].state
+
+    @property
+    def metrics(self):
+        return self.links[0].metrics
+
+    @property
+    def detector(self):
+        return self.links[0].detector
+
+    @property
+    def rtt(self):
+        return self.links[0].rtt
+
+    @property
+    def clock(self):
+        return self.links[0].clock
+
+    def _print(self, message):
+        if self.verbose:
+            print(message)
+
+    def log(self, message, **fields):
+        if self.log_writer:
+            self.log_writer.write(message, **fields)
+
+    def _tag(self, link):
+        return f"{self.role.upper()}/{link.transport.name}" if len(self.links) > 1 else self.role.upper()
+
+    def start(self):
+        """Démarre les transports et planifie les premiers événements."""
+        for link in self.links:
+            link.transport.start(self)
+
+        self._print(f"🚀 [{self.role.upper()}] Démarrage du script...")
+        names = ", ".join(link.transport.name for link in self.links)
+        self._print(f"💓 Battement toutes les {self.interval:g} s, détecteur '{self.detector_kind}', transport(s) : {names}.")
+        if self.role == "iot":
+            self._print("🔵 IoT envoie les battements, la VM y répond.")
+            self.scheduler.call_soon_threadsafe(self.send_heartbeat)
+        else:
+            self._print("🔴 VM répond aux battements de l'IoT.")
+            # La surveillance démarre à la réception du premier battement de l'IoT
+
+    def run(self):
+        """Démarre le pair et bloque jusqu'à ``stop()`` (Ctrl+C pour la CLI)."""
+        self.start()
+        try:
+            self.scheduler.run()
+        finally:
+            self.close()
+
+    def stop(self):
+        """Arrête le pair ; arrête aussi le planificateur s'il lui est propre."""
+        self.stopped = True
+        if self._next_send:
+            self._next_send.cancel()
+        for link in self.links:
+            if link.peer_check:
+                link.peer_check.cancel()
+        if self._owns_scheduler:
+            self.scheduler.stop()
+
+    def close(self):
+        for link in self.links:
+            link.transport.close()
+
+    def receive(self, transport, heartbeat, received_time):
+        """Battement reçu par un transport (n'importe quel thread) : délègue au planificateur."""
+        self.scheduler.call_soon_threadsafe(self.handle_message, self._by_transport[id(transport)], heartbeat, received_time)
+
+    def receive_batch(self, transport, heartbeats, received_time):
+        """Plusieurs battements reçus d'un coup (lot d'une passerelle) : un seul réveil du planificateur."""
+        self.scheduler.call_soon_threadsafe(self._handle_batch, self._by_transport[id(transport)], heartbeats, received_time)
+
+    def _handle_batch(self, link, heartbeats, received_time):
+        for heartbeat in heartbeats:
+            self.handle_message(link, heartbeat, received_time)
+
+    def reconnected(self, transport, grace):
+        """Reconnexion d'un transport (n'importe quel thread) : laisser au pair le temps de revenir."""
+        self.scheduler.call_soon_threadsafe(self._start_grace, self._by_transport[id(transport)], grace)
+
+    def _start_grace(self, link, grace):
+        link.unavailable_since = None
+        link.grace_until = self.scheduler.clock() + grace + 2 * self.interval
+
+    def handle_message(self, link, heartbeat, received_time):
+        """Traite un battement reçu sur le thread du planificateur."""
+        if self.stopped:
+            return
+
+        # Vérifier qu'on a bien reçu le message de l'autre machine
+        if heartbeat is None or heartbeat.sender != self.expected_sender:
+            self._print(f"\n⚠️ [{self._tag(link)}] Dernier message reçu non conforme, ignoré.")
+            self.log("WARNING: Message non conforme ignoré.", event="invalid", transport=link.transport.name)
+            return
+
+        if heartbeat.seq is not None:
+            status = link.window.add(heartbeat.seq, heartbeat.timestamp_ns)
+            if status is RESTARTED:
+                self._print(f"🔄 [{self._tag(link)}] Redémarrage du pair détecté (battement #{heartbeat.seq}).")
+                self.log("WARNING: Redémarrage du pair détecté.", event="peer_restart", seq=heartbeat.seq,
+                         transport=link.transport.name)
+            if status is DUPLICATE:
+                self._print(f"♊ [{self._tag(link)}] Battement #{heartbeat.seq} reçu en double, ignoré.")
+                return
+            if status is REORDERED:
+                self._print(f"🔀 [{self._tag(link)}] Battement #{heartbeat.seq} reçu dans le désordre.")
+
+        link.unavailable_since = None
+        link.metrics.received.inc()
+        link.state.record(heartbeat, received_time)
+        if not link.alive:
+            link.alive = True
+            self._print(f"✅ [{self._tag(link)}] Le lien reçoit de nouveau les battements.")
+            if self.peer_down:
+                self.recovered(link)
+
+        # Messages formatés seulement s'ils sont affichés ou journalisés (chemin chaud à grande échelle)
+        if self.verbose or self.log_writer:
+            description = frame.describe(heartbeat)
+            self._print(f"📩 {description}")
+            self.log(f"RECEIVED: {description}", event="received", sender=heartbeat.sender,
+                     seq=heartbeat.seq, transport=link.transport.name)
+
+        if self.role == "vm":
+            if not link.transport.replies_inline:
+                # La VM répond immédiatement à chaque battement, dans le format de l'IoT
+                if heartbeat.timestamp_ns is None:
+                    reply = frame.encode_text("vm", heartbeat.seq)
+                else:
+                    reply = frame.encode("vm", heartbeat.seq, echo_ns=heartbeat.timestamp_ns)
+                link.transport.send(reply)
+            link.metrics.sent.inc()
+            if self.log_writer:
+                self.log(f"SENT: [from: vm] #{heartbeat.seq}", event="sent", sender="vm", seq=heartbeat.seq,
+                         transport=link.transport.name)
+        elif heartbeat.echo_ns and heartbeat.seq > link.queued_seq:
+            # RTT exact (sauf pour les battements restés en file pendant une coupure) : l'horodatage d'envoi de l'IoT revient en écho dans la réponse
+            rtt = received_time - heartbeat.echo_ns / 1e9
+            link.rtt.add(rtt)
+            link.metrics.rtt.observe(rtt)
+            if heartbeat.timestamp_ns and link.clock.add(heartbeat.echo_ns / 1e9, heartbeat.timestamp_ns / 1e9, received_time):
+                link.metrics.observe_clock(link.clock)
+                self._print(f"⏱️ RTT {rtt * 1e3:.1f} ms : aller ~{link.clock.outbound * 1e3:.1f} ms, "
+                            f"retour ~{link.clock.inbound * 1e3:.1f} ms")
+
+        link.detector.heartbeat(received_time)
+        self.schedule_peer_check(link)
+
+    def schedule_peer_check(self, link):
+        """(Re)planifie la vérification du pair à l'échéance du détecteur du lien."""
+        if link.peer_check:
+            link.peer_check.cancel()
+        link.peer_check = self.scheduler.call_at(link.detector.deadline(), self.check_peer, link)
+
+    def check_peer(self, link):
+        """Échéance du détecteur : le pair n'a pas répondu à temps sur ce lien."""
+        now = self.scheduler.clock()
+        if link.detector.is_available(now):
+            self.schedule_peer_check(link)
+            return
+        unreachable = not link.transport.available()
+        if unreachable:
+            # Transport coupé : le silence du pair n'est pas une panne, tant que la coupure ne dure
+            # pas plus que le délai du détecteur, un battement et le temps de se reconnecter
+            if link.unavailable_since is None:
+                link.unavailable_since = now
+            limit = (link.unavailable_since + link.detector.deadline() - link.detector.last + self.interval
+                     + link.transport.reconnect_grace())
+            if now < limit:
+                link.peer_check = self.scheduler.call_at(min(now + self.interval, limit), self.check_peer, link)
+                return
+        elif now < link.grace_until:
+            # Reconnexion récente : on laisse au pair le temps de revenir
+            link.peer_check = self.scheduler.call_at(max(now + self.interval, link.grace_until), self.check_peer, link)
+            return
+
+        if link.alive:
+            link.alive = False
+            if any(other.alive for other in self.links):
+                others = ", ".join(other.transport.name for other in self.links if other.alive)
+                self._print(f"⚠️ [{self._tag(link)}] Lien muet, pair toujours joignable via {others}.")
+                self.log(f"WARNING: Lien {link.transport.name} muet.", event="link_down", transport=link.transport.name)
+        if any(other.alive for other in self.links):
+            link.peer_check = self.scheduler.call_at(now + self.interval, self.check_peer, link)
+            return
+
+        # Plus aucun lien : une seule alerte, puis on attend le retour du pair (handle_message)
+        link.peer_check = None
+        if self.peer_down:
+            return
+        self.peer_down = True
+        self.outages += 1
+        if unreachable:
+            cause = f"❌ Transport {link.transport.name} injoignable depuis {now - link.unavailable_since:.0f} s (broker ou réseau)."
+        else:
+            cause = "❌ Message non reçu."
+        alert_message = f"🚨 **[{self.role.upper()}] Problème détecté !**\n📅 {datetime.now(timezone.utc).strftime('%d/%m/%Y %H:%M:%S UTC')}\n{cause}\n📉 {link.window.summary()}"
+        self._print(alert_message)
+        if self.alerts:
+            self.alerts.send(alert_message, key=f"down:{self.role}:{self.device_id or ''}:{self.outages}")
+        if unreachable:
+            self.log(f"ERROR: Transport {link.transport.name} injoignable.", event="unreachable",
+                     transport=link.transport.name)
+        else:
+            self.log("ERROR: Message manquant.", event="error")
+
+    def recovered(self, link):
+        """Premier battement après une alerte : avis de rétablissement."""
+        self.peer_down = False
+        message = (f"✅ **[{self.role.upper()}] Rétablissement !**\n📅 {datetime.now(timezone.utc).strftime('%d/%m/%Y %H:%M:%S UTC')}\n"
+                   f"📈 Battements de nouveau reçus via {link.transport.name}.")
+        self._print(message)
+        if self.alerts:
+            self.alerts.send(message, key=f"up:{self.role}:{self.device_id or ''}:{self.outages}")
+        self.log("INFO: Pair de nouveau joignable.", event="recovered", transport=link.transport.name)
+
+    def send_heartbeat(self):
+        """[IoT] Envoie un battement toutes les ``interval`` secondes, sur chaque transport."""
+        if self.stopped:
+            return
+        self.sequence += 1
+        now = self.scheduler.clock()
+        if self.payload_format == "text":
+            payload = frame.encode_text("iot", self.sequence)
+        else:
+            payload = frame.encode("iot", self.sequence, int(now * 1e9))
+
+        queued = []
+        for link in self.links:
+            if not link.transport.send(payload):
+                link.queued_seq = self.sequence
+                queued.append(link.transport.name)
+            link.metrics.sent.inc()
+            if link.detector.last is None:
+                # Premier envoi : le délai de détection part de maintenant
+                link.detector.heartbeat(now)
+                self.schedule_peer_check(link)
+        if len(queued) == len(self.links):
+            # Transport(s) coupé(s) : le battement partira à la reconnexion, s'il n'est pas écarté d'ici là
+            self._print(f"📦 [from: iot] #{self.sequence} mis en file")
+            self.log(f"QUEUED: [from: iot] #{self.sequence}", event="queued", sender="iot", seq=self.sequence)
+        else:
+            suffix = f" (en file sur {', '.join(queued)})" if queued else ""
+            self._print(f"📤 [from: iot] #{self.sequence}{suffix}")
+            self.log(f"SENT: [from: iot] #{self.sequence}{suffix}", event="sent", sender="iot", seq=self.sequence)
+
+        # Cadence fixe, sans dérive : on se cale sur l'instant prévu et non sur l'instant réel
+        self._next_send_at = (self._next_send_at or now) + self.interval
+        self._next_send = self.scheduler.call_at(self._next_send_at, self.send_heartbeat)
@@ -0,0 +1,107 @@
+import struct
+import time
+from collections import namedtuple
+
+# Trame binaire de battement, taille fixe (44 octets), ordre réseau :
+#   magic "HB" | version (u8) | statut (u8) | expéditeur (16 octets, complété par des \0)
+#   | numéro de séquence (u64) | horodatage d'envoi monotone en ns (u64)
+#   | horodatage en écho de la trame à laquelle on répond, en ns (u64, 0 si aucune)
+MAGIC = b"HB"
+VERSION = 1
+FRAME = struct.Struct("!2sBB16sQQQ")
+
+STATUS_OK = 0
+STATUS_DEGRADED = 1
+STATUS_ERROR = 2
+STATUS_NAMES = {STATUS_OK: "OK", STATUS_DEGRADED: "DEGRADED", STATUS_ERROR: "ERROR"}
+
+Heartbeat = namedtuple("Heartbeat", "sender seq timestamp_ns echo_ns status")
+
+# Lot de battements relayés par une passerelle, en un seul POST :
+#   magic "HBL" | version (u8) | nombre d'enregistrements (u32)
+#   puis, pour chaque enregistrement : identifiant d'appareil (32 octets, complété
+#   par des \0) suivi d'une trame ``FRAME``. Taille fixe par enregistrement : le lot
+#   se décode d'un seul ``iter_unpack``, sans analyse champ par champ en Python.
+BATCH_MAGIC = b"HBL"
+BATCH_HEADER = struct.Struct("!3sBI")
+BATCH_RECORD = struct.Struct("!32s" + FRAME.format[1:])
+
+
+def encode(sender, seq, timestamp_ns=None, echo_ns=0, status=STATUS_OK):
+    """Construit une trame binaire. ``sender`` est une chaîne, tronquée à 16 octets en UTF-8."""
+    if timestamp_ns is None:
+        timestamp_ns = time.monotonic_ns()
+    return FRAME.pack(MAGIC, VERSION, status, sender.encode(), seq, timestamp_ns, echo_ns)
+
+
+def encode_text(sender, seq, status=STATUS_OK):
+    """Ancien format texte, pour les pairs qui ne comprennent pas les trames binaires."""
+    stamp = time.strftime('%d/%m/%Y %H:%M:%S', time.gmtime())
+    msg = f"[from: {sender}] [{stamp}] : {STATUS_NAMES[status]}"
+    if seq is not None:
+        msg += f" #{seq}"
+    return msg.encode()
+
+
+def is_frame(payload):
+    return len(payload) == FRAME.size and payload[:2] == MAGIC
+
+
+def decode(payload):
+    """Décode une trame binaire, ou à défaut un message texte de l'ancien format.
+
+    Les champs binaires sont lus directement dans ``payload`` (bytes, bytearray
+    ou memoryview) sans copie intermédiaire. Retourne ``None`` si le message
+    n'est pas reconnu.
+    """
+    if is_frame(payload):
+        _, version, status, sender, seq, timestamp_ns, echo_ns = FRAME.unpack_from(payload)
+        if version != VERSION:
+            return None
+        return Heartbeat(sender.rstrip(b"\0").decode(), seq, timestamp_ns, echo_ns or None, status)
+    return decode_text(bytes(payload).decode("utf-8", "replace"))
+
+
+def encode_batch(records):
+    """Construit un lot à partir de couples (device_id, trame ``encode()``)."""
+    records = list(records)
+    parts = [BATCH_HEADER.pack(BATCH_MAGIC, VERSION, len(records))]
+    parts += [device_id.encode()[:32].ljust(32, b"\0") + payload for device_id, payload in records]
+    return b"".join(parts)
+
+
+def decode_batch(payload):
+    """Décode un lot ; retourne une liste de couples (device_id, Heartbeat).
+
+    Lève ``ValueError`` si l'en-tête, la taille ou la version est invalide. Les
+    enregistrements dont la trame n'est pas reconnue sont ignorés.
+    """
+    view = memoryview(payload)
+    if len(view) < BATCH_HEADER.size:
+        raise ValueError("Lot trop court")
+    magic, version, count = BATCH_HEADER.unpack_from(view)
+    body = view[BATCH_HEADER.size:]
+    if magic != BATCH_MAGIC or version != VERSION:
+        raise ValueError("En-tête de lot invalide")
+    if len(body) != count * BATCH_RECORD.size:
+        raise ValueError(f"Lot tronqué : {count} enregistrements annoncés, {len(body)} octets reçus")
+    return [(device_id.rstrip(b"\0").decode("utf-8", "replace"),
+             Heartbeat(sender.rstrip(b"\0").decode("utf-8", "replace"), seq, timestamp_ns, echo_ns or None, status))
+            for device_id, magic, version, status, sender, seq, timestamp_ns, echo_ns in BATCH_RECORD.iter_unpack(body)
+            if magic == MAGIC and version == VERSION]
+
+
+def decode_text(msg):
+    """Décode un message texte ``[from: <expéditeur>] ... : OK #<n>``."""
+    if not msg.startswith("[from: "):
+        return None
+    sender = msg[7:msg.find("]")]
+    _, sep, seq = msg.rpartition(" #")
+    seq = int(seq) if sep and seq.isdigit() else None
+    status = next((code for code, name in STATUS_NAMES.items() if f" : {name}" in msg), STATUS_OK)
+    return Heartbeat(sender, seq, None, None, status)
+
+
+def describe(heartbeat):
+    """Représentation lisible d'un battement pour l'affichage et les logs."""
+    return f"[from: {heartbeat.sender}] #{heartbeat.seq} : {STATUS_NAMES.get(heartbeat.status, heartbeat.status)}"
@@ -0,0 +1,142 @@
+import time
+
+import frame
+from connection import MqttConnection, default_client_id
+from engine import HealthcheckEngine, Transport
+from metrics import RECONNECTS
+
+# Configuration par défaut
+BROKER = "20.107.241.46"  # IP de la VM Azure
+PORT = 1883
+TOPIC = "iot/healthcheck"
+
+
+class MqttTransport(Transport):
+    """Battements sur un topic MQTT (en TLS si ``tls``), partagé par l'IoT et la VM.
+
+    La connexion (``MqttConnection``) se reconnecte seule et garde en file les
+    battements publiés pendant une coupure ; ``available()`` est faux tant
+    qu'elle est coupée.
+    """
+
+    def __init__(self, broker=BROKER, port=PORT, topic=TOPIC, qos=0, client_id=None, username=None, password=None,
+                 tls=False, ca_certs=None, tls13_only=False, protocol="3.1.1", session_expiry=3600, max_queue=1000,
+                 threaded=True, verbose=True):
+        self.name = "mqtts" if tls else "mqtt"
+        self.broker = broker
+        self.port = port
+        self.topic = topic
+        self.qos = qos
+        self.client_id = client_id
+        self.username = username
+        self.password = password
+        self.tls = tls
+        self.ca_certs = ca_certs
+        self.tls13_only = tls13_only
+        self.protocol = protocol
+        self.session_expiry = session_expiry
+        self.max_queue = max_queue
+        self.threaded = threaded  # Sinon l'appelant pilote la boucle réseau (``connection.loop()``)
+        self.verbose = verbose
+        self.engine = None
+        self.connection = None
+        self._reconnects = None
+
+    def _print(self, message):
+        if self.verbose:
+            print(message)
+
+    def create_connection(self):
+        return MqttConnection(
+            self.client_id, self.broker, self.port, username=self.username, password=self.password,
+            tls=self.tls, ca_certs=self.ca_certs, tls13_only=self.tls13_only, protocol=self.protocol, session_expiry=self.session_expiry,
+            max_queue=self.max_queue, on_connect=self.on_connect, on_message=self.on_message,
+            verbose=self.verbose,
+        )
+
+    def start(self, engine):
+        self.engine = engine
+        self.client_id = self.client_id or default_client_id(f"healthcheck-{engine.role}", engine.device_id)
+        self._reconnects = RECONNECTS.labels(engine.role, engine.device_id or "")
+        self.connection = self.create_connection()
+        self.connection.subscribe(self.topic, self.qos)
+        if self.threaded:
+            self.connection.start()
+        else:
+            self.connection.connect()
+
+    def send(self, payload):
+        return self.connection.publish(self.topic, payload, self.qos)
+
+    def available(self):
+        return self.connection.connected
+
+    def reconnect_grace(self):
+        return self.connection.reconnect_grace()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    def on_connect(self, connection, session_present, reconnect):
+        """Connexion (ou reconnexion) au broker ; les abonnements sont renouvelés par la connexion."""
+        role = self.engine.role.upper()
+        if reconnect:
+            self._reconnects.inc()
+            self._print(f"🔁 [{role}] Reconnecté au broker MQTT (session {'reprise' if session_present else 'nouvelle'}).")
+            # Laisser au pair le temps de répondre avant de conclure à une panne
+            self.engine.reconnected(self, connection.reconnect_grace())
+        else:
+            self._print(f"✅ [{role}] Connecté au broker MQTT !\n\n")
+
+    def on_message(self, client, userdata, msg):
+        """Gère la réception des messages (thread paho) : délègue au moteur."""
+        received_time = time.monotonic()
+        heartbeat = frame.decode(msg.payload)
+
+        # Ignorer les messages envoyés par soi-même
+        if heartbeat and heartbeat.sender == self.engine.role:
+            return
+
+        self.engine.receive(self, heartbeat, received_time)
+
+
+class HealthcheckPeer(HealthcheckEngine):
+    """Pair de healthcheck MQTT, rôle "iot" ou "vm" : le moteur commun sur un
+    ``MqttTransport``, plus d'éventuels transports redondants (``extra_transports``).
+
+    Le topic est ``<topic>/<device_id>`` si ``device_id`` est donné (topic dédié
+    suivi par supervisor.py).
+    """
+
+    def __init__(self, role, broker=BROKER, port=PORT, topic=TOPIC, device_id=None,
+                 interval=60, detector="timeout", phi_threshold=8.0, payload_format="binary",
+                 username=None, password=None, tls=False, ca_certs=None, tls13_only=False, protocol="3.1.1", qos=0,
+                 client_id=None, session_expiry=3600, max_queue=1000, extra_transports=(),
+                 scheduler=None, alerts=None, log_writer=None, verbose=True):
+        mqtt_transport = MqttTransport(
+            broker, port, f"{topic}/{device_id}" if device_id else topic, qos, client_id=client_id,
+            username=username, password=password, tls=tls, ca_certs=ca_certs, tls13_only=tls13_only,
+            protocol=protocol, session_expiry=session_expiry, max_queue=max_queue, verbose=verbose,
+        )
+        super().__init__(role, [mqtt_transport, *extra_transports], device_id=device_id, interval=interval,
+                         detector=detector, phi_threshold=phi_threshold, payload_format=payload_format,
+                         scheduler=scheduler, alerts=alerts, log_writer=log_writer, verbose=verbose)
+        self.mqtt = mqtt_transport
+
+    @property
+    def connection(self):
+        return self.mqtt.connection
+
+    @property
+    def topic(self):
+        return self.mqtt.topic
+
+    def start(self, threaded=True):
+        """Connecte le pair et planifie ses premiers événements.
+
+        Avec ``threaded=False``, l'appelant pilote lui-même la boucle réseau
+        (``connection.loop()``).
+        """
+        self.mqtt.threaded = threaded
+        super().start()
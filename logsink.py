@@ -0,0 +1,124 @@
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+
+
+class LogWriter:
+    """Journal bufferisé avec rotation, remplace l'ouverture/fermeture du fichier à chaque ligne.
+
+    Les lignes sont accumulées en mémoire et écrites d'un bloc quand le tampon
+    dépasse ``buffer_size`` octets ou toutes les ``flush_interval`` secondes
+    (thread d'arrière-plan). Le fichier reste ouvert entre deux écritures. Il est
+    renommé en ``<fichier>.1`` (``.1.gz`` si ``compress``) quand il dépasse
+    ``max_bytes`` ou qu'il est plus vieux que ``rotate_interval`` secondes.
+
+    ``fmt="text"`` garde l'ancien format ``dd/mm/YYYY HH:MM:SS - message`` ;
+    ``fmt="json"`` écrit une ligne JSON par événement.
+    """
+
+    def __init__(self, path, fmt="text", buffer_size=64 * 1024, flush_interval=1.0,
+                 max_bytes=10 * 1024 * 1024, rotate_interval=None, backup_count=5, compress=False):
+        if fmt not in ("text", "json"):
+            raise ValueError(f"Format de log inconnu : {fmt}")
+        self.path = path
+        self.fmt = fmt
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self._buffer = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._opened_at = None
+        self._stamp_second = None
+        self._stamp = None
+        self._closed = threading.Event()
+        self._flusher = None
+
+    def _timestamp(self, now):
+        """Horodatage texte, recalculé au plus une fois par seconde."""
+        second = int(now)
+        if second != self._stamp_second:
+            self._stamp_second = second
+            self._stamp = time.strftime('%d/%m/%Y %H:%M:%S', time.gmtime(second))
+        return self._stamp
+
+    def write(self, message, **fields):
+        """Ajoute un événement au tampon ; ``fields`` n'est utilisé qu'en JSON."""
+        now = time.time()
+        if self.fmt == "json":
+            line = json.dumps({"ts": now, "msg": message, **fields}, ensure_ascii=False) + "\n"
+        else:
+            line = f"{self._timestamp(now)} - {message}\n"
+
+        with self._lock:
+            self._buffer.append(line)
+            self._buffered += len(line)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+                self._flusher.start()
+            if self._buffered >= self.buffer_size:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """Écrit le tampon et ferme le fichier."""
+        self._closed.set()
+        with self._lock:
+            self._flush_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._open()
+        elif self._should_rotate():
+            self._rotate()
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        self._buffer.clear()
+        self._buffered = 0
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.monotonic()
+
+    def _should_rotate(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.monotonic() - self._opened_at >= self.rotate_interval
+
+    def _rotate(self):
+        """Décale les anciennes archives (.1 -> .2 ...) puis archive le fichier courant."""
+        self._file.close()
+        suffix = ".gz" if self.compress else ""
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}{suffix}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}{suffix}")
+        if self.backup_count:
+            if self.compress:
+                with open(self.path, "rb") as source, gzip.open(f"{self.path}.1.gz", "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(self.path)
+            else:
+                os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
@@ -0,0 +1,299 @@
+import math
+import threading
+from bisect import bisect_left
+
+# Métriques en mémoire exposées au format texte Prometheus (ou OpenMetrics si le
+# client le demande), sans dépendance externe. L'enregistrement d'une mesure se
+# réduit à une addition sur un attribut : pas de verrou, pas de formatage, pas
+# d'allocation. Chaque série est supposée n'avoir qu'un seul thread écrivain
+# (le thread du planificateur, de la boucle réseau ou de l'envoi d'alertes).
+# Les valeurs déjà tenues ailleurs (pertes de SequenceWindow, âge du dernier
+# battement) sont lues seulement au moment de la collecte via ``set_function``.
+
+RTT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value != value:
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Value:
+    """Série simple (compteur ou jauge), éventuellement calculée à la collecte."""
+
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """La valeur sera ``function()`` au moment de la collecte."""
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Dernière case : au-delà de la plus grande borne
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """Famille de séries partageant un nom ; ``labels()`` retourne une série.
+
+    Les appelants fréquents gardent la série obtenue par ``labels()`` : la
+    recherche par étiquettes n'a lieu qu'une fois, pas à chaque mesure.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} attend les étiquettes {self.labelnames}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(tuple(str(value) for value in values), None)
+
+    def __getattr__(self, name):
+        # Famille sans étiquette : counter.inc() agit sur son unique série
+        if name in ("inc", "dec", "set", "set_function", "get", "observe"):
+            return getattr(self._children[()], name)
+        raise AttributeError(name)
+
+    def collect(self):
+        """Retourne (suffixe, étiquettes, valeur) pour chaque échantillon."""
+        with self._lock:
+            children = list(self._children.items())
+        samples = []
+        for values, child in children:
+            samples.append(("", _labels(self.labelnames, values), child.get()))
+        return samples
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def collect(self):
+        return [("_total", labels, value) for _, labels, value in super().collect()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=RTT_BUCKETS, registry=None):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def collect(self):
+        with self._lock:
+            children = list(self._children.items())
+        samples = []
+        for values, child in children:
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), child.counts):
+                cumulative += count
+                samples.append(("_bucket", _labels(self.labelnames, values, (("le", _format_value(bound)),)), cumulative))
+            labels = _labels(self.labelnames, values)
+            samples.append(("_sum", labels, child.sum))
+            samples.append(("_count", labels, child.count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrique déjà enregistrée : {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self, openmetrics=False):
+        """Texte d'exposition Prometheus 0.0.4, ou OpenMetrics 1.0."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            name = metric.name
+            if metric.kind == "counter" and not openmetrics:
+                name += "_total"
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for suffix, labels, value in metric.collect():
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Métriques du healthcheck, partagées par les pairs MQTT et CoAP et le superviseur
+HEARTBEATS_SENT = Counter("healthcheck_heartbeats_sent", "Battements envoyés.", ("transport", "role", "device"))
+HEARTBEATS_RECEIVED = Counter("healthcheck_heartbeats_received", "Battements reçus du pair.", ("transport", "role", "device"))
+HEARTBEATS_LOST = Counter("healthcheck_heartbeats_lost", "Battements du pair jamais reçus (sortis de la fenêtre de séquence).", ("transport", "role", "device"))
+HEARTBEATS_DUPLICATE = Counter("healthcheck_heartbeats_duplicate", "Battements du pair reçus en double.", ("transport", "role", "device"))
+HEARTBEAT_RTT = Histogram("healthcheck_heartbeat_rtt_seconds", "Temps aller-retour des battements.", ("transport", "role", "device"))
+PEER_LAST_SEEN_AGE = Gauge("healthcheck_peer_last_seen_age_seconds", "Temps écoulé depuis le dernier battement reçu du pair.", ("transport", "role", "device"))
+ONE_WAY_DELAY = Gauge("healthcheck_one_way_delay_seconds", "Dernier délai aller (out) ou retour (in) estimé à partir du décalage d'horloge.", ("transport", "role", "device", "direction"))
+CLOCK_OFFSET = Gauge("healthcheck_clock_offset_seconds", "Décalage estimé entre l'horloge monotone du pair et la nôtre.", ("transport", "role", "device"))
+RECONNECTS = Counter("healthcheck_reconnects", "Reconnexions au broker MQTT.", ("role", "device"))
+CONNECT_PHASE = Histogram("healthcheck_connect_phase_seconds", "Durée des étapes de connexion au broker (dns, tcp, tls, connack).", ("phase",))
+TLS_HANDSHAKES = Counter("healthcheck_tls_handshakes", "Poignées de main TLS, reprises de session ou complètes.", ("resumed",))
+SUPERVISOR_DEVICES = Gauge("healthcheck_supervisor_devices", "Appareils suivis par chaque worker du superviseur réparti.", ("shard", "state"))
+SUPERVISOR_HEARTBEATS = Counter("healthcheck_supervisor_heartbeats", "Battements traités par chaque worker du superviseur réparti.", ("shard",))
+SUPERVISOR_FORWARDED = Counter("healthcheck_supervisor_forwarded", "Battements transmis au worker propriétaire de l'appareil.", ("shard",))
+ALERT_ATTEMPTS = Counter("healthcheck_alert_attempts", "Tentatives d'envoi d'alertes Discord.", ("dispatcher",))
+ALERT_FAILURES = Counter("healthcheck_alert_failures", "Alertes Discord abandonnées après échec.", ("dispatcher",))
+
+
+class PeerMetrics:
+    """Séries d'un pair, résolues une fois pour toutes à sa création."""
+
+    __slots__ = ("sent", "received", "lost", "duplicates", "rtt", "last_seen_age", "outbound", "inbound",
+                 "clock_offset", "labels")
+
+    def __init__(self, transport, role, device=""):
+        self.labels = (transport, role, device or "")
+        self.sent = HEARTBEATS_SENT.labels(*self.labels)
+        self.received = HEARTBEATS_RECEIVED.labels(*self.labels)
+        self.lost = HEARTBEATS_LOST.labels(*self.labels)
+        self.duplicates = HEARTBEATS_DUPLICATE.labels(*self.labels)
+        self.rtt = HEARTBEAT_RTT.labels(*self.labels)
+        self.last_seen_age = PEER_LAST_SEEN_AGE.labels(*self.labels)
+        self.outbound = ONE_WAY_DELAY.labels(*self.labels, "out")
+        self.inbound = ONE_WAY_DELAY.labels(*self.labels, "in")
+        self.clock_offset = CLOCK_OFFSET.labels(*self.labels)
+
+    def track(self, window, last_seen, clock):
+        """Pertes, doublons et âge lus à la collecte : rien à faire dans ``on_message``.
+
+        ``last_seen()`` retourne l'instant du dernier battement (horloge ``clock``) ou None.
+        """
+        self.lost.set_function(lambda: window.lost)
+        self.duplicates.set_function(lambda: window.duplicates)
+
+        def age():
+            seen = last_seen()
+            return math.nan if seen is None else clock() - seen
+        self.last_seen_age.set_function(age)
+
+    def observe_clock(self, clock):
+        """Reporte les estimations d'un ``ClockOffsetEstimator``."""
+        self.outbound.set(clock.outbound)
+        self.inbound.set(clock.inbound)
+        self.clock_offset.set(clock.offset)
+
+    def remove(self):
+        for metric in (HEARTBEATS_SENT, HEARTBEATS_RECEIVED, HEARTBEATS_LOST, HEARTBEATS_DUPLICATE,
+                       HEARTBEAT_RTT, PEER_LAST_SEEN_AGE, CLOCK_OFFSET):
+            metric.remove(*self.labels)
+        for direction in ("out", "in"):
+            ONE_WAY_DELAY.remove(*self.labels, direction)
+
+
+def _handler(registry):
+    """Gestionnaire HTTP de ``/metrics`` ; ``http.server`` n'est importé qu'ici."""
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            body = registry.render(openmetrics).encode()
+            self.send_response(200)
+            if openmetrics:
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            else:
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Pas de ligne par requête de collecte dans le terminal
+
+    return MetricsHandler
+
+
+def start_http_server(port, addr="127.0.0.1", registry=REGISTRY):
+    """Sert ``/metrics`` sur un thread en arrière-plan ; retourne le serveur."""
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((addr, port), _handler(registry))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Métriques exposées sur http://{addr}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import ssl
+import struct
+
+# Broker MQTT minimal (3.1.1 et 5) pour les tests et benchmarks locaux, sans accès réseau.
+# Il gère CONNECT, PUBLISH (QoS 0/1/2 en entrée comme en sortie, sans
+# retransmission), SUBSCRIBE/UNSUBSCRIBE avec jokers "+" et "#" (et l'option
+# no_local de MQTT 5), les abonnements partagés ``$share/<groupe>/<filtre>``
+# (chaque message va à un seul membre du groupe, à tour de rôle), les messages
+# retenus, PINGREQ et DISCONNECT.
+# Les propriétés MQTT 5 d'un PUBLISH sont transmises telles quelles. Pas de
+# persistance ni d'authentification : ce n'est pas un remplaçant de mosquitto
+# en production.
+#
+# Avec --certfile/--keyfile il écoute en TLS (tickets de session activés) ; les
+# fichiers test_server.pem/test_server.key, signés par test_ca.pem, servent aux
+# essais locaux de automatic_secure.py :
+#   python minibroker.py --port 8883 --certfile test_server.pem --keyfile test_server.key
+#   python automatic_secure.py --broker localhost --port 8883 --ca-certs test_ca.pem --role iot
+# Pour les régénérer (validité 10 ans, SAN localhost/127.0.0.1/::1) :
+#   openssl req -x509 -newkey ec -pkeyopt ec_paramgen_curve:P-256 -nodes -days 3650 \
+#       -subj "/CN=Healthcheck Test CA" -keyout ca.key -out test_ca.pem
+#   openssl req -newkey ec -pkeyopt ec_paramgen_curve:P-256 -nodes -subj "/CN=localhost" \
+#       -keyout test_server.key -out server.csr
+#   openssl x509 -req -in server.csr -CA test_ca.pem -CAkey ca.key -days 3650 -out test_server.pem \
+#       -extfile <(echo "subjectAltName=DNS:localhost,IP:127.0.0.1,IP:::1")
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+MQTT_V5 = 5
+NO_LOCAL = 0x04  # Option d'abonnement MQTT 5 : ne pas renvoyer ses propres publications
+
+
+def encode_length(length):
+    """Longueur restante encodée sur 1 à 4 octets (7 bits par octet)."""
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def decode_varint(data, pos):
+    value, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_string(value):
+    if isinstance(value, str):
+        value = value.encode()
+    return struct.pack("!H", len(value)) + value
+
+
+def decode_string(data, pos):
+    (length,) = struct.unpack_from("!H", data, pos)
+    pos += 2
+    return bytes(data[pos:pos + length]), pos + length
+
+
+def packet(kind, flags, body):
+    return bytes([kind << 4 | flags]) + encode_length(len(body)) + body
+
+
+def topic_matches(topic_filter, topic):
+    """Vrai si ``topic`` correspond au filtre MQTT ``topic_filter`` (jokers + et #)."""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    if topic.startswith("$") and filter_parts[0] in ("+", "#"):
+        return False
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class Session:
+    """Une connexion client : abonnements et flux d'écriture."""
+
+    def __init__(self, broker, writer):
+        self.broker = broker
+        self.writer = writer
+        self.client_id = None
+        self.version = 4
+        self.subscriptions = {}  # filtre -> options (QoS maximale sur les bits 0-1, NO_LOCAL)
+        self.next_id = 0
+
+    def packet_id(self):
+        self.next_id = self.next_id % 65535 + 1
+        return self.next_id
+
+    def send(self, data):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    def deliver(self, topic, payload, qos, retain, properties):
+        body = encode_string(topic)
+        flags = qos << 1 | retain
+        if qos:
+            body += struct.pack("!H", self.packet_id())
+        if self.version == MQTT_V5:
+            body += encode_length(len(properties)) + properties
+        self.send(packet(PUBLISH, flags, body + payload))
+
+
+class MiniBroker:
+    def __init__(self):
+        self.sessions = set()
+        self.by_client_id = {}  # Un seul client connecté par identifiant
+        self.retained = {}
+        self.exact = {}  # topic -> {session: options}, abonnements sans joker
+        self.wildcards = {}  # filtre avec joker -> {session: options}
+        self.shared = {}  # (groupe, filtre) -> {session: options}, abonnements $share
+        self._turns = {}  # (groupe, filtre) -> nombre de messages déjà distribués au groupe
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=1883, ssl_context=None):
+        self.server = await asyncio.start_server(self.handle, host, port, ssl=ssl_context)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        for session in list(self.sessions):
+            session.writer.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        session = Session(self, writer)
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                # Traiter tous les paquets complets reçus d'un coup
+                pos = 0
+                while len(buffer) - pos >= 2:
+                    try:
+                        length, start = decode_varint(buffer, pos + 1)
+                    except IndexError:
+                        break
+                    if len(buffer) < start + length:
+                        break
+                    header = buffer[pos]
+                    body = bytes(buffer[start:start + length])
+                    pos = start + length
+                    if not self.dispatch(session, header >> 4, header & 0x0F, body):
+                        return
+                del buffer[:pos]
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.forget(session)
+            writer.close()
+
+    def forget(self, session):
+        self.sessions.discard(session)
+        if self.by_client_id.get(session.client_id) is session:
+            del self.by_client_id[session.client_id]
+        for topic_filter in session.subscriptions:
+            self._unindex(session, topic_filter)
+
+    def _table(self, topic_filter):
+        """Table d'index et clé d'un filtre d'abonnement."""
+        if topic_filter.startswith("$share/"):
+            _, group, shared_filter = topic_filter.split("/", 2)
+            return self.shared, (group, shared_filter)
+        return (self.wildcards if "+" in topic_filter or "#" in topic_filter else self.exact), topic_filter
+
+    def _index(self, session, topic_filter, options):
+        table, key = self._table(topic_filter)
+        table.setdefault(key, {})[session] = options
+
+    def _unindex(self, session, topic_filter):
+        table, key = self._table(topic_filter)
+        subscribers = table.get(key)
+        if subscribers is not None:
+            subscribers.pop(session, None)
+            if not subscribers:
+                del table[key]
+                self._turns.pop(key, None)
+
+    def dispatch(self, session, kind, flags, body):
+        """Traite un paquet ; retourne False pour fermer la connexion."""
+        if kind == CONNECT:
+            self.on_connect(session, body)
+        elif kind == PUBLISH:
+            self.on_publish(session, flags, body)
+        elif kind == PUBREL:
+            session.send(packet(PUBCOMP, 0, body[:2]))
+        elif kind == PUBREC:
+            # Accusé d'un message QoS 2 remis à l'abonné : il ne le traite qu'après ce PUBREL
+            session.send(packet(PUBREL, 0x02, body[:2]))
+        elif kind == SUBSCRIBE:
+            self.on_subscribe(session, body)
+        elif kind == UNSUBSCRIBE:
+            self.on_unsubscribe(session, body)
+        elif kind == PINGREQ:
+            session.send(packet(PINGRESP, 0, b""))
+        elif kind == DISCONNECT:
+            return False
+        return True
+
+    def on_connect(self, session, body):
+        _, pos = decode_string(body, 0)  # Nom du protocole
+        session.version = body[pos]
+        pos += 4  # version, drapeaux, keepalive
+        if session.version == MQTT_V5:
+            length, pos = decode_varint(body, pos)
+            pos += length
+        client_id, pos = decode_string(body, pos)
+        session.client_id = client_id.decode()
+        previous = self.by_client_id.get(session.client_id)
+        if previous is not None and session.client_id:
+            # Même identifiant : l'ancienne connexion (souvent à moitié fermée) est remplacée
+            self.forget(previous)
+            previous.writer.close()
+        self.by_client_id[session.client_id] = session
+        self.sessions.add(session)
+        ack = b"\x00\x00\x00" if session.version == MQTT_V5 else b"\x00\x00"
+        session.send(packet(CONNACK, 0, ack))
+
+    def on_publish(self, session, flags, body):
+        qos = flags >> 1 & 0x03
+        retain = flags & 0x01
+        topic, pos = decode_string(body, 0)
+        topic = topic.decode()
+        if qos:
+            packet_id = body[pos:pos + 2]
+            pos += 2
+        properties = b""
+        if session.version == MQTT_V5:
+            length, start = decode_varint(body, pos)
+            properties = bytes(body[start:start + length])
+            pos = start + length
+        payload = bytes(body[pos:])
+
+        if qos == 1:
+            session.send(packet(PUBACK, 0, packet_id))
+        elif qos == 2:
+            session.send(packet(PUBREC, 0, packet_id))
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos, properties)
+            else:
+                self.retained.pop(topic, None)
+        self.route(topic, payload, qos, properties, session)
+
+    def route(self, topic, payload, qos, properties, sender=None):
+        """Distribue un message : une recherche directe pour les topics exacts,
+        un parcours des seuls filtres à jokers. L'expéditeur ne reçoit pas ce
+        qui correspond à ses abonnements ``no_local``."""
+        targets = {}
+        exact = self.exact.get(topic)
+        matching = [exact] if exact else []
+        matching += [subscribers for topic_filter, subscribers in self.wildcards.items()
+                     if topic_matches(topic_filter, topic)]
+        for subscribers in matching:
+            for target, options in subscribers.items():
+                if target is sender and options & NO_LOCAL:
+                    continue
+                targets[target] = max(targets.get(target, 0), options & 0x03)
+        for key, subscribers in self.shared.items():
+            if topic_matches(key[1], topic):
+                # Un seul membre du groupe reçoit le message, à tour de rôle
+                turn = self._turns.get(key, 0)
+                self._turns[key] = turn + 1
+                target, options = list(subscribers.items())[turn % len(subscribers)]
+                targets[target] = max(targets.get(target, 0), options & 0x03)
+        for target, granted in targets.items():
+            target.deliver(topic, payload, min(qos, granted), 0, properties)
+
+    def on_subscribe(self, session, body):
+        packet_id = body[:2]
+        pos = 2
+        if session.version == MQTT_V5:
+            length, pos = decode_varint(body, pos)
+            pos += length
+        codes = bytearray()
+        new_filters = []
+        while pos < len(body):
+            topic_filter, pos = decode_string(body, pos)
+            options = body[pos] & (0x03 | NO_LOCAL) if session.version == MQTT_V5 else body[pos] & 0x03
+            qos = options & 0x03
+            pos += 1
+            topic_filter = topic_filter.decode()
+            session.subscriptions[topic_filter] = options
+            self._index(session, topic_filter, options)
+            if not topic_filter.startswith("$share/"):  # Pas de messages retenus pour un abonnement partagé
+                new_filters.append((topic_filter, qos))
+            codes.append(qos)
+        props = b"\x00" if session.version == MQTT_V5 else b""
+        session.send(packet(SUBACK, 0, packet_id + props + bytes(codes)))
+        for topic, (payload, qos, properties) in self.retained.items():
+            for topic_filter, sub_qos in new_filters:
+                if topic_matches(topic_filter, topic):
+                    session.deliver(topic, payload, min(qos, sub_qos), 1, properties)
+                    break
+
+    def on_unsubscribe(self, session, body):
+        packet_id = body[:2]
+        pos = 2
+        if session.version == MQTT_V5:
+            length, pos = decode_varint(body, pos)
+            pos += length
+        count = 0
+        while pos < len(body):
+            topic_filter, pos = decode_string(body, pos)
+            if session.subscriptions.pop(topic_filter.decode(), None) is not None:
+                self._unindex(session, topic_filter.decode())
+            count += 1
+        reasons = b"\x00" + b"\x00" * count if session.version == MQTT_V5 else b""
+        session.send(packet(UNSUBACK, 0, packet_id + reasons))
+
+
+def server_context(certfile, keyfile):
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+async def serve(host, port, ssl_context=None):
+    broker = MiniBroker()
+    port = await broker.start(host, port, ssl_context)
+    print(f"✅ Broker MQTT local en écoute sur {host}:{port}{' (TLS)' if ssl_context else ''}", flush=True)
+    await asyncio.get_running_loop().create_future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Broker MQTT minimal pour les tests locaux.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--certfile", help="certificat du serveur, active TLS")
+    parser.add_argument("--keyfile", help="clé privée du certificat")
+    args = parser.parse_args()
+    context = server_context(args.certfile, args.keyfile) if args.certfile else None
+    try:
+        asyncio.run(serve(args.host, args.port, context))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import deque
+
+# État partagé d'un pair (dernier battement reçu, compteur, historique borné).
+#
+# Modèle de concurrence : les écritures passent par ``record()``, sérialisées par
+# un verrou (plusieurs producteurs possibles : thread réseau paho, boucle
+# aiocoap, planificateur). Les lectures ne prennent jamais ce verrou :
+# ``snapshot()`` lit les champs entre deux lectures d'un compteur de version
+# (seqlock) et recommence si une écriture s'est glissée entre les deux. Un
+# lecteur (collecte des métriques, GET CoAP, affichage) obtient donc toujours
+# un état cohérent, sans jamais ralentir l'écrivain. Les lectures d'un seul
+# champ (``last_time``) restent directes : une affectation d'attribut est
+# atomique en CPython.
+
+
+class PeerSnapshot:
+    """Copie figée et cohérente d'un ``PeerState``."""
+
+    __slots__ = ("last_time", "last_heartbeat", "received", "history")
+
+    def __init__(self, last_time, last_heartbeat, received, history):
+        self.last_time = last_time
+        self.last_heartbeat = last_heartbeat
+        self.received = received
+        self.history = history  # Tuple de (instant, battement), du plus ancien au plus récent
+
+    def __repr__(self):
+        return f"PeerSnapshot(last_time={self.last_time!r}, received={self.received}, history={len(self.history)})"
+
+
+class PeerState:
+    """Dernier battement reçu d'un pair et historique des ``history`` derniers."""
+
+    __slots__ = ("last_time", "last_heartbeat", "received", "_history", "_version", "_lock")
+
+    def __init__(self, history=100):
+        self.last_time = None
+        self.last_heartbeat = None
+        self.received = 0
+        self._history = deque(maxlen=history)
+        self._version = 0  # Impair pendant une écriture
+        self._lock = threading.Lock()
+
+    def record(self, heartbeat, received_time):
+        """Enregistre un battement reçu à ``received_time`` (depuis n'importe quel thread)."""
+        with self._lock:
+            self._version += 1
+            self._history.append((received_time, heartbeat))
+            self.last_heartbeat = heartbeat
+            self.last_time = received_time
+            self.received += 1
+            self._version += 1
+
+    def record_many(self, heartbeats, received_time):
+        """Enregistre d'un bloc des battements reçus ensemble (lot d'une passerelle) :
+        un seul passage du verrou, les lecteurs voient tout le lot ou rien."""
+        if not heartbeats:
+            return
+        with self._lock:
+            self._version += 1
+            self._history.extend((received_time, heartbeat) for heartbeat in heartbeats)
+            self.last_heartbeat = heartbeats[-1]
+            self.last_time = received_time
+            self.received += len(heartbeats)
+            self._version += 1
+
+    def snapshot(self):
+        """Retourne un ``PeerSnapshot`` cohérent, sans bloquer les écritures."""
+        while True:
+            version = self._version
+            if version & 1:
+                time.sleep(0)  # Écriture en cours : céder le GIL à l'écrivain
+                continue
+            try:
+                snapshot = PeerSnapshot(self.last_time, self.last_heartbeat, self.received, tuple(self._history))
+            except RuntimeError:
+                continue  # deque modifiée pendant la copie
+            if self._version == version:
+                return snapshot
+
+
+def stress(threads=8, readers=2, seconds=2.0):
+    """Écritures concurrentes depuis ``threads`` producteurs pendant que ``readers``
+    threads prennent des instantanés ; vérifie qu'aucune écriture n'est perdue et
+    que chaque instantané est cohérent. Retourne (écritures, instantanés)."""
+    state = PeerState(history=64)
+    stop = threading.Event()
+    written = [0] * threads
+    snapshots = [0] * readers
+    errors = []
+
+    def produce(index):
+        seq = 0
+        while not stop.is_set():
+            seq += 1
+            state.record((index, seq), time.monotonic())
+        written[index] = seq
+
+    def consume(index):
+        while not stop.is_set():
+            snapshot = state.snapshot()
+            snapshots[index] += 1
+            if snapshot.history:
+                if snapshot.history[-1] != (snapshot.last_time, snapshot.last_heartbeat):
+                    errors.append(f"dernier battement incohérent : {snapshot!r}")
+                if len(snapshot.history) < min(snapshot.received, 64):
+                    errors.append(f"historique incomplet : {snapshot!r}")
+
+    workers = [threading.Thread(target=produce, args=(i,)) for i in range(threads)]
+    workers += [threading.Thread(target=consume, args=(i,)) for i in range(readers)]
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    if state.received != sum(written):
+        errors.append(f"écritures perdues : {state.received} enregistrées pour {sum(written)} envoyées")
+    if errors:
+        raise AssertionError("\n".join(errors[:10]))
+    return sum(written), sum(snapshots)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Test de charge concurrent de PeerState")
+    parser.add_argument("--threads", type=int, default=8, help="threads producteurs")
+    parser.add_argument("--readers", type=int, default=2, help="threads lecteurs (instantanés)")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    writes, reads = stress(args.threads, args.readers, args.seconds)
+    print(f"✅ {writes} écritures et {reads} instantanés cohérents en {args.seconds:g} s "
+          f"({args.threads} producteurs, {args.readers} lecteurs)")
@@ -0,0 +1,89 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class TimerHandle:
+    """Référence vers un appel planifié, permet de l'annuler."""
+
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """Boucle d'événements minimale pilotée par les échéances.
+
+    Le thread qui appelle ``run()`` dort jusqu'à la prochaine échéance
+    (créneau d'envoi, délai d'attente...) au lieu de se réveiller chaque seconde.
+    Les callbacks réseau (paho, aiocoap) tournent sur d'autres threads : ils
+    passent par ``call_soon_threadsafe()``, qui réveille la boucle immédiatement.
+    Tous les callbacks planifiés s'exécutent donc sur un seul thread.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._timers = []  # tas de (échéance, numéro, handle)
+        self._ready = deque()
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def call_at(self, when, callback, *args):
+        """Planifie ``callback(*args)`` à l'instant ``when`` (même horloge que ``clock``)."""
+        handle = TimerHandle(when, callback, args)
+        with self._cond:
+            heapq.heappush(self._timers, (when, next(self._counter), handle))
+            self._cond.notify()
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def call_soon_threadsafe(self, callback, *args):
+        """Exécute ``callback(*args)`` dès que possible sur le thread de la boucle."""
+        with self._cond:
+            self._ready.append((callback, args))
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _next_batch(self):
+        """Attend qu'il y ait quelque chose à exécuter et retourne la liste des appels prêts."""
+        with self._cond:
+            while not self._stopped:
+                now = self.clock()
+                while self._timers and (self._timers[0][2].cancelled or self._timers[0][0] <= now):
+                    _, _, handle = heapq.heappop(self._timers)
+                    if not handle.cancelled:
+                        self._ready.append((handle.callback, handle.args))
+                if self._ready:
+                    batch = list(self._ready)
+                    self._ready.clear()
+                    return batch
+                timeout = self._timers[0][0] - now if self._timers else None
+                self._cond.wait(timeout)
+            return None
+
+    def run(self):
+        """Exécute les callbacks jusqu'à l'appel de ``stop()``."""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            for callback, args in batch:
+                callback(*args)
+                if self._stopped:
+                    return
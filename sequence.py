@@ -0,0 +1,117 @@
+NEW = "new"
+REORDERED = "reordered"
+DUPLICATE = "duplicate"
+RESTARTED = "restarted"  # Le pair a redémarré : nouvelle numérotation, fenêtre remise à zéro
+
+
+class SequenceWindow:
+    """Suivi des numéros de séquence reçus d'un pair, par fenêtre glissante.
+
+    Même principe que l'anti-rejeu d'IPsec (RFC 4303) : un entier sert de bitmap
+    pour les ``size`` derniers numéros (bit 0 = plus grand numéro reçu). Un numéro
+    qui sort de la fenêtre sans avoir été reçu est compté comme perdu ; un numéro
+    reçu en retard mais encore dans la fenêtre est compté comme désordonné.
+
+    Un pair redémarré recommence à 1 : sans précaution, ses numéros déjà vus
+    seraient pris pour des doublons jusqu'à dépasser l'ancien maximum. Un
+    redémarrage est reconnu à un horodatage monotone du pair antérieur à celui
+    du premier battement de la session ; sans horodatage, à un 1 après un
+    maximum plus grand ou à un numéro très en dessous de la fenêtre. La fenêtre
+    repart alors de ce numéro (les compteurs restent cumulés).
+    """
+
+    __slots__ = ("size", "first", "highest", "bitmap", "received", "lost", "duplicates", "reordered",
+                 "first_timestamp", "expected", "restarts")
+
+    def __init__(self, size=64):
+        self.size = size
+        self.first = None  # Premier numéro observé : rien avant lui n'est compté comme perdu
+        self.highest = None
+        self.bitmap = 0
+        self.received = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.first_timestamp = None  # Horodatage du pair (ns) au premier battement de la session
+        self.expected = 0  # Numéros attendus pendant les sessions précédentes du pair
+        self.restarts = 0
+
+    def _start(self, seq, timestamp):
+        self.first = self.highest = seq
+        self.first_timestamp = timestamp
+        self.bitmap = 1
+        self.received += 1
+
+    def restarted(self, seq, timestamp=None):
+        """Vrai si ``seq`` (horodaté ``timestamp`` par le pair) vient d'un pair redémarré."""
+        if timestamp is not None and self.first_timestamp is not None:
+            # L'horloge du pair tranche : un horodatage postérieur au début de la session est
+            # un doublon ou un retard (redélivrance QoS 1 d'un 1 par exemple), jamais un redémarrage
+            return timestamp < self.first_timestamp
+        if seq >= self.highest:
+            return False
+        return seq == 1 or self.highest - seq >= self.size
+
+    def add(self, seq, timestamp=None):
+        """Enregistre ``seq`` et retourne NEW, REORDERED, DUPLICATE ou RESTARTED.
+
+        ``timestamp`` : horodatage monotone du pair (``Heartbeat.timestamp_ns``), s'il est connu.
+        """
+        if self.highest is None:
+            self._start(seq, timestamp)
+            return NEW
+        if self.restarted(seq, timestamp):
+            # Clôture de la session précédente : ses manquants sont définitivement perdus
+            self.lost += self.missing()
+            self.expected += self.highest - self.first + 1
+            self.restarts += 1
+            self._start(seq, timestamp)
+            return RESTARTED
+
+        if seq > self.highest:
+            shift = seq - self.highest
+            self._expire(shift)
+            self.bitmap = ((self.bitmap << shift) | 1) & ((1 << self.size) - 1)
+            self.highest = seq
+            self.received += 1
+            return NEW
+
+        offset = self.highest - seq
+        if seq < self.first or offset >= self.size:
+            # Trop ancien pour la fenêtre : impossible de distinguer un retard d'un doublon,
+            # le numéro reste compté comme perdu
+            self.reordered += 1
+            return REORDERED
+        if self.bitmap >> offset & 1:
+            self.duplicates += 1
+            return DUPLICATE
+        self.bitmap |= 1 << offset
+        self.reordered += 1
+        self.received += 1
+        return REORDERED
+
+    def _expire(self, shift):
+        """Compte comme perdus les numéros qui sortent de la fenêtre sans avoir été reçus."""
+        valid = min(self.size, self.highest - self.first + 1)
+        leaving_from = max(self.size - shift, 0)
+        if leaving_from < valid:
+            leaving = ((1 << valid) - 1) & ~((1 << leaving_from) - 1)
+            self.lost += (leaving & ~self.bitmap).bit_count()
+        if shift > self.size:
+            self.lost += shift - self.size
+
+    def missing(self):
+        """Numéros encore dans la fenêtre et pas (encore) reçus."""
+        if self.highest is None:
+            return 0
+        valid = min(self.size, self.highest - self.first + 1)
+        return valid - (self.bitmap & ((1 << valid) - 1)).bit_count()
+
+    def loss_rate(self):
+        """Proportion de numéros attendus jamais reçus (manquants de la fenêtre inclus)."""
+        if self.highest is None:
+            return 0.0
+        return (self.lost + self.missing()) / (self.expected + self.highest - self.first + 1)
+
+    def summary(self):
+        return f"pertes {self.loss_rate():.1%}, doublons {self.duplicates}, désordre {self.reordered}"
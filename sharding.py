@@ -0,0 +1,380 @@
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+from supervisor import DEVICE_TIMEOUT, TICK, TOPIC, Supervisor, down_alert, reachable_notice, unreachable_alert
+
+# Superviseur réparti sur plusieurs processus : un seul processus Python plafonne
+# à un cœur (GIL) dès qu'il faut décoder, répondre et tenir l'état de dizaines de
+# milliers d'appareils.
+#
+# Chaque worker a sa propre connexion au broker et le même abonnement partagé
+# ``$share/<groupe>/iot/healthcheck/+`` : le broker répartit les battements entre
+# les workers, qui les décodent et y répondent tous. L'état d'un appareil
+# (fenêtre de séquence, échéance) n'est tenu que par son worker propriétaire,
+# désigné par un anneau de hachage cohérent sur l'identifiant d'appareil ; un
+# battement reçu par un autre worker lui est transmis par lots (file
+# multiprocessing, au plus toutes les ``FORWARD_INTERVAL`` secondes).
+#
+# Avec ``coap_port``, le worker i sert aussi les ressources CoAP sur le port
+# ``coap_port + i`` : un appareil CoAP poste sur le port de son propriétaire
+# (``ShardRing(n).owner(device_id)``), un autre port reste accepté et transmis.
+#
+# Les workers envoient chaque seconde au processus parent un résumé (appareils
+# suivis, en panne, battements traités, nouveaux appareils, pannes et retours) ;
+# le parent tient les métriques agrégées, corrèle et envoie les alertes
+# (``correlation.AlertCorrelator``) et relance un worker arrêté.
+
+SHARE_GROUP = "healthcheck"
+REPORT_INTERVAL = 1.0  # Secondes entre deux résumés d'un worker
+FORWARD_INTERVAL = 0.05  # Délai maximal avant transmission au worker propriétaire
+FORWARD_BATCH = 512  # Transmission immédiate au-delà de ce nombre de battements en attente
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class ShardRing:
+    """Anneau de hachage cohérent : ``owner(device_id)`` est le worker propriétaire.
+
+    Avec ``replicas`` points virtuels par worker, la charge reste équilibrée et
+    changer le nombre de workers ne déplace qu'environ 1/N des appareils.
+    """
+
+    def __init__(self, shards, replicas=100):
+        if shards < 1:
+            raise ValueError("Il faut au moins un worker.")
+        points = sorted((_hash(f"shard-{shard}-{replica}"), shard) for shard in range(shards) for replica in range(replicas))
+        self.shards = shards
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def owner(self, device_id):
+        index = bisect.bisect(self._hashes, _hash(device_id))
+        return self._owners[index % len(self._owners)]
+
+
+class ShardWorker(Supervisor):
+    """Superviseur d'un worker : répond à tous les battements reçus, ne suit que
+    les appareils dont il est propriétaire et transmet les autres."""
+
+    def __init__(self, index, ring, connection, inboxes, reports, timeout=DEVICE_TIMEOUT, tick=TICK,
+                 log_writer=None, share_group=SHARE_GROUP, table=None):
+        super().__init__(connection, timeout=timeout, tick=tick, log_writer=log_writer,
+                         subscription=f"$share/{share_group}/{TOPIC}/+", table=table)
+        self.index = index
+        self.ring = ring
+        self.inboxes = inboxes
+        self.inbox = inboxes[index]
+        self.reports = reports
+        self._owners = {}  # device_id -> worker propriétaire (le hachage n'est calculé qu'une fois)
+        self._outbox = [[] for _ in inboxes]  # Battements à transmettre, par worker destinataire
+        self._pending = 0
+        self._next_forward = 0.0
+        self._coap = deque()  # (device_id, seq, instant, "coap", horodatage) remis par le thread du serveur CoAP
+        self._down_count = 0
+        self._received = 0  # Depuis le dernier résumé
+        self._forwarded = 0
+        self._added = []
+        self._down = []
+        self._up = []
+
+    def owner(self, device_id):
+        shard = self._owners.get(device_id)
+        if shard is None:
+            shard = self._owners[device_id] = self.ring.owner(device_id)
+        return shard
+
+    def record(self, device_id, seq, now, transport="mqtt", timestamp_ns=None):
+        shard = self.owner(device_id)
+        if shard != self.index:
+            # Le propriétaire écarte lui-même les doublons : on répond dans tous les cas
+            self._outbox[shard].append((device_id, seq, now, transport, timestamp_ns))
+            self._pending += 1
+            return True
+        if device_id not in self.devices:
+            self._added.append((device_id, self.broker_name(transport), transport))
+        accepted = super().record(device_id, seq, now, transport, timestamp_ns)
+        if accepted:
+            self._received += 1
+        return accepted
+
+    def recovered(self, state):
+        self._down_count -= 1
+        self._up.append(state.device_id)
+
+    def expire(self, device_id):
+        """Panne d'un appareil : signalée au parent, qui envoie l'alerte."""
+        state = self.devices[device_id]
+        state.alive = False
+        self._down_count += 1
+        self._down.append((device_id, state.window.summary(), state.last_seen))
+        if self.log_writer:
+            self.log_writer.write(f"ERROR: Message manquant ({device_id}).", event="error", sender=device_id)
+
+    def forward(self, now):
+        """Transmet les battements en attente à leurs workers propriétaires, par lots."""
+        if not self._pending or (now < self._next_forward and self._pending < FORWARD_BATCH):
+            return
+        for shard, records in enumerate(self._outbox):
+            if records:
+                self.inboxes[shard].put(records)
+                self._outbox[shard] = []
+        self._forwarded += self._pending
+        self._pending = 0
+        self._next_forward = now + FORWARD_INTERVAL
+
+    def drain(self):
+        """Traite les battements transmis par les autres workers et ceux reçus en CoAP."""
+        while self._coap:
+            self.record(*self._coap.popleft())
+        while not self.inbox.empty():
+            try:
+                records = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            for record in records:
+                self.record(*record)
+
+    def report(self):
+        self.reports.put({
+            "shard": self.index, "devices": len(self.devices), "down_devices": self._down_count,
+            "received": self._received, "forwarded": self._forwarded, "added": self._added, "down": self._down,
+            "up": self._up, "connected": self.connection.connected,
+        })
+        self._received = self._forwarded = 0
+        self._added, self._down, self._up = [], [], []
+
+    def start_coap_server(self, port):
+        """Sert les ressources CoAP des appareils sur ``port``, dans un thread à part."""
+        from aiocoap import Context
+        from coap_server import build_site
+
+        def on_heartbeat(device_id, heartbeat, received_time):
+            self._coap.append((device_id, heartbeat.seq, received_time, "coap", heartbeat.timestamp_ns))
+
+        def on_batch(records, received_time):
+            self._coap.extend((device_id, heartbeat.seq, received_time, "coap", heartbeat.timestamp_ns)
+                              for device_id, heartbeat in records)
+
+        async def serve():
+            await Context.create_server_context(build_site(on_heartbeat, on_batch=on_batch), bind=("::", port))
+            await asyncio.get_running_loop().create_future()
+
+        threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+
+    def run(self):
+        """Boucle du worker : réseau, transmissions, échéances, puis résumé périodique."""
+        next_report = time.monotonic() + REPORT_INTERVAL
+        while True:
+            self.connection.loop(timeout=min(self.wheel.tick, FORWARD_INTERVAL))
+            now = time.monotonic()
+            self.drain()
+            self.forward(now)
+            if self.connection.connected:
+                for device_id in self.wheel.advance(now):
+                    self.expire(device_id)
+            if now >= next_report:
+                self.report()
+                next_report = now + REPORT_INTERVAL
+
+
+def shard_path(path, index):
+    """Fichier de log propre au worker ``index`` (``vm.log`` -> ``vm.2.log``)."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}{ext}"
+
+
+def run_worker(index, shards, connection_options, options, inboxes, reports):
+    """Point d'entrée d'un processus worker."""
+    from connection import MqttConnection
+    from logsink import LogWriter
+
+    client_id = f"{connection_options['client_id']}-{index}"[:64]
+    connection = MqttConnection(**dict(connection_options, client_id=client_id, verbose=False))
+    log_writer = None
+    if options.get("log_file"):
+        log_writer = LogWriter(shard_path(options["log_file"], index), fmt=options.get("log_format", "text"))
+    table = None
+    if options.get("liveness") == "table":
+        from devicetable import DeviceTable
+        table = DeviceTable(interval=options["timeout"], grace=1.0, tick=options["tick"])
+    worker = ShardWorker(index, ShardRing(shards), connection, inboxes, reports, timeout=options["timeout"],
+                         tick=options["tick"], log_writer=log_writer, share_group=options["share_group"], table=table)
+    if options.get("coap_port"):
+        worker.start_coap_server(options["coap_port"] + index)
+    connection.connect()
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
+        if log_writer:
+            log_writer.close()
+
+
+class ShardedSupervisor:
+    """Rôle VM réparti sur ``workers`` processus (voir l'en-tête du module).
+
+    ``connection_options`` : arguments de ``MqttConnection`` (hors rappels),
+    l'identifiant de client reçoit le suffixe ``-<worker>``. Avec ``correlator``,
+    les pannes remontées par tous les workers sont corrélées ensemble. Quand
+    plus aucun worker n'est connecté au broker pendant plus de ``timeout``,
+    une seule alerte « broker injoignable » part (comme ``Supervisor``).
+    """
+
+    def __init__(self, workers, connection_options, timeout=DEVICE_TIMEOUT, tick=TICK, share_group=SHARE_GROUP,
+                 coap_port=None, liveness="wheel", alerts=None, log_writer=None, worker_log_file=None, worker_log_format="text",
+                 correlator=None):
+        self.ring = ShardRing(workers)
+        self.connection_options = connection_options
+        self.options = {"timeout": timeout, "tick": tick, "share_group": share_group, "coap_port": coap_port,
+                        "liveness": liveness, "log_file": worker_log_file, "log_format": worker_log_format}
+        self.alerts = alerts
+        self.log_writer = log_writer
+        self.correlator = correlator
+        # "spawn" : le parent a déjà des threads (alertes, métriques), un fork les copierait à moitié
+        self._context = multiprocessing.get_context("spawn")
+        self.inboxes = [self._context.Queue() for _ in range(workers)]
+        self.reports = self._context.Queue()
+        self.processes = [None] * workers
+        self.shards = {}  # worker -> dernier résumé reçu
+        self.shard_devices = [set() for _ in range(workers)]  # Appareils déclarés au corrélateur, par worker
+        self.broker = f"{connection_options['broker']}:{connection_options.get('port', 1883)}"
+        self._disconnected_at = None
+        self._outage_alerted = False
+
+    @property
+    def workers(self):
+        return self.ring.shards
+
+    def start_worker(self, index):
+        process = self._context.Process(
+            target=run_worker, name=f"supervisor-{index}", daemon=True,
+            args=(index, self.workers, self.connection_options, self.options, self.inboxes, self.reports),
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self.start_worker(index)
+        print(f"🧩 [VM] {self.workers} workers, abonnement partagé $share/{self.options['share_group']}/{TOPIC}/+")
+
+    def handle_report(self, report):
+        from metrics import SUPERVISOR_DEVICES, SUPERVISOR_FORWARDED, SUPERVISOR_HEARTBEATS
+
+        shard = str(report["shard"])
+        self.shards[report["shard"]] = report
+        SUPERVISOR_DEVICES.labels(shard, "alive").set(report["devices"] - report["down_devices"])
+        SUPERVISOR_DEVICES.labels(shard, "down").set(report["down_devices"])
+        SUPERVISOR_HEARTBEATS.labels(shard).inc(report["received"])
+        SUPERVISOR_FORWARDED.labels(shard).inc(report["forwarded"])
+        if self.correlator:
+            # Le broker est joignable tant qu'un worker au moins y est connecté
+            self.correlator.broker_connected(self.broker, any(r["connected"] for r in self.shards.values()))
+            for device_id, broker, transport in report["added"]:
+                self.correlator.register(device_id, broker, transport)
+                self.shard_devices[report["shard"]].add(device_id)
+        for device_id, summary, last_seen in report["down"]:
+            alert_message = down_alert(device_id, summary)
+            if self.log_writer:
+                self.log_writer.write(f"ERROR: Message manquant ({device_id}).", event="error", sender=device_id)
+            if self.correlator:
+                self.correlator.failed(device_id, alert_message)
+                continue
+            print(alert_message)
+            if self.alerts:
+                self.alerts.send(alert_message, key=f"down:{device_id}:{last_seen}")
+        for device_id in report["up"]:
+            if self.correlator:
+                self.correlator.recovered(device_id)
+            else:
+                print(f"✅ [VM] Appareil {device_id} de nouveau joignable.")
+
+    def check_broker(self, now):
+        """Alerte « broker injoignable » quand tous les workers restent déconnectés."""
+        if len(self.shards) < self.workers:
+            return  # Tous les workers n'ont pas encore rendu compte
+        if any(report["connected"] for report in self.shards.values()):
+            if self._outage_alerted:
+                self._alert(reachable_notice(self.broker, now - self._disconnected_at),
+                            key=f"up:broker:{self._disconnected_at}", log="INFO: Broker de nouveau joignable.",
+                            event="broker_up")
+            self._disconnected_at = None
+            self._outage_alerted = False
+            return
+        if self._disconnected_at is None:
+            self._disconnected_at = now
+        # Les résumés arrivent toutes les REPORT_INTERVAL secondes : marge d'un résumé
+        if self._outage_alerted or now - self._disconnected_at < self.options["timeout"] + REPORT_INTERVAL:
+            return
+        self._outage_alerted = True
+        devices = sum(report["devices"] for report in self.shards.values())
+        self._alert(unreachable_alert(self.broker, now - self._disconnected_at, devices),
+                    key=f"broker:{self._disconnected_at}", log="ERROR: Broker injoignable.", event="broker_down")
+
+    def _alert(self, message, key, log, event):
+        print(message)
+        if self.log_writer:
+            self.log_writer.write(log, event=event)
+        if self.alerts:
+            self.alerts.send(message, key=key)
+
+    def check_workers(self):
+        """Relance un worker arrêté ; ses appareils repartent d'un état vide, y compris
+        dans le corrélateur (ils y sont redéclarés à leur prochain battement)."""
+        for index, process in enumerate(self.processes):
+            if not process.is_alive():
+                print(f"⚠️ [VM] Worker {index} arrêté (code {process.exitcode}), redémarrage...")
+                if self.log_writer:
+                    self.log_writer.write(f"WARNING: Worker {index} redémarré.", event="worker_restart", shard=index)
+                self.shards.pop(index, None)  # Résumé périmé
+                if self.correlator:
+                    for device_id in self.shard_devices[index]:
+                        self.correlator.forget(device_id)
+                self.shard_devices[index].clear()
+                self.start_worker(index)
+
+    def summary(self):
+        devices = sum(report["devices"] for report in self.shards.values())
+        down = sum(report["down_devices"] for report in self.shards.values())
+        return f"{devices} appareils suivis, {down} en panne, sur {len(self.shards)}/{self.workers} workers"
+
+    def run(self):
+        """Démarre les workers et traite leurs résumés jusqu'à l'interruption."""
+        self.start()
+        try:
+            while True:
+                try:
+                    self.handle_report(self.reports.get(timeout=REPORT_INTERVAL))
+                except queue.Empty:
+                    pass
+                if self.correlator:
+                    self.correlator.flush()
+                self.check_broker(time.monotonic())
+                self.check_workers()
+        finally:
+            self.stop()
+
+    def stop(self):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(5)
+
+
+if __name__ == "__main__":
+    import cli
+    cli.main(["supervisor", "--workers", str(os.cpu_count() or 2)] + sys.argv[1:])
@@ -0,0 +1,374 @@
+import argparse
+import gzip
+import heapq
+import itertools
+import json
+import random
+import struct
+import sys
+import time
+from calendar import timegm
+from collections import deque
+
+from engine import ROLES, HealthcheckEngine, Transport
+from frame import Heartbeat, STATUS_OK
+from scheduler import TimerHandle
+
+# Rejeu déterministe : le moteur de healthcheck (engine.HealthcheckEngine) tourne
+# sur une horloge virtuelle, alimenté par une trace d'événements enregistrée au
+# lieu des sockets. Le temps n'avance que d'un événement ou d'une échéance à la
+# suivante : une journée de trafic se rejoue en quelques secondes, et une fausse
+# alerte se reproduit (et se corrige) à l'identique.
+#
+# Traces acceptées :
+#   - journal texte (``mqtt_healthcheck.log``...) : ``dd/mm/YYYY HH:MM:SS - SENT: [from: iot] #1`` ;
+#   - journal JSON (``--log-format json``) : horodatage à la microseconde ;
+#   - trace binaire (``write_trace``), compacte et rapide à relire.
+# Un journal de superviseur (``[from: <appareil>]``) donne un moteur VM par appareil.
+#
+# Le journal texte n'est précis qu'à la seconde : les RTT n'y sont pas
+# mesurables, le détecteur garde alors son délai par défaut. ``perturb()``
+# étale les instants dans leur seconde, décale l'origine (passage d'une minute)
+# ou déforme l'horloge (dérive) pour chercher les cas limites.
+
+TRACE_MAGIC = b"HBT"
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct("!3sB")
+# instant (s) | type d'événement (u8) | expéditeur (32 octets, complété par des \0) | numéro de séquence (u64)
+TRACE_RECORD = struct.Struct("!dB32sQ")
+KINDS = ("sent", "received", "error")
+NO_SEQ = 2 ** 64 - 1  # Numéro de séquence absent dans la trace binaire
+
+
+class VirtualScheduler:
+    """Même interface que ``scheduler.Scheduler``, sur une horloge virtuelle.
+
+    Rien ne dort : ``run_until(t)`` exécute dans l'ordre toutes les échéances
+    jusqu'à ``t`` en avançant l'horloge de l'une à l'autre. Un seul thread, donc
+    pas de verrou.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self._timers = []
+        self._ready = deque()
+        self._counter = itertools.count()
+        self._stopped = False
+
+    def clock(self):
+        return self.now
+
+    def call_at(self, when, callback, *args):
+        handle = TimerHandle(when, callback, args)
+        heapq.heappush(self._timers, (when, next(self._counter), handle))
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def call_soon_threadsafe(self, callback, *args):
+        self._ready.append((callback, args))
+
+    def stop(self):
+        self._stopped = True
+
+    def run_until(self, deadline):
+        """Exécute tout ce qui est dû jusqu'à ``deadline`` puis y place l'horloge."""
+        timers = self._timers
+        while not self._stopped:
+            while self._ready:
+                callback, args = self._ready.popleft()
+                callback(*args)
+            if not timers or timers[0][0] > deadline:
+                break
+            when, _, handle = heapq.heappop(timers)
+            if not handle.cancelled:
+                self.now = max(self.now, when)
+                handle.callback(*handle.args)
+        self.now = max(self.now, deadline)
+
+    def run(self):
+        """Exécute les échéances jusqu'à ``stop()`` ou jusqu'à ce qu'il n'y en ait plus."""
+        while self._timers and not self._stopped:
+            self.run_until(self._timers[0][0])
+
+
+class ReplayTransport(Transport):
+    """Transport muet : les battements envoyés par le moteur rejoué ne vont nulle part."""
+
+    name = "replay"
+
+    def send(self, payload):
+        return True
+
+
+class AlertRecorder:
+    """Remplace ``AlertDispatcher`` : garde les alertes avec leur instant virtuel."""
+
+    def __init__(self, scheduler, device_id, alerts):
+        self.scheduler = scheduler
+        self.device_id = device_id
+        self.alerts = alerts
+
+    def send(self, message, key=None):
+        if key and key.startswith("up:"):
+            return True  # Avis de rétablissement : pas une alerte
+        self.alerts.append((self.scheduler.clock(), self.device_id, message))
+        return True
+
+
+def _parse_text_time(stamp):
+    return float(timegm(time.strptime(stamp, "%d/%m/%Y %H:%M:%S")))  # LogWriter écrit en UTC
+
+
+def _parse_message(message):
+    """(type, expéditeur, séquence) d'un message de journal, None si non pertinent."""
+    kind, _, rest = message.partition(": ")
+    kind = kind.lower()
+    if kind == "error":
+        sender = rest[rest.find("(") + 1:rest.rfind(")")] if rest.endswith(").") else ""
+        return "error", sender, None
+    if kind not in ("sent", "received") or not rest.startswith("[from: "):
+        return None
+    sender = rest[7:rest.find("]")]
+    _, sep, seq = rest.partition("#")
+    seq = seq.split(" ", 1)[0]
+    return kind, sender, int(seq) if sep and seq.isdigit() else None
+
+
+def read_log(path):
+    """Événements (instant, type, expéditeur, séquence) d'un journal texte ou JSON.
+
+    Retourne (événements, précis) ; ``précis`` est faux pour un journal texte
+    (horodatage à la seconde).
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    events = []
+    precise = True
+    with opener(path, "rt", encoding="utf-8") as lines:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                parsed = _parse_message(entry.get("msg", ""))
+                at = entry["ts"]
+            else:
+                stamp, sep, message = line.partition(" - ")
+                if not sep:
+                    continue
+                parsed = _parse_message(message)
+                at = _parse_text_time(stamp)
+                precise = False
+            if parsed is not None:
+                events.append((at, *parsed))
+    events.sort(key=lambda event: event[0])  # Tri stable : l'ordre du journal est gardé dans une même seconde
+    return events, precise
+
+
+def write_trace(path, events):
+    """Écrit des événements (instant, type, expéditeur, séquence) en trace binaire."""
+    with open(path, "wb") as trace:
+        trace.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+        for at, kind, sender, seq in events:
+            trace.write(TRACE_RECORD.pack(at, KINDS.index(kind), sender.encode(), NO_SEQ if seq is None else seq))
+
+
+def read_trace(path):
+    """Relit une trace binaire ; retourne (événements, précis) comme ``read_log``."""
+    with open(path, "rb") as trace:
+        data = trace.read()
+    magic, version = TRACE_HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError(f"{path} n'est pas une trace de battements (version {TRACE_VERSION}).")
+    events = [(at, KINDS[kind], sender.rstrip(b"\0").decode(), None if seq == NO_SEQ else seq)
+              for at, kind, sender, seq in TRACE_RECORD.iter_unpack(memoryview(data)[TRACE_HEADER.size:])]
+    return events, True
+
+
+def load(path):
+    """Trace binaire ou journal, selon l'en-tête du fichier."""
+    with open(path, "rb") as source:
+        head = source.read(len(TRACE_MAGIC))
+    return read_trace(path) if head == TRACE_MAGIC else read_log(path)
+
+
+def synthesize(devices=1000, duration=86400, interval=60, jitter=0.05, loss=0.0, seed=0):
+    """Trace de VM synthétique : ``devices`` appareils, un battement par ``interval``,
+    gigue uniforme de ``jitter`` s et pertes avec la probabilité ``loss``."""
+    rng = random.Random(seed)
+    phases = [rng.uniform(0, interval) for _ in range(devices)]
+    events = []
+    for round_index in range(int(duration / interval)):
+        base = round_index * interval
+        batch = []
+        for device, phase in enumerate(phases):
+            if loss and rng.random() < loss:
+                continue
+            batch.append((base + phase + rng.uniform(0, jitter), "received", f"dev{device}", round_index + 1))
+        batch.sort(key=lambda event: event[0])
+        events.extend(batch)
+    return events
+
+
+def perturb(events, jitter=0.0, skew=0.0, offset=0.0, rng=None):
+    """Copie des événements avec gigue uniforme, dérive d'horloge (``skew``, ex.
+    1e-4 = 100 ppm) et décalage d'origine, triée de nouveau."""
+    rng = rng or random.Random()
+    start = events[0][0] if events else 0.0
+    moved = [(start + offset + (at - start) * (1 + skew) + (rng.uniform(0, jitter) if jitter else 0.0), *rest)
+             for at, *rest in events]
+    moved.sort(key=lambda event: event[0])
+    return moved
+
+
+class ReplayResult:
+    __slots__ = ("events", "devices", "virtual_seconds", "wall_seconds", "alerts", "recorded_errors")
+
+    def __init__(self, events, devices, virtual_seconds, wall_seconds, alerts, recorded_errors):
+        self.events = events
+        self.devices = devices
+        self.virtual_seconds = virtual_seconds
+        self.wall_seconds = wall_seconds
+        self.alerts = alerts  # (instant virtuel, appareil, message)
+        self.recorded_errors = recorded_errors  # (instant, appareil) des erreurs du journal
+
+    @property
+    def speedup(self):
+        return self.virtual_seconds / self.wall_seconds if self.wall_seconds else float("inf")
+
+
+class Replay:
+    """Rejoue une trace sur des moteurs de healthcheck à horloge virtuelle.
+
+    Le rôle rejoué est déduit de la trace : un journal de l'IoT (battements
+    envoyés par "iot") fait tourner un moteur IoT qui envoie à sa propre
+    cadence et reçoit les réponses de la VM aux instants enregistrés ; un
+    journal de VM (ou de superviseur) fait tourner un moteur VM par appareil.
+    """
+
+    def __init__(self, events, interval=60, detector="timeout", phi_threshold=8.0, precise=True, verbose=False):
+        self.events = events
+        self.interval = interval
+        self.detector = detector
+        self.phi_threshold = phi_threshold
+        self.precise = precise  # Faux : horodatages à la seconde, pas de RTT
+        self.verbose = verbose
+        self.scheduler = VirtualScheduler(events[0][0] if events else 0.0)
+        self.engines = {}
+        self.sent = {}  # séquence -> instant d'envoi de l'IoT
+        self.alerts = []
+
+    def engine(self, role, device_id):
+        engine = self.engines.get(device_id)
+        if engine is None:
+            engine = self.engines[device_id] = HealthcheckEngine(
+                role, [ReplayTransport()], device_id=device_id or None, interval=self.interval, detector=self.detector,
+                phi_threshold=self.phi_threshold, scheduler=self.scheduler,
+                alerts=AlertRecorder(self.scheduler, device_id, self.alerts), verbose=self.verbose,
+            )
+            engine.start()
+        return engine
+
+    def apply(self, kind, sender, seq):
+        """Applique un événement à l'instant courant de l'horloge virtuelle."""
+        now = self.scheduler.now
+        if kind == "sent":
+            if sender == "iot":
+                self.sent[seq] = now
+                self.engine("iot", "")  # Le moteur IoT envoie ensuite à sa propre cadence
+            return
+        if kind != "received":
+            return
+        if sender == "vm":
+            engine = self.engine("iot", "")
+            sent = self.sent.get(seq)
+            echo_ns = int(sent * 1e9) if self.precise and sent is not None else None
+            heartbeat = Heartbeat("vm", seq, int(now * 1e9), echo_ns, STATUS_OK)
+        else:
+            engine = self.engine("vm", "" if sender in ROLES else sender)
+            heartbeat = Heartbeat("iot", seq, int(now * 1e9), None, STATUS_OK)
+        engine.handle_message(engine.links[0], heartbeat, now)
+
+    def run(self, until=None):
+        started = time.perf_counter()
+        scheduler = self.scheduler
+        errors = []
+        for at, kind, sender, seq in self.events:
+            scheduler.run_until(at)
+            if kind == "error":
+                errors.append((at, sender))
+            else:
+                self.apply(kind, sender, seq)
+        end = until if until is not None else (self.events[-1][0] if self.events else 0.0)
+        scheduler.run_until(end)
+        for engine in self.engines.values():
+            engine.stop()
+        virtual = end - (self.events[0][0] if self.events else 0.0)
+        return ReplayResult(len(self.events), len(self.engines), virtual, time.perf_counter() - started,
+                            self.alerts, errors)
+
+
+def fuzz(events, runs=100, jitter=1.0, skew=0.0, offset=0.0, seed=0, **replay_options):
+    """Rejoue ``runs`` variantes perturbées de la trace ; retourne le nombre
+    d'alertes de chaque variante (une seed par variante, donc reproductible)."""
+    counts = []
+    for run in range(runs):
+        rng = random.Random(seed + run)
+        moved = perturb(events, jitter, rng.uniform(-skew, skew) if skew else 0.0,
+                        rng.uniform(0, offset) if offset else 0.0, rng)
+        counts.append(len(Replay(moved, **replay_options).run().alerts))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rejeu déterministe d'une trace de healthcheck sur horloge virtuelle.")
+    parser.add_argument("trace", nargs="?", help="journal texte/JSON ou trace binaire ; sans trace, --synthetic")
+    parser.add_argument("--interval", type=float, default=60, help="cadence des battements de la trace")
+    parser.add_argument("--detector", choices=("timeout", "phi"), default="timeout")
+    parser.add_argument("--phi-threshold", type=float, default=8.0)
+    parser.add_argument("--synthetic", type=int, metavar="APPAREILS", help="trace synthétique de N appareils")
+    parser.add_argument("--duration", type=float, default=86400, help="durée de la trace synthétique (s)")
+    parser.add_argument("--loss", type=float, default=0.0, help="taux de pertes de la trace synthétique")
+    parser.add_argument("--convert", metavar="FICHIER", help="écrit la trace en binaire dans ce fichier et s'arrête")
+    parser.add_argument("--runs", type=int, default=0, help="nombre de rejeux perturbés (fuzzing)")
+    parser.add_argument("--jitter", type=float, default=None, help="gigue ajoutée (s), 1 par défaut pour un journal texte")
+    parser.add_argument("--skew", type=float, default=0.0, help="dérive d'horloge maximale (ex. 1e-4)")
+    parser.add_argument("--offset", type=float, default=0.0, help="décalage d'origine maximal (s), ex. 60 pour les minutes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="affiche les messages des moteurs rejoués")
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        events, precise = synthesize(args.synthetic, args.duration, args.interval, loss=args.loss, seed=args.seed), True
+    elif args.trace:
+        events, precise = load(args.trace)
+    else:
+        parser.error("une trace ou --synthetic est nécessaire")
+    if args.convert:
+        write_trace(args.convert, events)
+        print(f"💾 {len(events)} événements écrits dans {args.convert}")
+        return
+
+    options = dict(interval=args.interval, detector=args.detector, phi_threshold=args.phi_threshold, precise=precise,
+                   verbose=args.verbose)
+    result = Replay(events, **options).run()
+    print(f"⏩ {result.events} événements, {result.devices} moteur(s), {result.virtual_seconds:.0f} s rejouées "
+          f"en {result.wall_seconds:.2f} s (x{result.speedup:.0f})")
+    print(f"📒 Erreurs dans la trace : {len(result.recorded_errors)} ; alertes au rejeu : {len(result.alerts)}")
+    for at, device_id, _ in result.alerts[:20]:
+        stamp = time.strftime('%d/%m/%Y %H:%M:%S', time.gmtime(at))
+        print(f"🚨 {stamp} (+{at - events[0][0]:.3f} s) {device_id or 'pair'}")
+
+    if args.runs:
+        jitter = args.jitter if args.jitter is not None else (0.0 if precise else 1.0)
+        counts = fuzz(events, args.runs, jitter, args.skew, args.offset, args.seed, **options)
+        alerting = sum(1 for count in counts if count)
+        print(f"🎲 {args.runs} rejeux perturbés (gigue {jitter:g} s, dérive {args.skew:g}, décalage {args.offset:g} s) : "
+              f"{alerting} avec alerte(s), {sum(counts)} alertes au total")
+    return result
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,280 @@
+import sys
+import time
+from datetime import datetime, timezone
+import frame
+from metrics import PeerMetrics, RECONNECTS
+from sequence import SequenceWindow, DUPLICATE, RESTARTED
+
+# Configuration
+BROKER = "20.107.241.46"  # IP de la VM Azure
+TOPIC = "iot/healthcheck"  # Chaque appareil publie sur iot/healthcheck/<device_id>
+HEARTBEAT_INTERVAL = 60  # Cadence des appareils par défaut, en secondes (option --interval de cli.py)
+DEVICE_TIMEOUT = 2.5 * HEARTBEAT_INTERVAL  # Deux battements manqués + marge
+TICK = min(1.0, HEARTBEAT_INTERVAL / 2)  # Résolution de la roue de temporisation, en secondes
+
+
+def down_alert(device_id, summary):
+    """Texte de l'alerte envoyée quand un appareil ne répond plus."""
+    return f"🚨 **[VM] Problème détecté sur {device_id} !**\n📅 {datetime.now(timezone.utc).strftime('%d/%m/%Y %H:%M:%S UTC')}\n❌ Message non reçu.\n📉 {summary}"
+
+
+def unreachable_alert(broker, outage, devices):
+    """Texte de l'alerte « cause racine » envoyée quand le broker reste injoignable."""
+    return (f"🚨 **[VM] Broker MQTT injoignable !**\n📅 {datetime.now(timezone.utc).strftime('%d/%m/%Y %H:%M:%S UTC')}\n"
+            f"❌ Aucune connexion à {broker} depuis {outage:.0f} s.\n📉 {devices} appareils suivis sans surveillance.")
+
+
+def reachable_notice(broker, outage):
+    """Texte de l'avis envoyé quand le broker est de nouveau joignable après une alerte."""
+    return (f"✅ **[VM] Broker MQTT de nouveau joignable**\n📅 {datetime.now(timezone.utc).strftime('%d/%m/%Y %H:%M:%S UTC')}\n"
+            f"📈 Connexion à {broker} rétablie après {outage:.0f} s.")
+
+
+class TimerWheel:
+    """Roue de temporisation hachée : armer/annuler une échéance coûte O(1).
+
+    Chaque appareil n'a qu'une seule échéance active. ``advance()`` parcourt
+    uniquement les cases écoulées depuis le dernier appel et retourne les clés
+    expirées, quel que soit le nombre d'appareils suivis.
+    """
+
+    def __init__(self, tick=TICK, slots=512, now=None):
+        self.tick = tick
+        self.slots = slots
+        self._wheel = [{} for _ in range(slots)]
+        self._where = {}  # clé -> index de la case qui contient son échéance
+        self._current = int((time.monotonic() if now is None else now) / tick)
+
+    def __len__(self):
+        return len(self._where)
+
+    def schedule(self, key, deadline):
+        """Arme (ou réarme) l'échéance de ``key``."""
+        self.cancel(key)
+        expiry = max(int(deadline / self.tick), self._current)
+        index = expiry % self.slots
+        self._wheel[index][key] = expiry
+        self._where[key] = index
+
+    def cancel(self, key):
+        index = self._where.pop(key, None)
+        if index is not None:
+            del self._wheel[index][key]
+
+    def advance(self, now):
+        """Avance la roue jusqu'à ``now`` et retourne les clés dont l'échéance est passée."""
+        target = int(now / self.tick)
+        expired = []
+        if target < self._current:
+            return expired
+        for step in range(min(target - self._current + 1, self.slots)):
+            bucket = self._wheel[(self._current + step) % self.slots]
+            if not bucket:
+                continue
+            for key, expiry in list(bucket.items()):
+                if expiry <= target:
+                    del bucket[key]
+                    del self._where[key]
+                    expired.append(key)
+        self._current = target + 1
+        return expired
+
+
+class DeviceState:
+    """État minimal d'un appareil supervisé (taille fixe grâce à ``__slots__``)."""
+
+    __slots__ = ("device_id", "transport", "last_seen", "received", "alive", "window", "metrics")
+
+    def __init__(self, device_id, transport="mqtt"):
+        self.device_id = device_id
+        self.transport = transport
+        self.last_seen = None
+        self.received = 0
+        self.alive = True
+        self.window = SequenceWindow()
+        self.metrics = PeerMetrics(transport, "vm", device_id)
+        self.metrics.track(self.window, lambda: self.last_seen, time.monotonic)
+
+
+class Supervisor:
+    """Rôle VM multi-appareils : suit N appareils IoT depuis un seul processus.
+
+    Les messages et les échéances sont traités sur le même thread : la boucle
+    ``run()`` alterne ``client.loop()`` (réseau) et ``TimerWheel.advance()``
+    (délais), sans aucun thread par appareil.
+
+    Avec ``correlator`` (``correlation.AlertCorrelator``), les pannes et les
+    retours passent par la corrélation : une panne du broker ou d'un segment
+    donne une seule alerte pour tout le groupe.
+
+    Tant que le superviseur n'est pas connecté au broker, aucun appareil n'est
+    déclaré en panne ; si la coupure dure plus de ``timeout`` (plus le délai de
+    reconnexion des appareils), une seule alerte « broker injoignable » part,
+    puis un avis de rétablissement à la reconnexion.
+    """
+
+    def __init__(self, connection, timeout=DEVICE_TIMEOUT, tick=TICK, alerts=None, log_writer=None,
+                 subscription=f"{TOPIC}/+", table=None, correlator=None):
+        self.connection = connection
+        self.timeout = timeout
+        self.alerts = alerts
+        self.log_writer = log_writer
+        self.correlator = correlator
+        self.devices = {}
+        # Échéances : roue de temporisation, ou table en colonnes (devicetable.DeviceTable) balayée d'un bloc
+        self.table = table
+        self.wheel = table if table is not None else TimerWheel(tick=tick)
+        self._reconnects = RECONNECTS.labels("vm", "")
+        self._connected = False
+        self._disconnected_at = None  # Début de la coupure en cours (ou du démarrage sans connexion)
+        self._outage_alerted = False
+        connection.on_connect = self.on_connect
+        connection.on_message = self.on_message
+        connection.subscribe(subscription)
+
+    def on_connect(self, connection, session_present, reconnect):
+        """Connexion (ou reconnexion) au broker ; l'abonnement est renouvelé par la connexion."""
+        if reconnect:
+            self._reconnects.inc()
+            print("🔁 [VM] Superviseur reconnecté au broker MQTT.")
+            # Les appareils n'ont pas pu nous joindre pendant la coupure et se reconnectent
+            # peut-être plus tard que nous : on leur laisse un délai complet en plus
+            deadline = time.monotonic() + self.timeout + connection.reconnect_grace()
+            for device_id, state in self.devices.items():
+                if state.alive:
+                    self.wheel.schedule(device_id, deadline)
+        else:
+            print("✅ [VM] Superviseur connecté au broker MQTT !\n\n")
+
+    def on_message(self, client, userdata, msg):
+        """Met à jour l'état de l'appareil émetteur et réarme son échéance."""
+        heartbeat = frame.decode(msg.payload)
+        if heartbeat is None or heartbeat.sender == "vm":
+            return  # Nos propres réponses, ou message non reconnu
+
+        device_id = msg.topic.rsplit("/", 1)[-1]
+        if not self.record(device_id, heartbeat.seq, time.monotonic(), timestamp_ns=heartbeat.timestamp_ns):
+            return
+
+        # Répondre sur le topic de l'appareil pour qu'il sache que la VM est vivante,
+        # en renvoyant son horodatage en écho (mesure du RTT côté appareil)
+        if heartbeat.timestamp_ns is None:
+            reply = frame.encode_text("vm", heartbeat.seq)
+        else:
+            reply = frame.encode("vm", heartbeat.seq, echo_ns=heartbeat.timestamp_ns)
+        self.connection.publish(msg.topic, reply)
+        state = self.devices.get(device_id)
+        if state is not None:  # Absent si l'appareil est suivi par un autre worker (sharding.py)
+            state.metrics.sent.inc()
+
+    def broker_name(self, transport):
+        """Broker par lequel passent les battements ``transport`` (aucun hors MQTT)."""
+        if transport != "mqtt":
+            return None
+        return f"{self.connection.broker}:{self.connection.port}"
+
+    def record(self, device_id, seq, now, transport="mqtt", timestamp_ns=None):
+        """Enregistre le battement ``seq`` de ``device_id`` ; retourne False s'il est en double.
+
+        ``timestamp_ns`` (horloge monotone de l'appareil) aide à reconnaître un appareil redémarré.
+        """
+        state = self.devices.get(device_id)
+        if state is None:
+            state = self.devices[device_id] = DeviceState(device_id, transport)
+            print(f"🆕 [VM] Nouvel appareil : {device_id} ({len(self.devices)} suivis)")
+            if self.correlator:
+                self.correlator.register(device_id, self.broker_name(transport), transport)
+
+        if seq is not None:
+            status = state.window.add(seq, timestamp_ns)
+            if status is DUPLICATE:
+                return False
+            if status is RESTARTED:
+                print(f"🔄 [VM] Appareil {device_id} redémarré (battement #{seq}).")
+
+        state.last_seen = now
+        state.received += 1
+        state.metrics.received.inc()
+        if not state.alive:
+            state.alive = True
+            self.recovered(state)
+        if self.table is not None:
+            self.table.heartbeat(device_id, seq, now)
+        else:
+            self.wheel.schedule(device_id, now + self.timeout)
+        if self.log_writer:
+            self.log_writer.write(f"RECEIVED: [from: {device_id}] #{seq}", event="received", sender=device_id, seq=seq)
+        return True
+
+    def recovered(self, state):
+        """Appelé quand un appareil déclaré en panne envoie de nouveau des battements."""
+        if self.correlator:
+            self.correlator.recovered(state.device_id)
+            return
+        print(f"✅ [VM] Appareil {state.device_id} de nouveau joignable.")
+
+    def expire(self, device_id):
+        """Appelé par la roue quand un appareil n'a rien envoyé avant son échéance."""
+        state = self.devices[device_id]
+        state.alive = False
+        alert_message = down_alert(device_id, state.window.summary())
+        if self.log_writer:
+            self.log_writer.write(f"ERROR: Message manquant ({device_id}).", event="error", sender=device_id)
+        if self.correlator:
+            self.correlator.failed(device_id, alert_message)  # Envoyée seule ou regroupée à la fin de la fenêtre
+            return
+        print(alert_message)
+        if self.alerts:
+            self.alerts.send(alert_message, key=f"down:{device_id}:{state.last_seen}")  # Une clé par panne
+
+    def connection_changed(self, connected, now):
+        """La connexion au broker vient de s'établir ou de se perdre."""
+        self._connected = connected
+        if self.correlator:
+            self.correlator.broker_connected(self.broker_name("mqtt"), connected)
+        if not connected:
+            self._disconnected_at = now
+            return
+        if self._outage_alerted:
+            self.alert(reachable_notice(self.broker_name("mqtt"), now - self._disconnected_at),
+                       key=f"up:broker:{self._disconnected_at}", log="INFO: Broker de nouveau joignable.", event="broker_up")
+        self._disconnected_at = None
+        self._outage_alerted = False
+
+    def check_broker(self, now):
+        """Coupure en cours : alerte « broker injoignable » une fois le délai dépassé."""
+        if self._disconnected_at is None:
+            self._disconnected_at = now  # Broker injoignable dès le démarrage
+        limit = self.timeout + self.connection.reconnect_grace()
+        if self._outage_alerted or now - self._disconnected_at < limit:
+            return
+        self._outage_alerted = True
+        self.alert(unreachable_alert(self.broker_name("mqtt"), now - self._disconnected_at, len(self.devices)),
+                   key=f"broker:{self._disconnected_at}", log="ERROR: Broker injoignable.", event="broker_down")
+
+    def alert(self, message, key, log, event):
+        print(message)
+        if self.log_writer:
+            self.log_writer.write(log, event=event)
+        if self.alerts:
+            self.alerts.send(message, key=key)
+
+    def run(self):
+        """Boucle unique : réseau MQTT, échéances expirées, puis alertes corrélées."""
+        while True:
+            self.connection.loop(timeout=self.wheel.tick)
+            now = time.monotonic()
+            if self.connection.connected != self._connected:
+                self.connection_changed(self.connection.connected, now)
+            if not self.connection.connected:
+                self.check_broker(now)
+                continue  # Aucun appareil ne peut être déclaré en panne pendant la coupure
+            for device_id in self.wheel.advance(now):
+                self.expire(device_id)
+            if self.correlator:
+                self.correlator.flush(now)
+
+
+if __name__ == "__main__":
+    import cli
+    cli.main(["supervisor"] + sys.argv[1:])
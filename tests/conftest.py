@@ -0,0 +1,52 @@
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+# Les modules du projet sont à la racine du dépôt
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BrokerProcess:
+    """minibroker.py dans un processus à part, qu'on peut arrêter puis relancer sur le même port."""
+
+    def __init__(self, *args):
+        self.port = free_port()
+        self.args = args
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, "-u", "minibroker.py", "--port", str(self.port), *self.args],
+                                        cwd=ROOT, stdout=subprocess.PIPE, text=True)
+        self.process.stdout.readline()  # « Broker MQTT local en écoute... »
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+
+@pytest.fixture
+def start_broker():
+    """Démarre un minibroker (arguments de minibroker.py en plus du port), arrêté en fin de test."""
+    brokers = []
+
+    def start(*args):
+        brokers.append(BrokerProcess(*args).start())
+        return brokers[-1]
+
+    yield start
+    for broker in brokers:
+        broker.stop()
@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from alerts import AlertDispatcher
+
+
+class Webhook(ThreadingHTTPServer):
+    """Faux webhook Discord : enregistre les messages et répond selon ``responses``."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), WebhookHandler)
+        self.requests = []  # (instant, contenu)
+        self.responses = deque()  # (code, corps JSON) ; 204 une fois épuisées
+        self.release = threading.Event()
+        self.release.set()
+        self.received = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/webhook"
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((time.monotonic(), body["content"]))
+        self.server.received.set()
+        self.server.release.wait(10)
+        status, payload = self.server.responses.popleft() if self.server.responses else (204, None)
+        data = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def webhook():
+    server = Webhook()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_full_queue_keeps_the_alert_sendable(webhook):
+    dispatcher = AlertDispatcher(webhook.url, max_queue=1, coalesce_delay=0)
+    webhook.release.clear()  # Le thread d'envoi reste bloqué sur la première alerte
+    assert dispatcher.send("première", key="a")
+    assert webhook.received.wait(5)
+    assert dispatcher.send("deuxième", key="b")  # Occupe l'unique place de la file
+    assert not dispatcher.send("troisième", key="c")
+    assert dispatcher.dropped == 1
+    webhook.release.set()
+    assert wait_for(lambda: dispatcher._queue.empty())
+    # L'alerte écartée n'a pas été retenue comme doublon
+    assert dispatcher.send("troisième", key="c")
+    dispatcher.close()
+    assert [content for _, content in webhook.requests] == ["première", "deuxième", "troisième"]
+
+
+def test_rate_limit_waits_retry_after(webhook):
+    webhook.responses.append((429, {"retry_after": 1.5}))
+    dispatcher = AlertDispatcher(webhook.url, coalesce_delay=0)
+    assert dispatcher.send("alerte")
+    dispatcher.close()
+    assert dispatcher.sent == 1
+    (first, _), (second, content) = webhook.requests
+    assert second - first >= 1.4
+    assert content == "alerte"
+
+
+def test_burst_is_coalesced(webhook):
+    dispatcher = AlertDispatcher(webhook.url, coalesce_delay=0.5)
+    for n in range(3):
+        assert dispatcher.send(f"alerte {n}")
+    dispatcher.close()
+    assert [content for _, content in webhook.requests] == ["alerte 0\n\nalerte 1\n\nalerte 2"]
+
+
+def test_duplicates_are_dropped(webhook):
+    dispatcher = AlertDispatcher(webhook.url, coalesce_delay=0)
+    assert dispatcher.send("panne", key="down:capteur-1")
+    assert not dispatcher.send("panne, encore", key="down:capteur-1")
+    assert dispatcher.send("autre panne", key="down:capteur-2")
+    dispatcher.close()
+    assert [content for _, content in webhook.requests] == ["panne", "autre panne"]
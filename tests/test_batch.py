@@ -0,0 +1,99 @@
+import asyncio
+import socket
+import threading
+
+import pytest
+
+import frame
+from coap_client import CoapClient
+from coap_healthcheck import BATCH_RESOURCE
+
+
+def records(count, seq=1):
+    return [(f"capteur-{n}", frame.encode("iot", seq, 1_000 + n)) for n in range(count)]
+
+
+def test_batch_round_trip():
+    decoded = frame.decode_batch(frame.encode_batch(records(3)))
+    assert [device_id for device_id, _ in decoded] == ["capteur-0", "capteur-1", "capteur-2"]
+    assert [(hb.sender, hb.seq, hb.timestamp_ns) for _, hb in decoded] == [("iot", 1, 1_000 + n) for n in range(3)]
+
+
+def test_invalid_batches():
+    payload = frame.encode_batch(records(3))
+    with pytest.raises(ValueError):
+        frame.decode_batch(payload[:-1])  # Tronqué : dernier enregistrement incomplet
+    with pytest.raises(ValueError):
+        frame.decode_batch(payload[:5])  # En-tête incomplet
+    with pytest.raises(ValueError):
+        frame.decode_batch(b"XXX" + payload[3:])
+    with pytest.raises(ValueError):
+        frame.decode_batch(payload[:3] + bytes([frame.VERSION + 1]) + payload[4:])
+
+
+def test_ingest_groups_records_per_device():
+    from coap_server import DeviceDirectory
+
+    directory = DeviceDirectory()
+    batch = frame.decode_batch(frame.encode_batch(records(2, seq=1) + records(2, seq=2)))
+    assert len(directory.ingest(batch)) == 4
+    device = directory.device("capteur-1")
+    assert device.state.received == 2
+    assert device.state.last_heartbeat.seq == 2
+    assert frame.decode(device.latest_payload).seq == 2
+
+
+@pytest.fixture
+def coap_server():
+    """Serveur CoAP de la VM (``coap_server.build_site``) sur un port local, dans son propre thread."""
+    from aiocoap import Context
+    from coap_server import build_site
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    received = []
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    contexts = []
+
+    def serve():
+        site = build_site(on_batch=lambda batch, at: received.extend(batch))
+        contexts.append(loop.run_until_complete(Context.create_server_context(site, bind=("127.0.0.1", port))))
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    assert started.wait(5)
+    client = CoapClient(f"coap://127.0.0.1:{port}")
+    yield client, received
+    client.close()
+    asyncio.run_coroutine_threadsafe(contexts[0].shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+def test_batch_over_coap(coap_server):
+    client, received = coap_server
+    response = client.post_batch(BATCH_RESOURCE, records(3))
+    assert response.code.is_successful()
+    assert [device_id for device_id, _ in received] == ["capteur-0", "capteur-1", "capteur-2"]
+
+
+def test_large_batch_uses_blockwise_transfer(coap_server):
+    client, received = coap_server
+    batch = records(500)
+    assert len(frame.encode_batch(batch)) > 1024  # Plus grand qu'un bloc CoAP
+    response = client.post_batch(BATCH_RESOURCE, batch)
+    assert response.code.is_successful()
+    assert len(received) == 500
+
+
+def test_malformed_batch_is_rejected(coap_server):
+    client, received = coap_server
+    payload = frame.encode_batch(records(3))
+    for bad in (payload[:-7], b"XXX" + payload[3:]):
+        response = client.post(BATCH_RESOURCE, bad)
+        assert str(response.code).startswith("4.00")
+    assert received == []
@@ -0,0 +1,93 @@
+import json
+from types import SimpleNamespace
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from chathistory import HISTORY_TOPIC, ChatArchiver, ChatHistory
+
+
+class FakeConnection:
+    def __init__(self):
+        self.published = []  # (topic, payload, propriétés utilisateur, CorrelationData)
+        self.on_message = None
+
+    def subscribe(self, topic, qos=0, no_local=False):
+        pass
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        self.published.append((topic, payload, dict(getattr(properties, "UserProperty", None) or ()),
+                               getattr(properties, "CorrelationData", None)))
+        return True
+
+
+def make_history(tmp_path):
+    history = ChatHistory(str(tmp_path / "chat.db"))
+    for n in range(10):
+        history.append("general" if n % 2 else "atelier", f"user{n % 3}", f"message {n}", ts=1000.0 + n)
+    return history
+
+
+def test_replay_filters(tmp_path):
+    history = make_history(tmp_path)
+    try:
+        assert [body for *_, body in history.replay(last=3)] == ["message 7", "message 8", "message 9"]
+        assert [body for *_, body in history.replay(since=1008.0)] == ["message 8", "message 9"]
+        assert [body for *_, body in history.replay(room="general", last=2)] == ["message 7", "message 9"]
+        assert [body for *_, body in history.replay(sender="user0", room="atelier")] == ["message 0", "message 6"]
+        assert list(history.replay(last=0)) == []
+    finally:
+        history.close()
+
+
+def request(payload, correlation=b"req-1"):
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.ResponseTopic = f"{HISTORY_TOPIC}/reply/client"
+    properties.CorrelationData = correlation
+    return SimpleNamespace(topic=f"{HISTORY_TOPIC}/request", payload=json.dumps(payload).encode(),
+                           properties=properties)
+
+
+def test_archiver_answers_on_the_response_topic(tmp_path):
+    history = make_history(tmp_path)
+    connection = FakeConnection()
+    archiver = ChatArchiver(connection, history, max_replay=4)
+    try:
+        archiver.on_message(None, None, request({"last": 2, "room": "general"}))
+        *messages, end = connection.published
+        assert [payload for _, payload, _, _ in messages] == ["message 7", "message 9"]
+        assert messages[0][2]["room"] == "general" and messages[0][2]["username"] == "user1"
+        assert all(topic == f"{HISTORY_TOPIC}/reply/client" for topic, *_ in connection.published)
+        assert all(correlation == b"req-1" for *_, correlation in connection.published)
+        assert end[1] == b"" and "error" not in end[2]
+    finally:
+        history.close()
+
+
+def test_archiver_bounds_last(tmp_path):
+    history = make_history(tmp_path)
+    connection = FakeConnection()
+    archiver = ChatArchiver(connection, history, max_replay=4)
+    try:
+        archiver.on_message(None, None, request({"last": 100}))
+        assert len(connection.published) == 4 + 1
+        connection.published.clear()
+        # LIMIT -1 renverrait tout l'historique
+        archiver.on_message(None, None, request({"last": -1}))
+        assert [payload for _, payload, _, _ in connection.published] == [b""]
+    finally:
+        history.close()
+
+
+def test_archiver_rejects_invalid_requests(tmp_path):
+    history = make_history(tmp_path)
+    connection = FakeConnection()
+    archiver = ChatArchiver(connection, history)
+    try:
+        for payload in ({"last": "tout"}, {"last": 2.5}, {"since": "hier"}, {"room": ["a"]}, [1]):
+            connection.published.clear()
+            archiver.on_message(None, None, request(payload))
+            [(_, body, properties, correlation)] = connection.published
+            assert body == b"" and "error" in properties and correlation == b"req-1"
+    finally:
+        history.close()
@@ -0,0 +1,36 @@
+from coap_healthcheck import CoapTransport
+
+
+class FakeEngine:
+    def __init__(self):
+        self.received = []
+
+    def receive(self, transport, heartbeat, received_time):
+        self.received.append(heartbeat)
+
+    def receive_batch(self, transport, heartbeats, received_time):
+        self.received.extend(heartbeats)
+
+
+class BrokenClient:
+    def submit(self, code, path, payload=b""):
+        raise TimeoutError("Client CoAP non prêt")
+
+
+def test_vm_without_device_id_watches_the_anonymous_device_only():
+    transport = CoapTransport(device_id=None)
+    transport.engine = FakeEngine()
+    transport._on_heartbeat("", "anonyme", 0.0)
+    transport._on_heartbeat("capteur-1", "autre", 0.0)
+    transport._on_batch([("capteur-2", "autre"), ("", "lot")], 0.0)
+    assert transport.engine.received == ["anonyme", "lot"]
+
+
+def test_send_survives_client_errors():
+    from simulation import VirtualScheduler
+
+    transport = CoapTransport(device_id="capteur-1")
+    transport.engine = FakeEngine()
+    transport.engine.scheduler = VirtualScheduler()
+    transport.coap_client = BrokenClient()
+    assert transport.send(b"battement")
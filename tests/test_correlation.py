@@ -0,0 +1,85 @@
+from correlation import AlertCorrelator
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message, key=None):
+        self.sent.append((key, message))
+
+
+def fleet(correlator, broker="b:1883"):
+    for segment in ("a", "b"):
+        for n in range(5):
+            correlator.register(f"{segment}-{n}", broker, "mqtt")
+
+
+def test_segment_outage_is_not_a_broker_outage():
+    alerts = Recorder()
+    correlator = AlertCorrelator(alerts, window=1.0, min_devices=3, segment_separator="-", verbose=False)
+    fleet(correlator)
+    for n in range(5):
+        correlator.failed(f"a-{n}", "down", now=0.0)
+    correlator.flush(now=1.0)
+    assert len(alerts.sent) == 1
+    assert "segment réseau a" in alerts.sent[0][1]
+
+
+def test_whole_broker_outage():
+    alerts = Recorder()
+    correlator = AlertCorrelator(alerts, window=1.0, min_devices=3, segment_separator="-", verbose=False)
+    fleet(correlator)
+    for segment in ("a", "b"):
+        for n in range(5):
+            correlator.failed(f"{segment}-{n}", "down", now=0.0)
+    correlator.flush(now=1.0)
+    assert len(alerts.sent) == 1
+    assert "broker b:1883" in alerts.sent[0][1]
+
+
+def test_connected_broker_is_never_blamed():
+    alerts = Recorder()
+    correlator = AlertCorrelator(alerts, window=1.0, min_devices=3, verbose=False)
+    for n in range(4):
+        correlator.register(f"d{n}", "b:1883", None)
+    correlator.broker_connected("b:1883", True)
+    for n in range(4):
+        correlator.failed(f"d{n}", f"down d{n}", now=0.0)
+    correlator.flush(now=1.0)
+    assert sorted(message for _, message in alerts.sent) == ["down d0", "down d1", "down d2", "down d3"]
+
+
+def test_repeated_incidents_use_new_keys():
+    alerts = Recorder()
+    correlator = AlertCorrelator(alerts, window=1.0, min_devices=3, segment_separator="-", verbose=False)
+    fleet(correlator)
+    for start in (0.0, 10.0):
+        for n in range(5):
+            correlator.failed(f"a-{n}", "down", now=start)
+        correlator.flush(now=start + 1)
+        for n in range(5):
+            correlator.recovered(f"a-{n}", now=start + 2)
+        correlator.flush(now=start + 3)
+    assert len(alerts.sent) == 4
+    assert len({key for key, _ in alerts.sent}) == 4
+
+
+def test_forgotten_devices_leave_their_groups():
+    alerts = Recorder()
+    correlator = AlertCorrelator(alerts, window=1.0, min_devices=3, segment_separator="-", verbose=False)
+    fleet(correlator)
+    for n in range(5):
+        correlator.failed(f"a-{n}", "down", now=0.0)
+    correlator.flush(now=1.0)
+    for n in range(5):
+        correlator.forget(f"a-{n}")
+    assert correlator.summary() == "0 appareils en panne, 0 incident(s) ouvert(s)"
+    assert correlator._groups[("broker", "b:1883")] == [5, 0]
+
+    # Revenus avec un worker neuf : déclarés de nouveau, sans rétablissement fantôme
+    for n in range(5):
+        correlator.register(f"a-{n}", "b:1883", "mqtt")
+        correlator.recovered(f"a-{n}", now=2.0)
+    correlator.flush(now=5.0)
+    assert len(alerts.sent) == 1
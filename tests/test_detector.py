@@ -0,0 +1,28 @@
+from detector import PhiAccrualDetector, TimeoutDetector
+
+
+def test_phi_expires_at_its_deadline():
+    detector = PhiAccrualDetector(1.0)
+    for now in range(10):
+        detector.heartbeat(float(now))
+    deadline = detector.deadline()
+    assert detector.is_available(deadline - 1e-6)
+    assert not detector.is_available(deadline)
+    assert detector.phi(deadline) >= detector.threshold - 1e-6
+
+
+def test_timeout_expires_at_its_deadline():
+    detector = TimeoutDetector(1.0)
+    detector.heartbeat(0.0)
+    assert detector.is_available(detector.deadline() - 1e-6)
+    assert not detector.is_available(detector.deadline())
+
+
+def test_phi_replay_terminates():
+    from simulation import Replay, synthesize
+
+    # Trente secondes de silence au milieu de la trace : le détecteur doit expirer une fois, pas boucler
+    events = [event for event in synthesize(3, duration=120, interval=1.0) if not 60 <= event[0] < 90]
+    result = Replay(events, interval=1.0, detector="phi").run()
+    assert result.devices == 3
+    assert result.alerts
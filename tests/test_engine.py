@@ -0,0 +1,73 @@
+from engine import HealthcheckEngine, LoopbackTransport
+from simulation import VirtualScheduler
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message, key=None):
+        self.sent.append((key, message))
+
+
+class FlakyTransport(LoopbackTransport):
+    """Boucle locale dont on peut couper le « broker »."""
+
+    up = True
+
+    def available(self):
+        return self.up
+
+    def send(self, payload):
+        if not self.up:
+            return False
+        return super().send(payload)
+
+
+def test_broker_outage_alerts_once_then_recovers():
+    scheduler = VirtualScheduler()
+    iot_side, vm_side = FlakyTransport.pair(delay=0.01)
+    alerts = Recorder()
+    iot = HealthcheckEngine("iot", [iot_side], interval=1.0, scheduler=scheduler, alerts=alerts, verbose=False)
+    vm = HealthcheckEngine("vm", [vm_side], interval=1.0, scheduler=scheduler, verbose=False)
+    vm.start()
+    iot.start()
+    scheduler.run_until(10.0)
+    assert alerts.sent == []
+
+    iot_side.up = vm_side.up = False
+    scheduler.run_until(100.0)
+    assert len(alerts.sent) == 1
+    assert "injoignable" in alerts.sent[0][1]
+
+    iot_side.up = vm_side.up = True
+    scheduler.run_until(110.0)
+    assert len(alerts.sent) == 2
+    assert "Rétablissement" in alerts.sent[1][1]
+
+    # Seconde coupure peu après : clés différentes, rien n'est écarté comme doublon
+    iot_side.up = vm_side.up = False
+    scheduler.run_until(200.0)
+    iot_side.up = vm_side.up = True
+    scheduler.run_until(210.0)
+    assert len(alerts.sent) == 4
+    assert len({key for key, _ in alerts.sent}) == 4
+
+
+class LogRecorder:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, message, **fields):
+        self.lines.append(message)
+
+
+def test_queued_heartbeats_are_not_logged_as_sent():
+    scheduler = VirtualScheduler()
+    iot_side, vm_side = FlakyTransport.pair()
+    log = LogRecorder()
+    iot = HealthcheckEngine("iot", [iot_side], interval=1.0, scheduler=scheduler, log_writer=log, verbose=False)
+    iot_side.up = False
+    iot.start()
+    scheduler.run_until(2.5)
+    assert log.lines == ["QUEUED: [from: iot] #1", "QUEUED: [from: iot] #2", "QUEUED: [from: iot] #3"]
@@ -0,0 +1,29 @@
+import threading
+
+import paho.mqtt.client as mqtt
+
+
+def test_qos2_delivery(start_broker):
+    broker = start_broker()
+    received = threading.Event()
+    subscribed = threading.Event()
+
+    subscriber = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="sub")
+    subscriber.on_subscribe = lambda *args: subscribed.set()
+    subscriber.on_message = lambda client, userdata, msg: received.set()
+    subscriber.connect("127.0.0.1", broker.port)
+    subscriber.subscribe("qos2/test", qos=2)
+    subscriber.loop_start()
+    try:
+        assert subscribed.wait(5)
+        publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="pub")
+        publisher.connect("127.0.0.1", broker.port)
+        publisher.loop_start()
+        publisher.publish("qos2/test", b"ping", qos=2).wait_for_publish(5)
+        publisher.loop_stop()
+        publisher.disconnect()
+        # L'abonné ne remet un message QoS 2 qu'une fois le PUBREL du broker reçu
+        assert received.wait(5)
+    finally:
+        subscriber.loop_stop()
+        subscriber.disconnect()
@@ -0,0 +1,6 @@
+import peerstate
+
+
+def test_concurrent_writes_and_snapshots():
+    writes, snapshots = peerstate.stress(threads=4, readers=2, seconds=0.5)
+    assert writes > 0 and snapshots > 0
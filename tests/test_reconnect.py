@@ -0,0 +1,53 @@
+import threading
+import time
+
+from healthcheck import HealthcheckPeer
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message, key=None):
+        self.sent.append((key, message))
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_broker_restart_delivers_queued_heartbeats(start_broker):
+    broker = start_broker()
+    vm_alerts, iot_alerts = Recorder(), Recorder()
+    options = dict(broker="127.0.0.1", port=broker.port, topic="test/restart", interval=0.5, qos=1, verbose=False)
+    vm = HealthcheckPeer("vm", client_id="restart-vm", alerts=vm_alerts, **options)
+    iot = HealthcheckPeer("iot", client_id="restart-iot", alerts=iot_alerts, **options)
+    threads = []
+    try:
+        for peer in (vm, iot):
+            threads.append(threading.Thread(target=peer.run, daemon=True))
+            threads[-1].start()
+            assert wait_for(lambda: peer.mqtt.connection is not None and peer.connection.connected)
+        assert wait_for(lambda: (vm.window.highest or 0) >= 3)
+
+        # La VM se reconnecte la première (1 s contre 2 s) : elle est réabonnée quand l'IoT vide sa file
+        iot.connection.client.reconnect_delay_set(2, 4)
+        broker.stop()
+        time.sleep(0.3)
+        broker.start()
+
+        assert wait_for(lambda: iot.connection.connected and iot.connection.queued > 0)
+        flushed = iot.sequence
+        assert wait_for(lambda: vm.window.highest >= flushed + 2)
+        assert vm.window.lost == 0 and vm.window.missing() == 0
+        assert vm_alerts.sent == [] and iot_alerts.sent == []
+    finally:
+        for peer in (iot, vm):
+            peer.stop()
+        for thread in threads:
+            thread.join(5)
@@ -0,0 +1,59 @@
+from sequence import DUPLICATE, NEW, REORDERED, RESTARTED, SequenceWindow
+
+
+def test_duplicates_and_reordering():
+    window = SequenceWindow()
+    assert [window.add(seq) for seq in (1, 2, 4, 3, 3)] == [NEW, NEW, NEW, REORDERED, DUPLICATE]
+    assert window.duplicates == 1
+    assert window.reordered == 1
+
+
+def test_restart_at_one():
+    window = SequenceWindow()
+    for seq in range(1, 41):
+        window.add(seq)
+    assert window.add(1) is RESTARTED
+    assert [window.add(seq) for seq in range(2, 11)] == [NEW] * 9
+    assert window.restarts == 1
+    assert window.duplicates == 0
+    assert window.received == 50
+    assert window.loss_rate() == 0.0
+
+
+def test_restart_far_below_window():
+    window = SequenceWindow(size=64)
+    for seq in range(100, 300):
+        window.add(seq)
+    assert window.add(5) is RESTARTED
+    assert window.add(6) is NEW
+
+
+def test_restart_from_peer_timestamp():
+    window = SequenceWindow()
+    for seq in range(1, 41):
+        window.add(seq, timestamp=10_000 + seq)
+    # Redémarrage avant que l'appareil n'ait relu son dernier numéro (reprise à 38) : horloge repartie de zéro
+    assert window.add(38, timestamp=5) is RESTARTED
+    assert window.add(39, timestamp=6) is NEW
+    # Un vrai doublon garde l'horodatage d'origine
+    assert window.add(39, timestamp=6) is DUPLICATE
+
+
+def test_lost_heartbeats_survive_restart():
+    window = SequenceWindow()
+    for seq in (1, 2, 4):
+        window.add(seq)
+    window.add(1)  # Redémarrage : le 3 de la session précédente ne viendra plus
+    assert window.lost == 1
+    assert window.loss_rate() == 1 / 5
+
+
+def test_late_copy_of_first_heartbeat_is_not_a_restart():
+    window = SequenceWindow()
+    window.add(1, timestamp=100)
+    window.add(2, timestamp=200)
+    # Redélivrance QoS 1 du premier battement : même horodatage, donc doublon
+    assert window.add(1, timestamp=100) is DUPLICATE
+    assert window.add(3, timestamp=300) is NEW
+    assert window.restarts == 0
+    assert window.loss_rate() == 0.0
@@ -0,0 +1,37 @@
+from supervisor import Supervisor
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message, key=None):
+        self.sent.append((key, message))
+
+
+class FakeConnection:
+    broker = "broker"
+    port = 1883
+    connected = False
+
+    def subscribe(self, topic, qos=0, no_local=False):
+        pass
+
+    def reconnect_grace(self):
+        return 1.0
+
+
+def test_broker_unreachable_alerts_once_then_recovers():
+    alerts = Recorder()
+    supervisor = Supervisor(FakeConnection(), timeout=10.0, alerts=alerts)
+    supervisor.connection_changed(True, 0.0)
+    supervisor.connection_changed(False, 5.0)
+    for now in range(5, 60):
+        supervisor.check_broker(float(now))
+    assert len(alerts.sent) == 1
+    assert "injoignable" in alerts.sent[0][1]
+
+    supervisor.connection_changed(True, 60.0)
+    assert len(alerts.sent) == 2
+    assert "de nouveau joignable" in alerts.sent[1][1]
+    assert alerts.sent[0][0] != alerts.sent[1][0]
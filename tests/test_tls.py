@@ -0,0 +1,31 @@
+import os
+import time
+
+from connection import MqttConnection
+
+CA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_ca.pem")
+
+
+def connect(port, client_id):
+    connection = MqttConnection(client_id, "localhost", port, tls=True, ca_certs=CA, verbose=False)
+    connection.start()
+    deadline = time.monotonic() + 5
+    while not connection.connected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert connection.connected
+    return connection
+
+
+def test_second_connection_resumes_the_tls_session(start_broker):
+    broker = start_broker("--certfile", "test_server.pem", "--keyfile", "test_server.key")
+    first = connect(broker.port, "tls-first")
+    try:
+        assert first.client.resumed is False
+    finally:
+        first.close()
+    second = connect(broker.port, "tls-second")
+    try:
+        assert second.client.resumed is True
+        assert "tls" in second.timing
+    finally:
+        second.close()